@@ -0,0 +1,78 @@
+### Description: Compares writing detections one row at a time (one insert
+### call per feature, like the old GeoJSONtoESRI.InsertData) with the chunked
+### BulkWriter.GeoPackageWriter.  Both write the same synthetic detections to a
+### GeoPackage in a temporary folder and report rows per second, so the writer
+### can be timed without ArcGIS.
+###
+### Usage: python BenchmarkBulkWriter.py [number of rows]
+###
+### Runs without arcpy under Python 2.7 or 3 (needs NumPy).
+
+###
+### import modules
+###
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ScriptFolder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Script')
+sys.path.insert(0, ScriptFolder)
+import BulkWriter
+
+###
+### Parameters
+###
+
+DefaultRows = 1000000
+Fields = [('Key', 'TEXT'), ('Value', 'DOUBLE')]
+
+###
+### Script Follows
+###
+
+def main(RowCount):
+    Rows = SyntheticRows(RowCount)
+    Folder = tempfile.mkdtemp()
+    try:
+        print('%-12s %12s %12s' % ('Writer', 'Rows', 'Rows/sec'))
+        for Name, Function in (('row', WriteRowByRow), ('bulk', WriteBulk)):
+            Start = time.time()
+            Function(os.path.join(Folder, Name + '.gpkg'), Rows)
+            Elapsed = time.time() - Start
+            print('%-12s %12d %12.0f' % (Name, RowCount, RowCount / Elapsed))
+    finally:
+        shutil.rmtree(Folder)
+
+def SyntheticRows(RowCount):
+    '''
+    Returns rows shaped like the GeoJSON reader output: a 22 character key,
+    an object class value and longitude/latitude around San Francisco.
+    '''
+    Random = random.Random(0)
+    Letters = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+    return [(''.join(Random.choice(Letters) for Character in range(22)), Random.random(),
+             [-122.5 + Random.random() * 0.15, 37.7 + Random.random() * 0.1]) for Row in range(RowCount)]
+
+def WriteRowByRow(Path, Rows):
+    '''
+    Writes the rows with one execute call per row, the way an insert cursor is
+    driven one feature at a time.
+    '''
+    Writer = BulkWriter.GeoPackageWriter(Path, 'Photos', Fields)
+    for Row in Rows:
+        Writer.WriteChunk(BulkWriter.MakeChunk([Row], Writer.Fields))
+    Writer.Close()
+
+def WriteBulk(Path, Rows):
+    '''
+    Writes the rows in chunks through the bulk writer.
+    '''
+    with BulkWriter.GeoPackageWriter(Path, 'Photos', Fields) as Writer:
+        Writer.WriteRows(Rows)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DefaultRows)
@@ -0,0 +1,108 @@
+### Description: Compares the old GeoJSONtoESRI.ExtractData (json.load and a
+### nested list of every feature) with the incremental GeoJSONReader on a
+### Mapillary export.  Each path runs in its own Python process so the peak
+### resident memory of one does not hide the other.  Reports features per
+### second and peak RSS for both paths.
+###
+### Usage: python BenchmarkGeoJSONReader.py [GeoJSON path] [object class key]
+###
+### Runs without arcpy under Python 2.7 or 3.
+
+###
+### import modules
+###
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+ScriptFolder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Script')
+sys.path.insert(0, ScriptFolder)
+import GeoJSONReader
+
+###
+### Parameters
+###
+
+DefaultPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Data',
+                           'Mapillary GeoJSON', 'sf_bike_lanes.geojson')
+DefaultKey = 'construction--flat--bike-lane'
+Repeats = 3
+
+###
+### Script Follows
+###
+
+def main(FilePath, ObjectKey):
+    print('File: %s (%.1f MB)' % (FilePath, os.path.getsize(FilePath) / 1048576.0))
+    print('%-12s %12s %14s %14s' % ('Path', 'Features', 'Features/sec', 'Peak RSS (MB)'))
+    for PathName in ('json.load', 'incremental'):
+        Output = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                                          '--child', PathName, FilePath, ObjectKey])
+        Result = json.loads(Output.decode('utf-8').strip().splitlines()[-1])
+        PeakRSS = Result['PeakRSS']
+        print('%-12s %12d %14.0f %14s' % (PathName, Result['Features'], Result['FeaturesPerSecond'],
+                                          '%.1f' % (PeakRSS / 1048576.0) if PeakRSS else 'n/a'))
+
+def ExtractDataLegacy(FilePath, ObjectKey):
+    '''
+    The ExtractData function as it was before the incremental reader.
+    '''
+    DataTransferList = []
+    with open(FilePath) as RawData:
+        DataDictionary = json.load(RawData)
+
+    for Row in DataDictionary['features']:
+        DataTransferList.append([Row['properties']['key'], Row['properties'][ObjectKey], Row['geometry']['coordinates']])
+    return DataTransferList
+
+def ExtractDataIncremental(FilePath, ObjectKey):
+    '''
+    Consumes the incremental reader the way InsertData does, one row at a time.
+    '''
+    Count = 0
+    for Row in GeoJSONReader.ExtractFeatures(FilePath, ObjectKey):
+        Count += 1
+    return Count
+
+def PeakRSS():
+    '''
+    Returns the peak resident memory of this process in bytes, or None when
+    it cannot be measured on this platform.
+    '''
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset
+        except (ImportError, AttributeError):
+            return None
+    Peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    if sys.platform == 'darwin':
+        return Peak
+    return Peak * 1024
+
+def RunChild(PathName, FilePath, ObjectKey):
+    Best = None
+    for Repeat in range(Repeats):
+        Start = time.time()
+        if PathName == 'json.load':
+            Features = len(ExtractDataLegacy(FilePath, ObjectKey))
+        else:
+            Features = ExtractDataIncremental(FilePath, ObjectKey)
+        Elapsed = time.time() - Start
+        if Best is None or Elapsed < Best:
+            Best = Elapsed
+    print(json.dumps({'Features': Features, 'FeaturesPerSecond': Features / max(Best, 1e-9),
+                      'PeakRSS': PeakRSS()}))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        RunChild(sys.argv[2], sys.argv[3], sys.argv[4])
+    else:
+        main(sys.argv[1] if len(sys.argv) > 1 else DefaultPath,
+             sys.argv[2] if len(sys.argv) > 2 else DefaultKey)
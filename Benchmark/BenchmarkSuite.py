@@ -0,0 +1,376 @@
+### Description: Times the hot paths of the tools on synthetic city-scale
+### datasets (see Synthetic.py) and compares the results with stored
+### baselines so regressions show up.  Each path runs against the arcpy-free
+### code the tools use, or a stand-in for the arcpy part:
+###     extract    GeoJSONtoESRI.ExtractData - GeoJSONReader.ExtractFeatures
+###     write      GeoJSONtoESRI.InsertData - BulkWriter.GeoPackageWriter
+###     distance   Distance.CalculateShortestDistance to known points
+###     segments   Distance.CalculateShortestDistance to known lines
+###     writeback  Distance.InsertDistanceValues - WriteBack on a SQLite table
+###     heatmap    SpatiallyAnalyzePhotos NUMPY heat map - KernelDensity
+###     ranking    SpatiallyAnalyzePhotos ARRAY ranking - PriorityGrid.RankGrid
+###     cluster    GeoJSONtoESRI.InsertClustered - DetectionClusters
+### The known datasets have a tenth as many features as there are photos.
+###
+### Every case and size runs in its own Python process so the peak memory of
+### one run does not hide the next.  The rows per second (the best of the
+### repeats), peak memory and memory growth during the run are printed for
+### each size (the throughput and memory curves).  Under Python 3 the growth
+### is the peak of the memory allocated by the run, traced with tracemalloc
+### in an extra untimed run, otherwise it is the growth of the peak resident
+### memory.  The results can be saved as JSON and are compared with
+### Baselines.json: a case is a regression when its rows per second fall, or
+### its memory growth rises, by more than the tolerance.  Baselines depend on
+### the machine, save new ones with --save-baseline before comparing changes.
+###
+### Usage: python BenchmarkSuite.py [--sizes 10000,100000] [--cases extract,distance]
+###        [--data folder] [--repeats 3] [--tolerance 0.4] [--output results.json]
+###        [--baseline Baselines.json] [--save-baseline]
+### Sizes from 10000 to 5000000 photos; GeoJSON files are kept in the data
+### folder (about 1.3 KB per photo) and reused by later runs.  Exits with
+### status 1 when a regression is found.
+###
+### Baselines.json holds 10000, 100000 and 1000000 photos.  The default sizes
+### are the two small ones so a check is quick; run --sizes 1000000 for a
+### city-scale export (a 1.3 GB GeoJSON file, about a minute of runs after
+### it is written).  5000000 photos has no baseline: its GeoJSON file is
+### 6.5 GB and the writeback case alone peaks near 5 GB (1 GB at 1000000),
+### more than the machine the baselines were made on has.
+###
+### Runs without arcpy under Python 2.7 or 3 (needs NumPy).
+
+###
+### import modules
+###
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import numpy as np
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+BenchmarkFolder = os.path.dirname(os.path.abspath(__file__))
+ScriptFolder = os.path.join(BenchmarkFolder, '..', 'Script')
+sys.path.insert(0, ScriptFolder)
+import BulkWriter
+import DetectionClusters
+import GeoJSONReader
+import Instrumentation
+import KernelDensity
+import PriorityGrid
+import SpatialIndex
+import Synthetic
+import WriteBack
+
+###
+### Parameters
+###
+
+DefaultSizes = [10000, 100000]
+DefaultData = os.path.join(tempfile.gettempdir(), 'MapillaryBenchmark')
+DefaultBaseline = os.path.join(BenchmarkFolder, 'Baselines.json')
+DefaultTolerance = 0.4
+# Memory growth below this many bytes is not compared, it is mostly noise
+MemorySlack = 16 * 1048576
+# Short cases are repeated until they have run for this many seconds (at most MaxRepeats times)
+MinimumSeconds = 1.0
+MaxRepeats = 50
+ObjectKey = 'object--bench'
+# Values used by the tools
+BufferDistance = 50.0
+GridCellMeters = 804.672
+HeatMapCellSize = 100
+HeatMapRadius = 400
+# Radius in metres and score of the sightings clustered, about a third of the photos
+ClusterRadius = 10.0
+ClusterScore = 0.2
+
+###
+### Script Follows
+###
+
+
+def main(Arguments):
+    Sizes = [int(Size) for Size in Arguments.sizes.split(',')]
+    Cases = Arguments.cases.split(',') if Arguments.cases else list(CaseOrder)
+    for Case in Cases:
+        if Case not in CaseFunctions:
+            raise SystemExit('Unknown case %s, the cases are %s' % (Case, ', '.join(CaseOrder)))
+    Baseline = ReadBaseline(Arguments.baseline)
+    Results = []
+    Regressions = []
+    print('%-10s %9s %12s %9s %14s %16s  %s' % ('Case', 'Size', 'Rows/sec', 'Seconds', 'Peak RSS (MB)',
+                                               'Growth (MB)', 'Baseline'))
+    for Case in Cases:
+        for Size in Sizes:
+            Result = RunCase(Case, Size, Arguments.data, Arguments.repeats)
+            Previous = Baseline.get(ResultKey(Result))
+            Problems = Compare(Result, Previous, Arguments.tolerance)
+            Regressions.extend(Problems)
+            print('%-10s %9d %12.0f %9.3f %14s %16s  %s' % (
+                Case, Size, Result['RowsPerSecond'], Result['Seconds'], Megabytes(Result['PeakMemory']),
+                Megabytes(Result['MemoryGrowth']), BaselineNote(Result, Previous, Problems)))
+            Results.append(Result)
+    Report = {'Machine': MachineDescription(), 'Results': Results}
+    if Arguments.output:
+        with open(Arguments.output, 'w') as OutFile:
+            json.dump(Report, OutFile, indent=1, sort_keys=True)
+    if Arguments.save_baseline:
+        SaveBaseline(Arguments.baseline, Report)
+        print('Saved the baseline to ' + Arguments.baseline)
+    elif Regressions:
+        print('\n'.join(['Regressions:'] + Regressions))
+        return 1
+    return 0
+
+
+def RunCase(Case, Size, DataFolder, Repeats):
+    '''
+    Runs one case at one size in a new Python process and returns its result.
+    The GeoJSON is written here first so writing it is not part of the run.
+    '''
+    if Case == 'extract':
+        Synthetic.FeatureCollectionPath(DataFolder, Size)
+    Output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child', Case,
+                                      str(Size), DataFolder, str(Repeats)])
+    return json.loads(Output.decode('utf-8').strip().splitlines()[-1])
+
+
+def RunChild(Case, Size, DataFolder, Repeats):
+    '''
+    Prepares the inputs of a case, times its best of Repeats runs (or more
+    for short cases) and prints the result as JSON.
+    '''
+    Setup, Run = CaseFunctions[Case]
+    Inputs = Setup(Size, DataFolder)
+    Best = None
+    Growth = None
+    Total = 0.0
+    Repeat = 0
+    while Repeat < Repeats or (Total < MinimumSeconds and Repeat < MaxRepeats):
+        Timer = Instrumentation.StageTimer(None, Case)
+        Timer.Start()
+        Rows = Run(Inputs)
+        Record = Timer.Stop()
+        if Best is None or Record['Wall'] < Best:
+            Best = Record['Wall']
+        if Growth is None:
+            Growth = Record['MemoryGrowth']
+        Total += Record['Wall']
+        Repeat += 1
+    if tracemalloc is not None:
+        tracemalloc.start()
+        Run(Inputs)
+        Growth = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    print(json.dumps({'Case': Case, 'Size': Size, 'Rows': Rows, 'Seconds': Best,
+                      'RowsPerSecond': Rows / max(Best, 1e-9), 'PeakMemory': Instrumentation.PeakMemory(),
+                      'MemoryGrowth': Growth}))
+
+
+def ResultKey(Result):
+    return '%s/%d' % (Result['Case'], Result['Size'])
+
+
+def Compare(Result, Previous, Tolerance):
+    '''
+    Returns a list of messages describing how a result is worse than its
+    baseline, empty when it is not (or there is no baseline).
+    '''
+    if Previous is None:
+        return []
+    Problems = []
+    Key = ResultKey(Result)
+    if Result['RowsPerSecond'] < Previous['RowsPerSecond'] * (1 - Tolerance):
+        Problems.append('%s: %.0f rows/sec, baseline %.0f' % (Key, Result['RowsPerSecond'], Previous['RowsPerSecond']))
+    if Result['MemoryGrowth'] is not None and Previous.get('MemoryGrowth') is not None:
+        Limit = max(Previous['MemoryGrowth'] * (1 + Tolerance), Previous['MemoryGrowth'] + MemorySlack)
+        if Result['MemoryGrowth'] > Limit:
+            Problems.append('%s: memory grew %s MB, baseline %s MB' % (Key, Megabytes(Result['MemoryGrowth']),
+                                                                       Megabytes(Previous['MemoryGrowth'])))
+    return Problems
+
+
+def BaselineNote(Result, Previous, Problems):
+    if Previous is None:
+        return 'none'
+    if Problems:
+        return 'REGRESSION'
+    return '%+.0f%%' % (100.0 * (Result['RowsPerSecond'] / Previous['RowsPerSecond'] - 1))
+
+
+def ReadBaseline(Path):
+    '''
+    Returns the baseline results by case and size, empty when there is no
+    baseline file.
+    '''
+    if not os.path.exists(Path):
+        return {}
+    with open(Path) as BaselineFile:
+        return dict((ResultKey(Result), Result) for Result in json.load(BaselineFile)['Results'])
+
+
+def SaveBaseline(Path, Report):
+    '''
+    Adds the results to the baseline file, replacing earlier results for the
+    same case and size and keeping the others.
+    '''
+    Results = ReadBaseline(Path)
+    Results.update((ResultKey(Result), Result) for Result in Report['Results'])
+    with open(Path, 'w') as BaselineFile:
+        json.dump({'Machine': Report['Machine'], 'Results': [Results[Key] for Key in sorted(Results)]},
+                  BaselineFile, indent=1, sort_keys=True)
+
+
+def MachineDescription():
+    return {'Platform': platform.platform(), 'Processor': platform.processor() or platform.machine(),
+            'Python': platform.python_version(), 'NumPy': np.__version__}
+
+
+def Megabytes(Bytes):
+    return 'n/a' if Bytes is None else '%.1f' % (Bytes / 1048576.0)
+
+
+###
+### Cases, each a setup function returning the inputs of the run function,
+### which returns the number of rows handled
+###
+
+
+def SetupExtract(Size, DataFolder):
+    return Synthetic.FeatureCollectionPath(DataFolder, Size)
+
+
+def RunExtract(Path):
+    Count = 0
+    for Row in GeoJSONReader.ExtractFeatures(Path, ObjectKey):
+        Count += 1
+    return Count
+
+
+def SetupWrite(Size, DataFolder):
+    Rows = []
+    for Keys, Values, Lon, Lat in Synthetic.Photos(Size):
+        Column = Values[:, [Name for Name, Frequency in Synthetic.ClassFrequencies].index(ObjectKey)]
+        Rows.extend(zip(Keys, Column.tolist(), zip(Lon.tolist(), Lat.tolist())))
+    return Rows
+
+
+def RunWrite(Rows):
+    Folder = tempfile.mkdtemp()
+    try:
+        with BulkWriter.GeoPackageWriter(os.path.join(Folder, 'Photos.gpkg'), 'Photos',
+                                         [('Key', 'TEXT'), ('Value', 'DOUBLE')]) as Writer:
+            Writer.WriteRows(Rows)
+        return Writer.Count
+    finally:
+        shutil.rmtree(Folder)
+
+
+def SetupDistance(Size, DataFolder):
+    KnownX, KnownY = Synthetic.KnownPoints(max(Size // 10, 1))
+    return Synthetic.PhotoPoints(Size), (KnownX, KnownY)
+
+
+def SetupSegments(Size, DataFolder):
+    return Synthetic.PhotoPoints(Size), Synthetic.KnownSegments(max(Size // 10, 1))
+
+
+def RunDistance(Inputs):
+    # Building the index is part of the run, as it is in the tool
+    (X, Y), Known = Inputs
+    if len(Known) == 2:
+        Index = SpatialIndex.NearestIndex(*Known)
+    else:
+        Index = SpatialIndex.NearestSegmentIndex(*Known)
+    Distances, IDs = Index.Query(X, Y)
+    return len(Distances)
+
+
+def SetupWriteBack(Size, DataFolder):
+    Random = np.random.RandomState(0)
+    Keys = Synthetic.PhotoKeys(Size, Random)
+    Connection = sqlite3.connect(':memory:')
+    Connection.execute('CREATE TABLE Photos (Key TEXT, Value REAL)')
+    Connection.executemany('INSERT INTO Photos VALUES (?, ?)', zip(Keys, Random.random_sample(Size).tolist()))
+    Connection.commit()
+    # The rows as CalculateShortestDistance leaves them: X, Y, key, distance, near FID
+    Rows = [[0.0, 0.0, Key, Distance, ID] for Key, Distance, ID in
+            zip(Keys, Random.random_sample(Size).tolist(), Random.randint(0, Size, Size).tolist())]
+    return Connection, Rows
+
+
+def RunWriteBack(Inputs):
+    Connection, Rows = Inputs
+    Table = WriteBack.SQLiteTable(Connection, 'Photos')
+    Table.AddFields([('Distance', "DOUBLE"), ('NearFID', "LONG")])
+    Lookup = WriteBack.IndexRows(Rows, 2, [3, 4])
+    return WriteBack.UpdateByKey(Table, "Key", ["Distance", "NearFID"], Lookup)
+
+
+def RunHeatMap(Inputs):
+    (X, Y), Known = Inputs
+    KernelDensity.DensityGrid(X, Y, HeatMapCellSize, HeatMapRadius, Oversample=3)
+    return len(X)
+
+
+def RunRanking(Inputs):
+    (X, Y), (KnownX, KnownY) = Inputs
+    PriorityGrid.RankGrid(X, Y, KnownX, KnownY, Synthetic.BoundaryRings(), GridCellMeters, BufferDistance)
+    return len(X)
+
+
+def SetupCluster(Size, DataFolder):
+    Random = np.random.RandomState(3)
+    X, Y = Synthetic.PhotoPoints(Size)
+    Scores = Random.random_sample(Size) * (Random.random_sample(Size) < 0.3)
+    return X, Y, Scores
+
+
+def RunCluster(Inputs):
+    X, Y, Scores = Inputs
+    Labels, Seeds = DetectionClusters.ClusterDetections(X, Y, Scores, ClusterRadius, ClusterScore)
+    DetectionClusters.ClusterSummary(Labels, Seeds, X, Y, Scores)
+    return len(X)
+
+
+CaseOrder = ['extract', 'write', 'distance', 'segments', 'writeback', 'heatmap', 'ranking', 'cluster']
+CaseFunctions = {'extract': (SetupExtract, RunExtract),
+                 'write': (SetupWrite, RunWrite),
+                 'distance': (SetupDistance, RunDistance),
+                 'segments': (SetupSegments, RunDistance),
+                 'writeback': (SetupWriteBack, RunWriteBack),
+                 'heatmap': (SetupDistance, RunHeatMap),
+                 'ranking': (SetupDistance, RunRanking),
+                 'cluster': (SetupCluster, RunCluster)}
+
+
+def ParseArguments():
+    Parser = argparse.ArgumentParser(description='Times the hot paths of the tools on synthetic datasets.')
+    Parser.add_argument('--sizes', default=','.join(str(Size) for Size in DefaultSizes),
+                        help='comma separated numbers of photos')
+    Parser.add_argument('--cases', default='', help='comma separated cases, all by default')
+    Parser.add_argument('--data', default=DefaultData, help='folder the synthetic GeoJSON files are kept in')
+    Parser.add_argument('--repeats', type=int, default=3, help='runs of each case, the fastest is kept')
+    Parser.add_argument('--tolerance', type=float, default=DefaultTolerance,
+                        help='share by which a result may be worse than the baseline')
+    Parser.add_argument('--baseline', default=DefaultBaseline, help='baseline file')
+    Parser.add_argument('--save-baseline', action='store_true', help='store the results as the baseline')
+    Parser.add_argument('--output', default='', help='JSON file for the results')
+    return Parser.parse_args()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        RunChild(sys.argv[2], int(sys.argv[3]), sys.argv[4], int(sys.argv[5]))
+    else:
+        sys.exit(main(ParseArguments()))
@@ -0,0 +1,186 @@
+### Description: A local stand-in for the Mapillary API, used to check and
+### time MapillaryIngest without the network.  It serves synthetic photos
+### (see Synthetic.py) from GET /v3/images?bbox=XMin,YMin,XMax,YMax&per_page=N
+### as GeoJSON pages linked with a Link: <...>; rel="next" header, like the
+### Mapillary v3 API.  Each response can be delayed, gzip compressed and sent
+### chunked, and a share of the requests can fail with 500 or be rate
+### limited with 429 so the retries are exercised.  Connections are kept
+### alive (HTTP/1.1) and counted, so connection pooling can be checked too.
+###
+### Usage: python MockMapillaryServer.py [--photos 100000] [--port 8765]
+###        [--latency 0.05] [--failure-rate 0.05]
+### then for example:
+###     python ../Script/MapillaryIngest.py "-122.52 37.70 -122.35 37.82" city.geojson
+###         --url http://localhost:8765/v3/images --cache ""
+### Serve() starts the server in a thread from another script.
+###
+### Needs Python 3.7 or later and NumPy, does not require arcpy.
+
+###
+### import modules
+###
+
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import Synthetic
+
+###
+### Script Follows
+###
+
+DefaultPort = 8765
+DefaultPhotos = 100000
+MaxPageSize = 1000
+
+
+class Photos(object):
+    '''
+    The synthetic photos served, held as arrays so a bounding box is found
+    without going through every photo in Python.
+    '''
+
+    def __init__(self, Count, Seed=0):
+        Blocks = list(Synthetic.Photos(Count, Seed))
+        self.Keys = [Key for Block in Blocks for Key in Block[0]]
+        self.Values = np.concatenate([Block[1] for Block in Blocks])
+        self.Lon = np.concatenate([Block[2] for Block in Blocks])
+        self.Lat = np.concatenate([Block[3] for Block in Blocks])
+
+    def InBox(self, XMin, YMin, XMax, YMax):
+        return np.flatnonzero((self.Lon >= XMin) & (self.Lon <= XMax) & (self.Lat >= YMin) & (self.Lat <= YMax))
+
+    def Feature(self, Index):
+        return Synthetic.Feature(self.Keys[Index], self.Values[Index], float(self.Lon[Index]), float(self.Lat[Index]))
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.Lock:
+            self.server.Counts['Connections'] += 1
+
+    def log_message(self, Format, *Arguments):
+        pass
+
+    def do_GET(self):
+        Server = self.server
+        Parts = urlsplit(self.path)
+        Query = dict((Name, Values[-1]) for Name, Values in parse_qs(Parts.query).items())
+        with Server.Lock:
+            Server.Counts['Requests'] += 1
+            Roll = Server.Random.random()
+        if Server.Latency:
+            time.sleep(Server.Latency)
+        if Parts.path != '/v3/images' or 'bbox' not in Query:
+            return self.Send(404, {'message': 'Not found'})
+        if Roll < Server.FailureRate / 2:
+            return self.Send(500, {'message': 'Internal error'})
+        if Roll < Server.FailureRate:
+            return self.Send(429, {'message': 'Too many requests'}, {'Retry-After': '0'})
+        Box = [float(Value) for Value in Query['bbox'].split(',')]
+        PageSize = min(int(Query.get('per_page', MaxPageSize)), MaxPageSize)
+        Page = int(Query.get('page', 0))
+        Found = Server.Photos.InBox(*Box)
+        Selected = Found[Page * PageSize:(Page + 1) * PageSize]
+        Headers = {}
+        if (Page + 1) * PageSize < len(Found):
+            Query['page'] = str(Page + 1)
+            Headers['Link'] = '<%s?%s>; rel="next"' % (Parts.path, urlencode(Query))
+        self.Send(200, {'type': 'FeatureCollection', 'features': [Server.Photos.Feature(Index) for Index in Selected]},
+                  Headers)
+
+    def Send(self, Status, Document, Headers=None):
+        Body = json.dumps(Document, separators=(',', ':')).encode('utf-8')
+        self.send_response(Status)
+        self.send_header('Content-Type', 'application/json')
+        if self.server.Compress and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            Body = gzip.compress(Body)
+            self.send_header('Content-Encoding', 'gzip')
+        for Name, Value in (Headers or {}).items():
+            self.send_header(Name, Value)
+        if self.server.Chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for Start in range(0, len(Body), 16384):
+                Chunk = Body[Start:Start + 16384]
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(Chunk), Chunk))
+            self.wfile.write(b'0\r\n\r\n')
+        else:
+            self.send_header('Content-Length', str(len(Body)))
+            self.end_headers()
+            self.wfile.write(Body)
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, Request, ClientAddress):
+        # Clients closing their connections (an ingestion stopped early) are not errors
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            ThreadingHTTPServer.handle_error(self, Request, ClientAddress)
+
+
+def Serve(PhotoCount=DefaultPhotos, Port=0, Latency=0.0, FailureRate=0.0, Compress=True, Chunked=False, Seed=0):
+    '''
+    Starts the mock server in a background thread and returns it.  Port 0
+    picks a free port, the address is in server.URL and the requests and
+    connections served are counted in server.Counts.  Call shutdown() to
+    stop it.
+    '''
+    Server = MockServer(('127.0.0.1', Port), Handler)
+    Server.Photos = Photos(PhotoCount, Seed)
+    Server.Latency = Latency
+    Server.FailureRate = FailureRate
+    Server.Compress = Compress
+    Server.Chunked = Chunked
+    Server.Random = random.Random(Seed)
+    Server.Lock = threading.Lock()
+    Server.Counts = {'Requests': 0, 'Connections': 0}
+    Server.URL = 'http://127.0.0.1:%d/v3/images' % Server.server_address[1]
+    Thread = threading.Thread(target=Server.serve_forever)
+    Thread.daemon = True
+    Thread.start()
+    return Server
+
+
+def main(Arguments):
+    Server = Serve(Arguments.photos, Arguments.port, Arguments.latency, Arguments.failure_rate,
+                   not Arguments.no_gzip, Arguments.chunked)
+    Lon, Lat = Server.Photos.Lon, Server.Photos.Lat
+    print('Serving %d photos at %s' % (Arguments.photos, Server.URL))
+    # Printed a little larger than the photos so rounding does not leave any out
+    print('Extent: "%.5f %.5f %.5f %.5f"' % (Lon.min() - 1e-5, Lat.min() - 1e-5, Lon.max() + 1e-5, Lat.max() + 1e-5))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        Server.shutdown()
+        print('%(Requests)d requests on %(Connections)d connections' % Server.Counts)
+
+
+def ParseArguments():
+    Parser = argparse.ArgumentParser(description='Serves synthetic photos like the Mapillary API.')
+    Parser.add_argument('--photos', type=int, default=DefaultPhotos, help='number of photos')
+    Parser.add_argument('--port', type=int, default=DefaultPort, help='port to listen on')
+    Parser.add_argument('--latency', type=float, default=0.0, help='seconds before each response')
+    Parser.add_argument('--failure-rate', type=float, default=0.0, help='share of requests that fail (500 or 429)')
+    Parser.add_argument('--no-gzip', action='store_true', help='never compress the responses')
+    Parser.add_argument('--chunked', action='store_true', help='send the responses chunked')
+    return Parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(ParseArguments())
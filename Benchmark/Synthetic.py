@@ -0,0 +1,219 @@
+### Description: Synthetic city-scale datasets for the benchmarks.  A city is
+### modelled as a street grid over an area the size of San Francisco (in WGS
+### 1984 UTM zone 10 metres).  Photos are taken along the streets, known
+### point features (benches, signs) stand beside them and known line features
+### (bike lanes) are pieces of the streets.  Mapillary-style FeatureCollections
+### carry a 22 character photo key and the object classes of a real export:
+### each class is present with the frequency it has in the sample
+### sf_bike_lanes.geojson (about 25 classes per photo) and the values of a
+### photo add up to a little less than 1.
+###
+### Every dataset is generated from a seed, so the same size and seed always
+### give the same data, and GeoJSON files are kept in a folder so they are
+### only written once.
+###
+### Runs without arcpy under Python 2.7 or 3 (needs NumPy).
+
+###
+### import modules
+###
+
+import json
+import os
+import sys
+import numpy as np
+
+ScriptFolder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Script')
+sys.path.insert(0, ScriptFolder)
+import Projection
+
+###
+### Parameters
+###
+
+# XMin, YMin, XMax, YMax of the city in UTM zone 10 metres (about San Francisco)
+CityExtent = (543000.0, 4173000.0, 557000.0, 4185000.0)
+CityZone = 10
+# Distance between the streets of the grid in metres
+BlockLength = 120.0
+# Standard deviation of the GPS error of a photo in metres
+PhotoJitter = 4.0
+# Distance of the known point features from the centre of the street in metres
+KnownOffset = 8.0
+# Number of features generated and written at a time
+BlockSize = 10000
+KeyCharacters = np.frombuffer(b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_', dtype=np.uint8)
+# Object classes and the share of photos they are found in, from sf_bike_lanes.geojson
+# (the bike lane class is found in every photo of that export, here in about a third)
+ClassFrequencies = [
+    ('construction--flat--road', 1.0), ('construction--flat--bike-lane', 0.3), ('nature--sky', 0.997),
+    ('nature--vegetation', 0.995), ('construction--structure--building', 0.994),
+    ('construction--flat--sidewalk', 0.987), ('object--vehicle--car', 0.982), ('construction--barrier--curb', 0.976),
+    ('object--support--pole', 0.948), ('marking--continuous--solid', 0.941),
+    ('marking--discrete--other-marking', 0.916), ('object--billboard', 0.869), ('human--person', 0.789),
+    ('object--traffic-sign--front', 0.736), ('object--street-light', 0.729), ('object--wire-group', 0.66),
+    ('void--static', 0.652), ('construction--barrier--fence', 0.616), ('marking--continuous--dashed', 0.575),
+    ('marking--discrete--crosswalk-zebra', 0.48), ('construction--flat--parking', 0.479),
+    ('object--trash-can', 0.38), ('construction--barrier--wall', 0.374), ('object--manhole', 0.368),
+    ('object--support--utility-pole', 0.356), ('object--vehicle--bicycle', 0.339), ('marking--discrete--text', 0.33),
+    ('object--traffic-light--general-upright-front', 0.314), ('object--banner', 0.305),
+    ('construction--flat--curb-cut', 0.303), ('void--dynamic', 0.275), ('human--rider--bicyclist', 0.266),
+    ('object--vehicle--truck', 0.262), ('void--ground', 0.251), ('void--ego-vehicle', 0.247),
+    ('object--vehicle--bus', 0.244), ('object--traffic-light--pedestrians', 0.231),
+    ('object--traffic-sign--direction-front', 0.222), ('construction--flat--traffic-island', 0.218),
+    ('nature--terrain', 0.213), ('construction--flat--pedestrian-area', 0.195),
+    ('construction--flat--rail-track', 0.156), ('object--traffic-sign--back', 0.148),
+    ('object--junction-box', 0.147), ('object--vehicle--motorcycle', 0.139),
+    ('object--traffic-light--general-upright-side', 0.132), ('construction--barrier--other-barrier', 0.12),
+    ('marking--discrete--stop-line', 0.108), ('object--catch-basin', 0.099), ('nature--mountain', 0.088),
+    ('object--vehicle--other-vehicle', 0.076), ('object--traffic-cone', 0.071),
+    ('construction--structure--bridge', 0.069), ('object--traffic-sign--information-parking', 0.057),
+    ('object--vehicle--on-rails', 0.05), ('object--fire-hydrant', 0.045),
+    ('object--traffic-light--general-upright-back', 0.043), ('void--car-mount', 0.039), ('object--bench', 0.038),
+    ('object--traffic-sign--temporary-front', 0.035), ('construction--barrier--guard-rail', 0.027),
+    ('object--traffic-light--general-horizontal-front', 0.025), ('object--parking-meter', 0.023),
+    ('human--rider--motorcyclist', 0.021), ('object--vehicle--wheeled-slow', 0.017), ('object--bike-rack', 0.017),
+    ('construction--flat--crosswalk-plain', 0.015), ('nature--snow', 0.015),
+    ('construction--structure--garage', 0.015), ('object--support--traffic-sign-frame', 0.015),
+    ('object--vehicle--trailer', 0.015), ('object--traffic-sign--direction-back', 0.011), ('nature--water', 0.01)]
+
+###
+### Script Follows
+###
+
+def StreetSegments(Extent=CityExtent, Spacing=BlockLength):
+    '''
+    Returns the X0, Y0, X1, Y1 arrays of the street grid, one segment per
+    block side.  The grid is the same for every seed.
+    '''
+    XMin, YMin, XMax, YMax = Extent
+    Xs = np.arange(XMin, XMax + Spacing / 2.0, Spacing)
+    Ys = np.arange(YMin, YMax + Spacing / 2.0, Spacing)
+    # Segments along the east-west streets, then along the north-south streets
+    EastX0, EastY0 = np.meshgrid(Xs[:-1], Ys)
+    NorthX0, NorthY0 = np.meshgrid(Xs, Ys[:-1])
+    X0 = np.concatenate([EastX0.ravel(), NorthX0.ravel()])
+    Y0 = np.concatenate([EastY0.ravel(), NorthY0.ravel()])
+    X1 = np.concatenate([EastX0.ravel() + Spacing, NorthX0.ravel()])
+    Y1 = np.concatenate([EastY0.ravel(), NorthY0.ravel() + Spacing])
+    return X0, Y0, X1, Y1
+
+def PointsAlongStreets(Count, Random, Offset=0.0, Jitter=0.0):
+    '''
+    Returns the X and Y arrays of points at random places along the streets,
+    moved sideways by Offset metres (to either side) and by a random error.
+    '''
+    X0, Y0, X1, Y1 = StreetSegments()
+    Segment = Random.randint(0, len(X0), Count)
+    Along = Random.random_sample(Count)
+    DX, DY = (X1 - X0)[Segment], (Y1 - Y0)[Segment]
+    Length = np.hypot(DX, DY)
+    Side = np.where(Random.random_sample(Count) < 0.5, -Offset, Offset) / Length
+    X = X0[Segment] + Along * DX - Side * DY + Random.normal(0.0, Jitter or 1e-9, Count)
+    Y = Y0[Segment] + Along * DY + Side * DX + Random.normal(0.0, Jitter or 1e-9, Count)
+    return X, Y
+
+def PhotoPoints(Count, Seed=0):
+    '''
+    Returns the X and Y arrays (UTM metres) of Count photos.
+    '''
+    return PointsAlongStreets(Count, np.random.RandomState(Seed), Jitter=PhotoJitter)
+
+def KnownPoints(Count, Seed=1):
+    '''
+    Returns the X and Y arrays (UTM metres) of Count known point features
+    standing beside the streets.
+    '''
+    return PointsAlongStreets(Count, np.random.RandomState(Seed), Offset=KnownOffset)
+
+def KnownSegments(Count, Seed=2):
+    '''
+    Returns the X0, Y0, X1, Y1 arrays (UTM metres) of Count known line
+    segments, each a random piece of a street block.
+    '''
+    Random = np.random.RandomState(Seed)
+    X0, Y0, X1, Y1 = StreetSegments()
+    Segment = Random.randint(0, len(X0), Count)
+    Start, Stop = np.sort(Random.random_sample((2, Count)), axis=0)
+    DX, DY = (X1 - X0)[Segment], (Y1 - Y0)[Segment]
+    return (X0[Segment] + Start * DX, Y0[Segment] + Start * DY,
+            X0[Segment] + Stop * DX, Y0[Segment] + Stop * DY)
+
+def BoundaryRings(Extent=CityExtent):
+    '''
+    Returns the city boundary as a list of rings: the extent with the north
+    east corner cut off, like a bay, so the grid has cells that are only
+    partly inside the boundary.
+    '''
+    XMin, YMin, XMax, YMax = Extent
+    Width, Height = XMax - XMin, YMax - YMin
+    return [[(XMin, YMin), (XMin, YMax), (XMax - Width * 0.3, YMax), (XMax, YMax - Height * 0.3),
+             (XMax, YMin), (XMin, YMin)]]
+
+def PhotoKeys(Count, Random):
+    '''
+    Returns a list of Count random 22 character photo keys.
+    '''
+    Codes = KeyCharacters[Random.randint(0, len(KeyCharacters), (Count, 22))]
+    return [Key.decode('ascii') for Key in Codes.view('S22').ravel()]
+
+def ClassValues(Count, Random):
+    '''
+    Returns a (Count, classes) array of object class values, 0 where a class
+    is not found in a photo, in the order of ClassFrequencies.
+    '''
+    Frequencies = np.array([Frequency for Name, Frequency in ClassFrequencies])
+    Found = Random.random_sample((Count, len(Frequencies))) < Frequencies
+    Values = Random.exponential(1.0, (Count, len(Frequencies))) * Found
+    Total = np.maximum(Values.sum(axis=1), 1e-12)
+    return Values * (Random.uniform(0.85, 0.99, Count) / Total)[:, None]
+
+def Photos(Count, Seed=0):
+    '''
+    Generator that yields the photos a block at a time as lists of photo
+    keys, a values array (see ClassValues) and longitude and latitude arrays.
+    '''
+    Random = np.random.RandomState(Seed)
+    for Start in range(0, Count, BlockSize):
+        Size = min(BlockSize, Count - Start)
+        X, Y = PointsAlongStreets(Size, Random, Jitter=PhotoJitter)
+        Lon, Lat = Projection.InverseUTM(X, Y, CityZone)
+        yield PhotoKeys(Size, Random), ClassValues(Size, Random), Lon, Lat
+
+def Feature(Key, Row, Lon, Lat):
+    '''
+    Returns the GeoJSON feature dictionary of a photo from its key, values
+    row (see ClassValues) and coordinates.
+    '''
+    Properties = dict((ClassFrequencies[Column][0], Row[Column]) for Column in np.flatnonzero(Row).tolist())
+    Properties['key'] = Key
+    return {'type': 'Feature', 'properties': Properties, 'geometry': {'coordinates': [Lon, Lat], 'type': 'Point'}}
+
+def WriteFeatureCollection(Path, Count, Seed=0):
+    '''
+    Writes Count photos as a GeoJSON FeatureCollection laid out like a
+    Mapillary export (compact, properties before geometry).
+    '''
+    with open(Path, 'w') as OutFile:
+        OutFile.write('{"type":"FeatureCollection","features":[')
+        First = True
+        for Keys, Values, Lon, Lat in Photos(Count, Seed):
+            Features = [json.dumps(Feature(Key, Row, X, Y), separators=(',', ':'))
+                        for Key, Row, X, Y in zip(Keys, Values, Lon.tolist(), Lat.tolist())]
+            OutFile.write(('' if First else ',') + ','.join(Features))
+            First = False
+        OutFile.write(']}')
+
+def FeatureCollectionPath(Folder, Count, Seed=0):
+    '''
+    Returns the path of the synthetic FeatureCollection with Count photos in
+    a folder, writing it first when it is not there yet.
+    '''
+    Path = os.path.join(Folder, 'synthetic_%d_%d.geojson' % (Count, Seed))
+    if not os.path.exists(Path):
+        if not os.path.isdir(Folder):
+            os.makedirs(Folder)
+        # Written under another name first so an interrupted run does not leave half a file
+        WriteFeatureCollection(Path + '.part', Count, Seed)
+        os.rename(Path + '.part', Path)
+    return Path
@@ -0,0 +1,359 @@
+### Description: Bulk writers for the new point feature classes created by the
+### Mapillary tools.  The schema and spatial reference are set when a writer
+### is opened, before any data is written, and the rows are then written in
+### chunks held as NumPy structured arrays (one field per attribute plus X and
+### Y) instead of one insert call per feature.
+###
+### Every writer provides:
+###     Append(Row)        - buffers one (attribute values..., (X, Y)) row and
+###                          writes a chunk once ChunkSize rows are buffered
+###     WriteRows(Rows)    - appends every row of an iterable
+###     WriteChunk(Chunk)  - writes a structured array straight away
+###     Close()            - writes any buffered rows and closes the output
+###
+### GeoPackageWriter only needs the Python sqlite3 module so loads can be run
+### and timed outside of ArcGIS, ArcpyWriter writes shapefiles and geodatabase
+### feature classes.  Field types use the ArcGIS names (TEXT, DOUBLE, LONG).
+###
+### This script was designed to work with ArcGIS 10.4/10.5 and Python 2.7.10,
+### and also runs under Python 3.  arcpy is only imported by ArcpyWriter.
+
+###
+### import modules
+###
+
+import os
+import sqlite3
+import numpy as np
+
+###
+### Script Follows
+###
+
+# Number of rows buffered by Append before a chunk is written
+DefaultChunkSize = 50000
+
+# NumPy types of the chunk fields for the ArcGIS field types, text is kept as
+# Python objects so values are never truncated
+ChunkTypes = {'DOUBLE': np.float64, 'FLOAT': np.float32, 'LONG': np.int32,
+              'SHORT': np.int16, 'TEXT': object}
+
+# SQLite column types for the ArcGIS field types
+SQLiteTypes = {'DOUBLE': 'DOUBLE', 'FLOAT': 'FLOAT', 'LONG': 'MEDIUMINT',
+               'SHORT': 'SMALLINT', 'TEXT': 'TEXT'}
+
+# Extensions written with the GeoPackage writer
+GeoPackageExtensions = ('.gpkg', '.sqlite')
+
+# Well known text of WGS 1984, the Mapillary coordinate system
+WGS84Definition = ('GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,'
+                   'AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,'
+                   'AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],'
+                   'AUTHORITY["EPSG","4326"]]')
+
+# Layout of a GeoPackage point geometry: the GeoPackage header (no envelope)
+# followed by a little endian well known binary point
+PointBlob = np.dtype([('Magic', 'S2'), ('Version', 'u1'), ('Flags', 'u1'), ('SrsID', '<i4'),
+                      ('ByteOrder', 'u1'), ('GeometryType', '<u4'), ('X', '<f8'), ('Y', '<f8')])
+
+
+def ChunkDtype(Fields):
+    '''
+    Function that returns the structured array type of the chunks for a list
+    of (name, type) fields, with the X and Y fields added at the end.
+    '''
+    return np.dtype([(str(Name), ChunkTypes[FieldType.upper()]) for Name, FieldType in Fields] +
+                    [('X', np.float64), ('Y', np.float64)])
+
+
+def RowChunks(Rows, Fields, ChunkSize=DefaultChunkSize):
+    '''
+    Generator that turns rows of attribute values followed by an X,Y pair,
+    as produced by the GeoJSON readers, into structured array chunks.
+    '''
+    Block = []
+    for Row in Rows:
+        Block.append(Row)
+        if len(Block) >= ChunkSize:
+            yield MakeChunk(Block, Fields)
+            Block = []
+    if Block:
+        yield MakeChunk(Block, Fields)
+
+
+def MakeChunk(Rows, Fields):
+    '''
+    Function that converts a list of rows into a structured array chunk.
+    '''
+    Chunk = np.zeros(len(Rows), dtype=ChunkDtype(Fields))
+    Columns = list(zip(*Rows))
+    for Position, (Name, FieldType) in enumerate(Fields):
+        Chunk[Name] = Columns[Position]
+    Coordinates = np.array(Columns[-1], dtype=np.float64).reshape(-1, 2)
+    Chunk['X'] = Coordinates[:, 0]
+    Chunk['Y'] = Coordinates[:, 1]
+    return Chunk
+
+
+def TableExists(Database, TableName):
+    '''
+    Function that returns True when a SQLite or GeoPackage file has a table
+    of the given name.
+    '''
+    if not os.path.exists(Database):
+        return False
+    Connection = sqlite3.connect(Database)
+    try:
+        return Connection.execute('SELECT 1 FROM sqlite_master WHERE type = ? AND name = ?',
+                                  ('table', TableName)).fetchone() is not None
+    finally:
+        Connection.close()
+
+
+def OpenWriter(Path, Fields, SpatialReference=4326, ChunkSize=DefaultChunkSize, Append=False):
+    '''
+    Function that opens the writer for an output path.  Paths to a table in
+    a .gpkg or .sqlite file (for example Output.gpkg\\Photos) use the
+    GeoPackage writer and anything else the arcpy writer.  SpatialReference
+    is a WKID or an arcpy spatial reference.  With Append an existing output
+    is added to instead of replaced.
+    '''
+    Folder, Name = os.path.split(Path)
+    if os.path.splitext(Folder)[1].lower() in GeoPackageExtensions:
+        Definition = None
+        if hasattr(SpatialReference, 'exportToString'):
+            Definition = SpatialReference.exportToString()
+        return GeoPackageWriter(Folder, Name, Fields, getattr(SpatialReference, 'factoryCode', SpatialReference),
+                                Definition, ChunkSize, Append)
+    return ArcpyWriter(Path, Fields, SpatialReference, ChunkSize, Append)
+
+
+class FeatureWriter(object):
+    '''
+    Base class of the writers, see the module description.  Subclasses set
+    Fields and implement _Write(Chunk) and _Finish().
+    '''
+
+    def __init__(self, Fields, ChunkSize=DefaultChunkSize):
+        self.Fields = [(str(Name), FieldType.upper()) for Name, FieldType in Fields]
+        self.ChunkSize = ChunkSize
+        self.Pending = []
+        self.Count = 0
+
+    def Append(self, Row):
+        self.Pending.append(Row)
+        if len(self.Pending) >= self.ChunkSize:
+            self.Flush()
+
+    def WriteRows(self, Rows):
+        for Row in Rows:
+            self.Append(Row)
+
+    def WriteChunk(self, Chunk):
+        if len(Chunk):
+            self._Write(Chunk)
+            self.Count += len(Chunk)
+
+    def Flush(self):
+        if self.Pending:
+            Rows = self.Pending
+            self.Pending = []
+            self.WriteChunk(MakeChunk(Rows, self.Fields))
+
+    def Close(self):
+        self.Flush()
+        self._Finish()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ExceptionType, Value, Traceback):
+        self.Close()
+
+    def _Write(self, Chunk):
+        raise NotImplementedError
+
+    def _Finish(self):
+        raise NotImplementedError
+
+
+class GeoPackageWriter(FeatureWriter):
+    '''
+    Writes a point table to a GeoPackage with the sqlite3 module.  The file
+    and the GeoPackage metadata tables are created when needed and an
+    existing table of the same name is replaced (or added to with Append).
+    Each chunk is one executemany call and the whole load is a single
+    transaction.
+    '''
+
+    def __init__(self, Database, TableName, Fields, Wkid=4326, Definition=None, ChunkSize=DefaultChunkSize,
+                 Append=False):
+        FeatureWriter.__init__(self, Fields, ChunkSize)
+        self.Database = Database
+        self.Path = os.path.join(Database, TableName)
+        self.TableName = TableName
+        self.Wkid = int(Wkid)
+        self.Extent = None
+        self.Connection = sqlite3.connect(Database)
+        self.Connection.execute('PRAGMA synchronous = OFF')
+        self.Connection.execute('PRAGMA journal_mode = MEMORY')
+        self.Connection.execute('PRAGMA application_id = 1196444487')
+        self.Connection.execute('PRAGMA user_version = 10200')
+        self._CreateMetadata(Definition)
+        if Append and TableExists(Database, TableName):
+            Extent = self.Connection.execute('SELECT min_x, min_y, max_x, max_y FROM gpkg_contents WHERE table_name = ?',
+                                             (TableName,)).fetchone()
+            if Extent is not None and Extent[0] is not None:
+                self.Extent = Extent
+        else:
+            self._CreateTable()
+        Columns = ['geom'] + [Name for Name, FieldType in self.Fields]
+        self.Statement = 'INSERT INTO "%s" (%s) VALUES (%s)' % (
+            TableName, ', '.join('"%s"' % Column for Column in Columns), ', '.join('?' * len(Columns)))
+
+    def _CreateMetadata(self, Definition):
+        self.Connection.execute('CREATE TABLE IF NOT EXISTS gpkg_spatial_ref_sys (srs_name TEXT NOT NULL, '
+                                'srs_id INTEGER PRIMARY KEY, organization TEXT NOT NULL, '
+                                'organization_coordsys_id INTEGER NOT NULL, definition TEXT NOT NULL, description TEXT)')
+        self.Connection.execute('CREATE TABLE IF NOT EXISTS gpkg_contents (table_name TEXT NOT NULL PRIMARY KEY, '
+                                'data_type TEXT NOT NULL, identifier TEXT UNIQUE, description TEXT DEFAULT \'\', '
+                                'last_change DATETIME NOT NULL DEFAULT (strftime(\'%Y-%m-%dT%H:%M:%fZ\', \'now\')), '
+                                'min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE, srs_id INTEGER)')
+        self.Connection.execute('CREATE TABLE IF NOT EXISTS gpkg_geometry_columns (table_name TEXT NOT NULL, '
+                                'column_name TEXT NOT NULL, geometry_type_name TEXT NOT NULL, srs_id INTEGER NOT NULL, '
+                                'z TINYINT NOT NULL, m TINYINT NOT NULL, PRIMARY KEY (table_name, column_name))')
+        SpatialRefs = [('Undefined cartesian SRS', -1, 'NONE', -1, 'undefined'),
+                       ('Undefined geographic SRS', 0, 'NONE', 0, 'undefined'),
+                       ('WGS 84 geodetic', 4326, 'EPSG', 4326, WGS84Definition)]
+        if self.Wkid not in (-1, 0, 4326):
+            SpatialRefs.append(('WKID ' + str(self.Wkid), self.Wkid, 'EPSG', self.Wkid, Definition or 'undefined'))
+        self.Connection.executemany('INSERT OR IGNORE INTO gpkg_spatial_ref_sys (srs_name, srs_id, organization, '
+                                    'organization_coordsys_id, definition) VALUES (?, ?, ?, ?, ?)', SpatialRefs)
+
+    def _CreateTable(self):
+        self.Connection.execute('DROP TABLE IF EXISTS "%s"' % self.TableName)
+        self.Connection.execute('DELETE FROM gpkg_contents WHERE table_name = ?', (self.TableName,))
+        self.Connection.execute('DELETE FROM gpkg_geometry_columns WHERE table_name = ?', (self.TableName,))
+        Columns = ['fid INTEGER PRIMARY KEY AUTOINCREMENT', 'geom POINT']
+        Columns += ['"%s" %s' % (Name, SQLiteTypes[FieldType]) for Name, FieldType in self.Fields]
+        self.Connection.execute('CREATE TABLE "%s" (%s)' % (self.TableName, ', '.join(Columns)))
+        self.Connection.execute('INSERT INTO gpkg_contents (table_name, data_type, identifier, srs_id) VALUES (?, ?, ?, ?)',
+                                (self.TableName, 'features', self.TableName, self.Wkid))
+        self.Connection.execute('INSERT INTO gpkg_geometry_columns VALUES (?, ?, ?, ?, 0, 0)',
+                                (self.TableName, 'geom', 'POINT', self.Wkid))
+
+    def _Write(self, Chunk):
+        Blobs = np.zeros(len(Chunk), dtype=PointBlob)
+        Blobs['Magic'] = b'GP'
+        # Flags: little endian header without an envelope
+        Blobs['Flags'] = 1
+        Blobs['SrsID'] = self.Wkid
+        Blobs['ByteOrder'] = 1
+        Blobs['GeometryType'] = 1
+        Blobs['X'] = Chunk['X']
+        Blobs['Y'] = Chunk['Y']
+        # Viewing each record as raw bytes gives one bytes value per geometry
+        Geometries = Blobs.view('V' + str(PointBlob.itemsize)).tolist()
+        if str is bytes:
+            # Python 2 only stores buffers as blobs
+            Geometries = [sqlite3.Binary(Geometry) for Geometry in Geometries]
+        Columns = [Geometries] + [Chunk[Name].tolist() for Name, FieldType in self.Fields]
+        self.Connection.executemany(self.Statement, zip(*Columns))
+        Extent = (Chunk['X'].min(), Chunk['Y'].min(), Chunk['X'].max(), Chunk['Y'].max())
+        if self.Extent is None:
+            self.Extent = Extent
+        else:
+            self.Extent = (min(self.Extent[0], Extent[0]), min(self.Extent[1], Extent[1]),
+                           max(self.Extent[2], Extent[2]), max(self.Extent[3], Extent[3]))
+
+    def _Finish(self):
+        if self.Extent is not None:
+            self.Connection.execute('UPDATE gpkg_contents SET min_x = ?, min_y = ?, max_x = ?, max_y = ? '
+                                    'WHERE table_name = ?', tuple(float(Value) for Value in self.Extent) + (self.TableName,))
+        self.Connection.commit()
+        self.Connection.close()
+
+
+class ArcpyWriter(FeatureWriter):
+    '''
+    Writes a point shapefile or geodatabase feature class with arcpy.  The
+    schema comes from the structured array type of the chunks: a new feature
+    class is made from the first chunk with arcpy.da.NumPyArrayToFeatureClass,
+    and every later chunk (or every chunk when Append is set and the output
+    exists) is made into an in_memory feature class and added with a single
+    Append.  Chunks NumPy cannot hold in fixed width fields (text that is
+    null or longer than TextLength) are inserted a row at a time with an
+    insert cursor instead.
+    '''
+
+    # Length of the text fields, the longest a shapefile field can hold
+    TextLength = 254
+    # Name of the coordinate pair field of the arrays given to arcpy
+    ShapeField = 'SHAPE_XY'
+    # In memory feature class each appended chunk is written to
+    ChunkPath = 'in_memory\\BulkWriterChunk'
+
+    def __init__(self, Path, Fields, SpatialReference=4326, ChunkSize=DefaultChunkSize, Append=False):
+        import arcpy
+        FeatureWriter.__init__(self, Fields, ChunkSize)
+        self.Path = Path
+        self.Exists = Append and arcpy.Exists(Path)
+        if self.Exists:
+            SpatialReference = arcpy.Describe(Path).spatialReference
+        elif not hasattr(SpatialReference, 'exportToString'):
+            SpatialReference = arcpy.SpatialReference(int(SpatialReference))
+        self.SpatialReference = SpatialReference
+        self.Dtype = np.dtype([(Name, 'U%d' % self.TextLength if FieldType == 'TEXT' else ChunkTypes[FieldType])
+                               for Name, FieldType in self.Fields] + [(self.ShapeField, np.float64, 2)])
+
+    def _Array(self, Chunk):
+        '''
+        Returns the chunk in fixed width fields with the coordinates in one
+        field, or None when a text value would be lost.
+        '''
+        Array = np.zeros(len(Chunk), dtype=self.Dtype)
+        for Name, FieldType in self.Fields:
+            if FieldType == 'TEXT':
+                Values = Chunk[Name].tolist()
+                if any(Value is None or len(Value) > self.TextLength for Value in Values):
+                    return None
+                Array[Name] = Values
+            else:
+                Array[Name] = Chunk[Name]
+        Array[self.ShapeField][:, 0] = Chunk['X']
+        Array[self.ShapeField][:, 1] = Chunk['Y']
+        return Array
+
+    def _Create(self, Array):
+        import arcpy
+        arcpy.da.NumPyArrayToFeatureClass(Array, self.Path, [self.ShapeField], self.SpatialReference)
+        self.Exists = True
+
+    def _Write(self, Chunk):
+        import arcpy
+        Array = self._Array(Chunk)
+        if Array is None:
+            self._InsertRows(Chunk)
+        elif not self.Exists:
+            self._Create(Array)
+        else:
+            arcpy.da.NumPyArrayToFeatureClass(Array, self.ChunkPath, [self.ShapeField], self.SpatialReference)
+            try:
+                arcpy.Append_management(self.ChunkPath, self.Path, 'NO_TEST')
+            finally:
+                arcpy.Delete_management(self.ChunkPath)
+
+    def _InsertRows(self, Chunk):
+        import arcpy
+        if not self.Exists:
+            self._Create(np.zeros(0, dtype=self.Dtype))
+        Columns = [Chunk[Name].tolist() for Name, FieldType in self.Fields]
+        Columns.append(list(zip(Chunk['X'].tolist(), Chunk['Y'].tolist())))
+        with arcpy.da.InsertCursor(self.Path, [Name for Name, FieldType in self.Fields] + ['SHAPE@XY']) as Cursor:
+            for Row in zip(*Columns):
+                Cursor.insertRow(Row)
+
+    def _Finish(self):
+        # An output without rows is still created with its fields
+        if not self.Exists:
+            self._Create(np.zeros(0, dtype=self.Dtype))
@@ -0,0 +1,75 @@
+### Description: Streaming statistics for the columns of a table.  The maximum,
+### minimum, sum, count and null count of any number of fields are gathered
+### while the rows are read, in a single pass and without keeping the values,
+### so a table never has to be read once per field or sorted to find its
+### largest value.
+###
+### This script was designed to work with ArcGIS 10.4/10.5 and Python 2.7.10,
+### and also runs under Python 3.  arcpy is only imported by SummarizeTable.
+
+###
+### Script Follows
+###
+
+class ColumnStatistics(object):
+    '''
+    Accumulates the statistics of a list of fields.  Rows are added one at a
+    time with Add (values in the same order as the fields) and Summary
+    returns a dictionary with the Max, Min, Sum, Count and NullCount of each
+    field.  Null (None) values only add to NullCount; Max, Min and Sum are
+    None for a field that has no values.
+    '''
+
+    def __init__(self, Fields):
+        self.Fields = list(Fields)
+        self.Max = [None] * len(self.Fields)
+        self.Min = [None] * len(self.Fields)
+        self.Sum = [None] * len(self.Fields)
+        self.Count = [0] * len(self.Fields)
+        self.NullCount = [0] * len(self.Fields)
+
+    def Add(self, Row):
+        for Position, Value in enumerate(Row):
+            if Value is None:
+                self.NullCount[Position] += 1
+            elif self.Count[Position] == 0:
+                self.Max[Position] = Value
+                self.Min[Position] = Value
+                self.Sum[Position] = Value
+                self.Count[Position] = 1
+            else:
+                if Value > self.Max[Position]:
+                    self.Max[Position] = Value
+                elif Value < self.Min[Position]:
+                    self.Min[Position] = Value
+                self.Sum[Position] += Value
+                self.Count[Position] += 1
+
+    def Summary(self):
+        Statistics = {}
+        for Position, Field in enumerate(self.Fields):
+            Statistics[Field] = {'Max': self.Max[Position], 'Min': self.Min[Position],
+                                 'Sum': self.Sum[Position], 'Count': self.Count[Position],
+                                 'NullCount': self.NullCount[Position]}
+        return Statistics
+
+
+def SummarizeRows(Rows, Fields):
+    '''
+    Function that returns the statistics of the fields for any iterable of
+    rows, such as a cursor opened on those fields.
+    '''
+    Statistics = ColumnStatistics(Fields)
+    for Row in Rows:
+        Statistics.Add(Row)
+    return Statistics.Summary()
+
+
+def SummarizeTable(Table, Fields, WhereClause=None):
+    '''
+    Function that returns the statistics of the fields of a feature class or
+    table with a single arcpy.da.SearchCursor pass.
+    '''
+    import arcpy
+    with arcpy.da.SearchCursor(Table, Fields, WhereClause) as Cursor:
+        return SummarizeRows(Cursor, Fields)
@@ -0,0 +1,286 @@
+### Description: Incremental import of Mapillary exports into an existing
+### feature class.  A small SQLite index kept beside the output holds the photo
+### key of every feature already loaded and a hash of its values and
+### coordinates.  Each new export is compared with the index so only photos
+### that are new are inserted, only photos whose values changed are updated
+### and, optionally, photos that are no longer in the export are deleted.  The
+### work done on the output is proportional to the changes, not to the city.
+###
+### Targets are not transactional (a shapefile has no rollback), so the keys
+### a run is about to insert, update or delete are written to the index as
+### pending before the target is changed and only cleared, together with the
+### new hashes, once every change has been applied.  A run that stops half
+### way leaves its keys pending: the next run deletes whatever those keys
+### left in the target and loads them again from the export, so no photo is
+### ever loaded twice.
+###
+### The output is reached through a target adapter providing:
+###     Insert(Rows)  - adds rows of (key, values..., (X, Y))
+###     Update(Rows)  - replaces the values and location of the rows' keys
+###     Delete(Keys)  - removes the features with the keys
+###     Close()
+###
+### This script was designed to work with ArcGIS 10.4/10.5 and Python 2.7.10,
+### and also runs under Python 3.  arcpy is only imported by ArcpyTarget.
+
+###
+### import modules
+###
+
+import hashlib
+import json
+import os
+import sqlite3
+import BulkWriter
+
+###
+### Script Follows
+###
+
+# Suffix of the key index kept beside the output
+IndexSuffix = '.keys.sqlite'
+# Number of keys in each IN (...) list used to find rows to update or delete
+KeyBatchSize = 500
+
+
+def IndexPathFor(OutputPath):
+    '''
+    Function that returns the path of the key index of an output.
+    '''
+    return OutputPath + IndexSuffix
+
+
+def HashValue(Value):
+    # Whole numbers are hashed as the doubles they are stored as, so a value
+    # read as 1 from the GeoJSON and as 1.0 from the detection cache match
+    if isinstance(Value, (list, tuple)):
+        return [HashValue(Item) for Item in Value]
+    if isinstance(Value, int) and not isinstance(Value, bool):
+        return float(Value)
+    return Value
+
+
+def RowHash(Row):
+    '''
+    Function that returns the content hash of a row, everything after the
+    photo key (the values and coordinates) as they were read from the export.
+    '''
+    Content = json.dumps([HashValue(Value) for Value in Row[1:]])
+    return hashlib.sha1(Content.encode('utf-8')).hexdigest()[:16]
+
+
+class KeyIndex(object):
+    '''
+    The SQLite index of the photos loaded into an output.  Schema holds the
+    field list and spatial reference the output was created with, so a run
+    with a different layout starts again from an empty output.
+    '''
+
+    def __init__(self, Path):
+        self.Path = Path
+        self.Connection = sqlite3.connect(Path)
+        self.Connection.execute('CREATE TABLE IF NOT EXISTS Photos (Key TEXT PRIMARY KEY, Hash TEXT NOT NULL)')
+        self.Connection.execute('CREATE TABLE IF NOT EXISTS Settings (Name TEXT PRIMARY KEY, Value TEXT)')
+        self.Connection.execute('CREATE TABLE IF NOT EXISTS Pending (Key TEXT PRIMARY KEY)')
+
+    def Matches(self, Schema):
+        # Compared through JSON so tuples and lists describe the same layout
+        return self.Schema() == json.loads(json.dumps(Schema))
+
+    def Schema(self):
+        Row = self.Connection.execute('SELECT Value FROM Settings WHERE Name = ?', ('Schema',)).fetchone()
+        return json.loads(Row[0]) if Row else None
+
+    def Hashes(self):
+        return dict(self.Connection.execute('SELECT Key, Hash FROM Photos'))
+
+    def PendingKeys(self):
+        return [Row[0] for Row in self.Connection.execute('SELECT Key FROM Pending')]
+
+    def Reset(self, Schema):
+        self.Connection.execute('DELETE FROM Photos')
+        self.Connection.execute('DELETE FROM Pending')
+        self.Connection.execute('INSERT OR REPLACE INTO Settings VALUES (?, ?)', ('Schema', json.dumps(Schema)))
+        self.Connection.commit()
+
+    def Begin(self, Keys):
+        '''
+        Marks the keys about to be changed in the target as pending.
+        '''
+        self.Connection.executemany('INSERT OR IGNORE INTO Pending VALUES (?)', [(Key,) for Key in Keys])
+        self.Connection.commit()
+
+    def Record(self, Hashes, DeletedKeys):
+        '''
+        Records the hashes of the rows written and the keys deleted once the
+        target holds them, and clears the pending keys in the same commit.
+        '''
+        self.Connection.executemany('DELETE FROM Photos WHERE Key = ?', [(Key,) for Key in DeletedKeys])
+        self.Connection.executemany('INSERT OR REPLACE INTO Photos VALUES (?, ?)', Hashes)
+        self.Connection.execute('DELETE FROM Pending')
+        self.Connection.commit()
+
+    def Close(self):
+        self.Connection.close()
+
+
+def Classify(Rows, Known):
+    '''
+    Function that compares rows with the key hashes already loaded.  Returns
+    the new rows, the changed rows, the (key, hash) pairs of both and the set
+    of every key in the rows.  A key repeated in the rows keeps its last row.
+    '''
+    Delta = {}
+    Seen = set()
+    for Row in Rows:
+        Key = Row[0]
+        Seen.add(Key)
+        Hash = RowHash(Row)
+        if Known.get(Key) != Hash:
+            Delta[Key] = (Row, Hash)
+        elif Key in Delta:
+            del Delta[Key]
+    New = [Row for Key, (Row, Hash) in Delta.items() if Key not in Known]
+    Changed = [Row for Key, (Row, Hash) in Delta.items() if Key in Known]
+    Hashes = [(Key, Hash) for Key, (Row, Hash) in Delta.items()]
+    return New, Changed, Hashes, Seen
+
+
+def ImportDelta(Rows, Target, IndexPath, Schema, DeleteMissing=False, Prepare=None):
+    '''
+    Function that brings a target up to date with the rows of an export and
+    returns a dictionary with the number of rows Inserted, Updated, Deleted
+    and Unchanged.  Schema is any JSON value describing the output layout;
+    when it differs from the one in the index (or there is no index) the
+    index starts again, so the target must be a new empty output (see
+    NeedsRebuild).  Prepare is an optional function applied to the new and
+    changed rows only, for example to project them.  Keys left pending by a
+    run that did not finish are deleted from the target and count as new.
+    '''
+    Index = KeyIndex(IndexPath)
+    try:
+        if not Index.Matches(Schema):
+            Index.Reset(Schema)
+        Known = Index.Hashes()
+        Pending = Index.PendingKeys()
+        for Key in Pending:
+            Known.pop(Key, None)
+        New, Changed, Hashes, Seen = Classify(Rows, Known)
+        Deleted = [Key for Key in Known if Key not in Seen] if DeleteMissing else []
+        if Prepare is not None:
+            New = Prepare(New)
+            Changed = Prepare(Changed)
+        Index.Begin([Key for Key, Hash in Hashes] + Deleted)
+        if Pending or Deleted:
+            Target.Delete(Pending + Deleted)
+        if Changed:
+            Target.Update(Changed)
+        if New:
+            Target.Insert(New)
+        Target.Close()
+        Index.Record(Hashes, Pending + Deleted)
+    finally:
+        Index.Close()
+    return {'Inserted': len(New), 'Updated': len(Changed), 'Deleted': len(Deleted),
+            'Unchanged': len(Seen) - len(New) - len(Changed)}
+
+
+def NeedsRebuild(IndexPath, Schema, OutputExists):
+    '''
+    Function that returns True when an output has to be created again before
+    a delta can be applied: it is missing, has no index or was created with
+    a different layout.
+    '''
+    if not OutputExists or not os.path.exists(IndexPath):
+        return True
+    Index = KeyIndex(IndexPath)
+    try:
+        return not Index.Matches(Schema)
+    finally:
+        Index.Close()
+
+
+def KeyBatches(Keys):
+    '''
+    Generator that splits a list of keys into lists of KeyBatchSize keys.
+    '''
+    Keys = list(Keys)
+    for Start in range(0, len(Keys), KeyBatchSize):
+        yield Keys[Start:Start + KeyBatchSize]
+
+
+class GeoPackageTarget(object):
+    '''
+    Target for a point table written by BulkWriter.GeoPackageWriter.  New
+    rows are appended through the writer and changed or deleted rows are
+    found with an index on the Key column.
+    '''
+
+    def __init__(self, Database, TableName, Fields, Wkid=4326):
+        self.Writer = BulkWriter.GeoPackageWriter(Database, TableName, Fields, Wkid, Append=True)
+        self.Connection = self.Writer.Connection
+        self.TableName = TableName
+        self.Connection.execute('CREATE INDEX IF NOT EXISTS "%s_Key" ON "%s" ("%s")'
+                                % (TableName, TableName, self.Writer.Fields[0][0]))
+
+    def Insert(self, Rows):
+        self.Writer.WriteRows(Rows)
+        self.Writer.Flush()
+
+    def Update(self, Rows):
+        # Replacing a changed row keeps the table and the writer's extent up to date
+        self.Delete([Row[0] for Row in Rows])
+        self.Insert(Rows)
+
+    def Delete(self, Keys):
+        self.Connection.executemany('DELETE FROM "%s" WHERE "%s" = ?' % (self.TableName, self.Writer.Fields[0][0]),
+                                    [(Key,) for Key in Keys])
+
+    def Close(self):
+        self.Writer.Close()
+
+
+class ArcpyTarget(object):
+    '''
+    Target for a shapefile or geodatabase feature class.  Rows to update or
+    delete are selected with where clauses on the key field, a batch of keys
+    at a time, so only the matching features are read.
+    '''
+
+    def __init__(self, Path, Fields):
+        import arcpy
+        self.Path = Path
+        self.Fields = Fields
+        self.KeyField = Fields[0][0]
+        self.FieldNames = [Name for Name, FieldType in Fields] + ['SHAPE@XY']
+        self.Delimited = arcpy.AddFieldDelimiters(Path, self.KeyField)
+
+    def WhereClause(self, Keys):
+        return '%s IN (%s)' % (self.Delimited, ', '.join("'%s'" % Key.replace("'", "''") for Key in Keys))
+
+    def Insert(self, Rows):
+        # The insert cursor is only opened here so it does not lock out the update cursors
+        Writer = BulkWriter.ArcpyWriter(self.Path, self.Fields, Append=True)
+        try:
+            Writer.WriteRows(Rows)
+        finally:
+            Writer.Close()
+
+    def Update(self, Rows):
+        import arcpy
+        Lookup = dict((Row[0], Row) for Row in Rows)
+        for Keys in KeyBatches(Lookup):
+            with arcpy.da.UpdateCursor(self.Path, self.FieldNames, self.WhereClause(Keys)) as Cursor:
+                for Row in Cursor:
+                    New = Lookup[Row[0]]
+                    Cursor.updateRow(list(New[:-1]) + [tuple(New[-1])])
+
+    def Delete(self, Keys):
+        import arcpy
+        for Batch in KeyBatches(Keys):
+            with arcpy.da.UpdateCursor(self.Path, [self.KeyField], self.WhereClause(Batch)) as Cursor:
+                for Row in Cursor:
+                    Cursor.deleteRow()
+
+    def Close(self):
+        pass
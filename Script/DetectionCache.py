@@ -0,0 +1,251 @@
+### Description: Columnar cache of the detections in a Mapillary GeoJSON export.
+### The first time an export is used its photo keys, longitude/latitude and
+### every object class value are written to a folder of NumPy .npy files next
+### to the GeoJSON file.  Later runs open the arrays with memory-mapping, so
+### they start in a fraction of a second and only read the columns they use
+### instead of parsing the JSON again.
+###
+### Cache folder contents:
+###     Keys.npy      photo keys (fixed width text), one per row
+###     KeyOrder.npy  row numbers that sort the keys, used to look up keys
+###     LonLat.npy    longitude and latitude (float64), one row per photo
+###     Scores.npy    object class values (float64, the same doubles as the
+###                   GeoJSON), one column per class, NaN where the photo
+###                   does not contain the class
+###     Manifest.json class list, row count and the size, modification time
+###                   and SHA-1 hash of the GeoJSON file the cache was built from
+###
+### The cache is rebuilt when the GeoJSON file changes size or content.  A new
+### modification time with the same content only updates the manifest.
+###
+### This script was designed to work with ArcGIS 10.4/10.5 and Python 2.7.10,
+### and also runs under Python 3.  It needs NumPy but does not require arcpy.
+
+###
+### import modules
+###
+
+import array
+import hashlib
+import json
+import os
+import GeoJSONReader
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+###
+### Script Follows
+###
+
+# Version 2 keeps the scores as float64, caches of version 1 are rebuilt
+CacheVersion = 2
+ManifestName = 'Manifest.json'
+# Number of score values held in memory at a time while Scores.npy is written
+BuildBlockCells = 1 << 22
+
+
+def CacheFolderFor(FilePath):
+    '''
+    Returns the default cache folder for a GeoJSON file (beside the file).
+    '''
+    return FilePath + '.cache'
+
+
+def FileHash(FilePath, BlockSize=1 << 20):
+    '''
+    Returns the SHA-1 hash of a file, read in blocks.
+    '''
+    Hash = hashlib.sha1()
+    with open(FilePath, 'rb') as File:
+        Block = File.read(BlockSize)
+        while Block:
+            Hash.update(Block)
+            Block = File.read(BlockSize)
+    return Hash.hexdigest()
+
+
+def OpenCache(FilePath, CacheFolder=None):
+    '''
+    Function that returns the DetectionCache for a GeoJSON file, building
+    or rebuilding the cache first when it is missing or out of date.
+    '''
+    if np is None:
+        raise ImportError('The detection cache requires NumPy')
+    if CacheFolder is None:
+        CacheFolder = CacheFolderFor(FilePath)
+    Manifest = ReadManifest(CacheFolder)
+    if Manifest is None or not IsCurrent(FilePath, CacheFolder, Manifest):
+        BuildCache(FilePath, CacheFolder)
+    return DetectionCache(CacheFolder)
+
+
+def ReadManifest(CacheFolder):
+    '''
+    Returns the manifest of a cache folder, or None when there is no
+    complete cache of the current version in the folder.
+    '''
+    ManifestPath = os.path.join(CacheFolder, ManifestName)
+    if not os.path.isfile(ManifestPath):
+        return None
+    with open(ManifestPath) as File:
+        Manifest = json.load(File)
+    if Manifest.get('Version') != CacheVersion:
+        return None
+    return Manifest
+
+
+def IsCurrent(FilePath, CacheFolder, Manifest):
+    '''
+    Function that checks a cache against its GeoJSON file.  A matching size
+    and modification time is trusted, otherwise the file is hashed and a
+    matching hash refreshes the modification time stored in the manifest.
+    '''
+    Status = os.stat(FilePath)
+    if Status.st_size != Manifest['Size']:
+        return False
+    if Status.st_mtime == Manifest['MTime']:
+        return True
+    if FileHash(FilePath) != Manifest['SHA1']:
+        return False
+    Manifest['MTime'] = Status.st_mtime
+    WriteManifest(CacheFolder, Manifest)
+    return True
+
+
+def WriteManifest(CacheFolder, Manifest):
+    TempPath = os.path.join(CacheFolder, ManifestName + '.tmp')
+    with open(TempPath, 'w') as File:
+        json.dump(Manifest, File, indent=2)
+    if os.path.exists(os.path.join(CacheFolder, ManifestName)):
+        os.remove(os.path.join(CacheFolder, ManifestName))
+    os.rename(TempPath, os.path.join(CacheFolder, ManifestName))
+
+
+def BuildCache(FilePath, CacheFolder=None):
+    '''
+    Function that reads a Mapillary GeoJSON file once with the incremental
+    reader and writes the columnar cache.  The manifest is written last so
+    an interrupted build is never mistaken for a complete cache.  Returns
+    the manifest.
+    '''
+    if np is None:
+        raise ImportError('The detection cache requires NumPy')
+    if CacheFolder is None:
+        CacheFolder = CacheFolderFor(FilePath)
+    if not os.path.isdir(CacheFolder):
+        os.makedirs(CacheFolder)
+    elif os.path.isfile(os.path.join(CacheFolder, ManifestName)):
+        os.remove(os.path.join(CacheFolder, ManifestName))
+    Status = os.stat(FilePath)
+    Keys = []
+    LonLat = array.array('d')
+    Classes = []
+    Columns = {}
+    for Key, Values, Coordinates in GeoJSONReader.ExtractClasses(FilePath):
+        Row = len(Keys)
+        Keys.append(Key)
+        LonLat.append(Coordinates[0])
+        LonLat.append(Coordinates[1])
+        for ObjectKey, Value in Values.items():
+            Column = Columns.get(ObjectKey)
+            if Column is None:
+                # A class seen for the first time is missing from the earlier rows
+                Column = array.array('d', [float('nan')]) * Row
+                Columns[ObjectKey] = Column
+                Classes.append(ObjectKey)
+            elif len(Column) < Row:
+                Column.extend(array.array('d', [float('nan')]) * (Row - len(Column)))
+            Column.append(Value)
+    Count = len(Keys)
+    # The score matrix is written straight to its memory-mapped file a block of
+    # columns at a time, so the whole matrix is never held in memory
+    Scores = np.lib.format.open_memmap(os.path.join(CacheFolder, 'Scores.npy'), mode='w+',
+                                       dtype=np.float64, shape=(Count, len(Classes)))
+    Width = max(1, BuildBlockCells // max(Count, 1))
+    for Start in range(0, len(Classes), Width):
+        Block = np.full((Count, min(Width, len(Classes) - Start)), np.nan, dtype=np.float64)
+        for Position, ObjectKey in enumerate(Classes[Start:Start + Width]):
+            Column = np.frombuffer(Columns.pop(ObjectKey), dtype=np.float64)
+            Block[:Column.size, Position] = Column
+        Scores[:, Start:Start + Block.shape[1]] = Block
+    Scores.flush()
+    # The file is closed before the manifest says the cache is complete
+    del Scores
+    KeyArray = np.array(Keys, dtype='U') if Count else np.zeros(0, dtype='U1')
+    np.save(os.path.join(CacheFolder, 'Keys.npy'), KeyArray)
+    np.save(os.path.join(CacheFolder, 'KeyOrder.npy'), np.argsort(KeyArray, kind='mergesort'))
+    np.save(os.path.join(CacheFolder, 'LonLat.npy'), np.frombuffer(LonLat, dtype=np.float64).reshape(Count, 2))
+    Manifest = {'Version': CacheVersion, 'Source': os.path.abspath(FilePath), 'Size': Status.st_size,
+                'MTime': Status.st_mtime, 'SHA1': FileHash(FilePath), 'Count': Count, 'Classes': Classes}
+    WriteManifest(CacheFolder, Manifest)
+    return Manifest
+
+
+class DetectionCache(object):
+    '''
+    Memory-mapped view of a cache folder.  Keys, LonLat and Scores are NumPy
+    arrays backed by the files, Classes is the list of object class keys in
+    the column order of Scores.  ExtractFeatures and ExtractClasses return
+    the same rows as the GeoJSONReader functions of the same name.
+    '''
+
+    def __init__(self, CacheFolder):
+        Manifest = ReadManifest(CacheFolder)
+        if Manifest is None:
+            raise IOError('No detection cache in ' + CacheFolder)
+        self.Folder = CacheFolder
+        self.Classes = Manifest['Classes']
+        self.Count = Manifest['Count']
+        self.ClassColumns = dict((ObjectKey, Position) for Position, ObjectKey in enumerate(self.Classes))
+        self.Keys = np.load(os.path.join(CacheFolder, 'Keys.npy'), mmap_mode='r')
+        self.KeyOrder = np.load(os.path.join(CacheFolder, 'KeyOrder.npy'), mmap_mode='r')
+        self.LonLat = np.load(os.path.join(CacheFolder, 'LonLat.npy'), mmap_mode='r')
+        self.Scores = np.load(os.path.join(CacheFolder, 'Scores.npy'), mmap_mode='r')
+        # The keys in sorted order are made once for every Find
+        self.SortedKeys = np.asarray(self.Keys[self.KeyOrder])
+
+    def Column(self, ObjectKey, Default=0.0):
+        '''
+        Returns the values of one object class for every photo, with the
+        default value where a photo does not contain the class.
+        '''
+        if ObjectKey not in self.ClassColumns:
+            return np.full(self.Count, Default, dtype=np.float64)
+        Values = np.array(self.Scores[:, self.ClassColumns[ObjectKey]], dtype=np.float64)
+        Values[np.isnan(Values)] = Default
+        return Values
+
+    def Find(self, Keys):
+        '''
+        Returns the row of each photo key, or -1 for keys that are not cached.
+        '''
+        Keys = np.asarray(Keys, dtype='U')
+        if self.Count == 0:
+            return np.full(Keys.shape, -1, dtype=np.int64)
+        Positions = np.clip(np.searchsorted(self.SortedKeys, Keys), 0, self.Count - 1)
+        Rows = np.asarray(self.KeyOrder)[Positions]
+        return np.where(self.SortedKeys[Positions] == Keys, Rows, -1)
+
+    def ExtractFeatures(self, ObjectKey, Default=0.0):
+        Values = self.Column(ObjectKey, Default)
+        for Row in range(self.Count):
+            yield (str(self.Keys[Row]), float(Values[Row]), [float(self.LonLat[Row, 0]), float(self.LonLat[Row, 1])])
+
+    def ExtractClasses(self, ObjectKeys=None, Threshold=None, BlockSize=10000):
+        if ObjectKeys is None:
+            ObjectKeys = self.Classes
+        Present = [ObjectKey for ObjectKey in ObjectKeys if ObjectKey in self.ClassColumns]
+        Columns = [self.ClassColumns[ObjectKey] for ObjectKey in Present]
+        # The score columns are read a block of rows at a time to keep memory bounded
+        for Start in range(0, self.Count, BlockSize):
+            Scores = np.asarray(self.Scores[Start:Start + BlockSize][:, Columns], dtype=np.float64)
+            Found = ~np.isnan(Scores)
+            if Threshold is not None:
+                Found &= Scores >= Threshold
+            for Offset in range(Scores.shape[0]):
+                Row = Start + Offset
+                Classes = dict((Present[Position], float(Scores[Offset, Position])) for Position in np.flatnonzero(Found[Offset]))
+                yield (str(self.Keys[Row]), Classes, [float(self.LonLat[Row, 0]), float(self.LonLat[Row, 1])])
@@ -0,0 +1,121 @@
+### Description: Collapses repeated sightings of one object into a single
+### detection.  A bench or hydrant is seen in many consecutive Mapillary
+### photos, so the extracted points hold the same object many times over.
+### The photos whose class value reaches the score threshold are clustered:
+### the photo with the highest value becomes the seed of a cluster and takes
+### in every photo not yet in a cluster within the radius of it, then the
+### next best photo that is left starts the next cluster, and so on.  Every
+### cluster therefore spans at most twice the radius, sightings along a
+### street are not chained into one long cluster, and the seed is the best
+### sighting of its cluster.
+###
+### The photos are hashed into a grid of square cells the size of the radius,
+### so a seed only compares the photos of its own cell and the eight around
+### it and the clustering runs in near-linear time on millions of photos.
+### Distances are measured in metres: coordinates in WGS 1984 or Web Mercator
+### are projected to the UTM zone at their centre first.
+###
+### This script was designed to work with ArcGIS 10.4/10.5 and Python 2.7.10,
+### and also runs under Python 3.  It needs NumPy but does not require arcpy.
+
+###
+### import modules
+###
+
+import numpy as np
+import Projection
+
+###
+### Script Follows
+###
+
+# WKIDs of Web Mercator, whose metres are stretched away from the equator
+WebMercatorWkids = (3857, 102100, 102113)
+
+
+def MetricCoordinates(X, Y, Wkid):
+    '''
+    Function that returns coordinates in metres for measuring the cluster
+    radius.  WGS 1984 and Web Mercator points are projected to the UTM zone
+    at their centre, other coordinate systems are returned as they are.
+    '''
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    Wkid = int(Wkid or 0)
+    if Wkid in WebMercatorWkids:
+        X, Y = Projection.InverseWebMercator(X, Y)
+    elif Wkid != 4326:
+        return X, Y
+    if len(X) == 0:
+        return X, Y
+    Zone, North = Projection.UTMZone(X.mean(), Y.mean())
+    return Projection.UTM(X, Y, Zone, North)
+
+
+def ClusterDetections(X, Y, Scores, Radius, Threshold=0.0):
+    '''
+    Function that clusters the detections whose score is above 0 and at
+    least the threshold.  X and Y are in metres (see MetricCoordinates).
+    Returns the cluster number of every detection (-1 for the ones below
+    the threshold) and the index of the seed, the best detection, of each
+    cluster.  Clusters are numbered from the best seed down.
+    '''
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    Scores = np.asarray(Scores, dtype=np.float64)
+    Radius = float(Radius)
+    if Radius <= 0:
+        raise ValueError('The cluster radius must be greater than 0')
+    Labels = np.full(len(X), -1, dtype=np.int64)
+    Sightings = np.flatnonzero((Scores > 0) & (Scores >= (Threshold or 0.0)))
+    if len(Sightings) == 0:
+        return Labels, np.zeros(0, dtype=np.int64)
+    # Hash the sightings into cells the size of the radius, sorted by cell
+    Column = np.floor((X[Sightings] - X[Sightings].min()) / Radius).astype(np.int64)
+    Row = np.floor((Y[Sightings] - Y[Sightings].min()) / Radius).astype(np.int64)
+    # A spare row above and below so the neighbours of a cell never wrap onto another column
+    Rows = int(Row.max()) + 3
+    Cells = (Column + 1) * Rows + Row + 1
+    Order = np.argsort(Cells, kind='mergesort')
+    CellIDs, Starts = np.unique(Cells[Order], return_index=True)
+    Stops = np.append(Starts[1:], len(Order))
+    Members = Sightings[Order]
+    Neighbours = np.array([DX * Rows + DY for DX in (-1, 0, 1) for DY in (-1, 0, 1)], dtype=np.int64)
+    CellOf = dict(zip(Sightings.tolist(), Cells.tolist()))
+    Free = np.zeros(len(X), dtype=bool)
+    Free[Sightings] = True
+    Seeds = []
+    RadiusSquared = Radius * Radius
+    # Best score first, ties in the order the detections were read
+    for Seed in Sightings[np.argsort(-Scores[Sightings], kind='mergesort')].tolist():
+        if not Free[Seed]:
+            continue
+        Nearby = CellOf[Seed] + Neighbours
+        Positions = np.searchsorted(CellIDs, Nearby)
+        Found = Positions[Positions < len(CellIDs)]
+        Found = Found[CellIDs[Found] == Nearby[Positions < len(CellIDs)]]
+        Candidates = np.concatenate([Members[Starts[Position]:Stops[Position]] for Position in Found.tolist()])
+        Candidates = Candidates[Free[Candidates]]
+        Close = Candidates[(X[Candidates] - X[Seed]) ** 2 + (Y[Candidates] - Y[Seed]) ** 2 <= RadiusSquared]
+        Labels[Close] = len(Seeds)
+        Free[Close] = False
+        Seeds.append(Seed)
+    return Labels, np.array(Seeds, dtype=np.int64)
+
+
+def ClusterSummary(Labels, Seeds, X, Y, Scores):
+    '''
+    Function that returns a dictionary of arrays with one value per cluster:
+    the number of photos (Photos), the highest and mean score (MaxScore,
+    MeanScore) and the centre of the photos (X, Y, in the coordinates given).
+    '''
+    Clustered = np.flatnonzero(Labels >= 0)
+    Count = len(Seeds)
+    Photos = np.bincount(Labels[Clustered], minlength=Count)
+    Divisor = np.maximum(Photos, 1)
+
+    def Mean(Values):
+        return np.bincount(Labels[Clustered], np.asarray(Values, dtype=np.float64)[Clustered], Count) / Divisor
+
+    return {'Photos': Photos, 'MaxScore': np.asarray(Scores, dtype=np.float64)[Seeds],
+            'MeanScore': Mean(Scores), 'X': Mean(X), 'Y': Mean(Y)}
@@ -5,9 +5,8 @@
 ### Description: This script compares the location of Mapillary photos containing
 ### a certain object class to the nearest object in a known dataset.  For example
 ### Mapillary photos containing fire hydrants can be compared against a city managed
-### dataset of fire hydrants.  If the known dataset is line feature class the segments
-### are converted to points at a user defined distance to allow for a comparison
-### between the Mapillary points and the known features.
+### dataset of fire hydrants.  If the known dataset is line feature class the distance
+### is measured to the closest point of the nearest line segment.
 ###
 ### This script was designed to work with ArcGIS 10.4/10.5 and Python 2.7.10,
 ### the script may or may not work with other versions ArcGIS and will need to be
@@ -22,6 +21,10 @@ import arcpy
 import os
 import sys
 import shutil
+import numpy as np
+import WriteBack
+import FeatureArrays
+import Instrumentation
 
 ###
 ### Parameters
@@ -31,10 +34,13 @@ import shutil
 FcKnown = arcpy.GetParameterAsText(0)
 # Type of Known feature class, either line if True or point if false
 LineFeatureClass = arcpy.GetParameterAsText(1)
-# Distance at which points will be created along each line segment
+# No longer used, lines are measured by segment instead of converted to points
 PointDistance = arcpy.GetParameterAsText(2)
 # Shapefile of Mapillary photo locations of the object class
 FcMapillary = arcpy.GetParameterAsText(3)
+# Optional output table, when set the distances are calculated in memory and written
+# to this table, leaving both input feature classes untouched
+OutputTable = arcpy.GetParameterAsText(4)
 
 
 ###
@@ -49,23 +55,71 @@ arcpy.env.overwriteOutput = True
 ### Script Follows
 ###
 
-def main(FcKnown, FcMapillary, LineFeatureClass, Distance):
+def main(FcKnown, FcMapillary, LineFeatureClass, Distance=None, OutputTable=''):
+    # Distance (the point spacing along lines) is no longer used, it keeps its place so older
+    # callers that pass it still work, and OutputTable has to be given after it or by name
+    if OutputTable:
+        InMemoryDistance(FcKnown, FcMapillary, LineFeatureClass, OutputTable)
+        return
     arcpy.AddMessage('Creating temporary working directory')
+    Instrumentation.Next('CreateTempDirectory')
     TempPath = sys.path[0] + r"\tempDistance"
     CreateTempDirectory(TempPath)
     arcpy.AddMessage('Preparing the shapefiles for analysis')
-    FcKnownAnalysis = PrepFeatureClasses(FcKnown, FcMapillary, LineFeatureClass, TempPath, Distance)
-    ListKnown = []
+    Instrumentation.Next('PrepFeatureClasses')
+    FcKnownAnalysis = PrepFeatureClasses(FcKnown, FcMapillary, LineFeatureClass, TempPath)
     ListMapillary = []
+    arcpy.AddMessage('Indexing the known features')
+    Instrumentation.Next('ReadKnownIndex')
+    KnownIndex = FeatureArrays.ReadKnownIndex(FcKnownAnalysis, None, LineFeatureClass == 'true')
     arcpy.AddMessage('Searching through the feature classes for X and Y values')
-    SearchCursor(FcKnownAnalysis, ["POINT_X","POINT_Y"], ListKnown)
+    Instrumentation.Next('SearchCursor')
     SearchCursor(FcMapillary, ["POINT_X","POINT_Y", 'Key'], ListMapillary)
-    arcpy.AddMessage('Calculating the shortest distance between each Mapillary point and known points')
-    CalculateShortestDistance(ListMapillary, ListKnown)
+    arcpy.AddMessage('Calculating the shortest distance between each Mapillary point and known features')
+    Instrumentation.Next('CalculateShortestDistance', len(ListMapillary))
+    CalculateShortestDistance(ListMapillary, KnownIndex)
     arcpy.AddMessage('Inserting the shortest distance values into the Mapillary feature class')
-    InsertDistanceValues(ListMapillary)
+    Stage = Instrumentation.Next('InsertDistanceValues')
+    Stage.Rows = InsertDistanceValues(ListMapillary)
     arcpy.AddMessage('Script finished successfully')
 
+def InMemoryDistance(FcKnown, FcMapillary, LineFeatureClass, OutputTable):
+    '''
+    Function that calculates the distances without any temporary files.  The
+    known features are projected to the spatial reference of the Mapillary
+    feature class as they are read, both feature classes are only read and
+    the keys, distances and known feature IDs are written to a single new
+    table at the end, so several runs can take place at the same time.
+    '''
+    arcpy.AddMessage('Indexing the known features')
+    Instrumentation.Next('ReadKnownIndex')
+    MapillarySpatialRef = arcpy.Describe(FcMapillary).spatialReference
+    KnownIndex = FeatureArrays.ReadKnownIndex(FcKnown, MapillarySpatialRef, LineFeatureClass == 'true')
+    arcpy.AddMessage('Reading the Mapillary points')
+    Instrumentation.Next('ReadPoints')
+    X, Y, Values = FeatureArrays.ReadPoints(FcMapillary, ['Key'])
+    arcpy.AddMessage('Calculating the shortest distance between each Mapillary point and known features')
+    Instrumentation.Next('Query', len(X))
+    Distances, IDs = KnownIndex.Query(X, Y)
+    arcpy.AddMessage('Writing the shortest distance values to ' + OutputTable)
+    Instrumentation.Next('WriteDistanceTable', len(X))
+    WriteDistanceTable(OutputTable, [Value[0] for Value in Values], Distances, IDs)
+    arcpy.AddMessage('Script finished successfully')
+
+def WriteDistanceTable(OutputTable, Keys, Distances, IDs):
+    '''
+    Function that writes the key of each Mapillary point, the distance to the
+    closest known feature and the ID of that feature to a new table in one step.
+    '''
+    KeyLength = max([len(Key) for Key in Keys] + [1])
+    Table = np.zeros(len(Keys), dtype=[('Key', 'U' + str(KeyLength)), ('Distance', np.float64), ('NearFID', np.int32)])
+    Table['Key'] = Keys
+    Table['Distance'] = Distances
+    Table['NearFID'] = IDs
+    if arcpy.Exists(OutputTable):
+        arcpy.Delete_management(OutputTable)
+    arcpy.da.NumPyArrayToTable(Table, OutputTable)
+
 def CreateTempDirectory(Path):
     '''
     Function that creates a temporary working directory for the files
@@ -77,32 +131,21 @@ def CreateTempDirectory(Path):
         shutil.rmtree(Path)
     os.makedirs(Path)
 
-def PrepFeatureClasses(FcKnown, FcMapillary, LineFeatureClass, tempPath, Distance):
+def PrepFeatureClasses(FcKnown, FcMapillary, LineFeatureClass, tempPath):
     '''
     Function that takes two input feature classes, the boolean is line type
-    and the path to the temporary working folder.  If the known feature class
-    contains lines a new feature class is created with points at a set distance.
-    The spatial reference of the known feature class is also set to the same
-    spatial reference as the Mapillary feature class.
+    and the path to the temporary working folder.  The spatial reference of the
+    known feature class is set to the same spatial reference as the Mapillary
+    feature class.  Lines are used as they are, the distance to them is measured
+    by segment.
     '''
     arcpy.AddXY_management(FcMapillary)
     MapillarySpatialRef = arcpy.Describe(FcMapillary).spatialReference
     FcKnownProjected = tempPath + r'\KnownProjected.shp'
     arcpy.Project_management(FcKnown, FcKnownProjected, MapillarySpatialRef)
     arcpy.AddMessage(LineFeatureClass)
-    # If the known feature class contains lines create a new point feature class
-    if LineFeatureClass == 'true':
-        FcKnownPointProjected = tempPath + r'\KnowProjectedPoints.shp'
-        arcpy.GeneratePointsAlongLines_management(FcKnownProjected, FcKnownPointProjected, "DISTANCE", Distance)
-        arcpy.AddXY_management(FcKnownPointProjected)
-        # Return the new point feature class for analysis
-        arcpy.AddMessage(FcKnownPointProjected)
-        return FcKnownPointProjected
-    # If the known feature class contains points then add the X,Y values and return the same feature class
-    else:
-        arcpy.AddXY_management(FcKnownProjected)
-        arcpy.AddMessage(FcKnownProjected)
-        return FcKnownProjected
+    arcpy.AddMessage(FcKnownProjected)
+    return FcKnownProjected
 
 def SearchCursor(FeatureClass, Fields, OutList):
     '''
@@ -120,48 +163,36 @@ def SearchCursor(FeatureClass, Fields, OutList):
                 TempList.append(Item)
             OutList.append(TempList)
 
-def CalculateShortestDistance(MapillaryList, KnownList):
+def CalculateShortestDistance(MapillaryList, KnownIndex):
     '''
-    Function that takes two input lists containing X,Y values and calculates
-    the distance between each Mapillary point and the nearest known point.
-    The shortest distance is added to each row of the Mapillary list.
+    Function that takes an input list containing X,Y values and the grid spatial
+    index of the known features and calculates the distance between each Mapillary
+    point and the nearest known point or line segment.  The shortest distance and
+    the ID of the closest known feature are added to each row of the Mapillary list.
     '''
-    for MapillaryPoint in MapillaryList:
-        # set an arbitrarily high number for the minimum distance at the start of each row
-        MinDistance = 99999999
-        for KnownPoint in KnownList:
-            # find the distance between the points 
-            Xdistance = math.pow((MapillaryPoint[0]-KnownPoint[0]),2)
-            Ydistance = math.pow((MapillaryPoint[1]-KnownPoint[1]),2)
-            Sum = Ydistance + Xdistance
-            Distance = math.sqrt(Sum)
-            # compare this distance to the previous minimum and if less than update the minimum distance value
-            # if the new value is higher than pass
-            if Distance < MinDistance:
-                MinDistance = Distance
-            else:
-                pass
-        MapillaryPoint.append(MinDistance)
+    Distances, IDs = KnownIndex.Query([Point[0] for Point in MapillaryList],
+                                      [Point[1] for Point in MapillaryList])
+    for MapillaryPoint, MinDistance, KnownID in zip(MapillaryList, Distances, IDs):
+        MapillaryPoint.append(float(MinDistance))
+        MapillaryPoint.append(int(KnownID))
 
 def InsertDistanceValues(MapillaryList):
     '''
     Function that takes the updated Mapillary list from the calculate shortest distance
-    function and inserts the new distance value into a new distance field.  The insert
-    cursor compares the key values between the feature class and list to find a match
-    then inserts the list distance value into the distance field
+    function and inserts the new distance value into a new distance field and the ID of
+    the closest known feature into a NearFID field.  The list is indexed by key so the
+    update cursor reads each row of the feature class once, finds its match with a
+    single dictionary lookup and updates the row once.  Returns the number of
+    rows updated.
     '''
-    arcpy.AddField_management(FcMapillary, 'Distance', "DOUBLE")
-    with arcpy.da.UpdateCursor(FcMapillary, ["Key", "Distance"]) as Cursor:
-        for Row in Cursor:
-            for Item in MapillaryList:
-                if Row[0] == Item[2]:
-                    Row[1] = Item[3]
-                    Cursor.updateRow(Row)
-                else:
-                    pass
-    del Cursor
+    Table = WriteBack.ArcpyTable(FcMapillary)
+    Table.AddFields([('Distance', "DOUBLE"), ('NearFID', "LONG")])
+    Lookup = WriteBack.IndexRows(MapillaryList, 2, [3, 4])
+    return WriteBack.UpdateByKey(Table, "Key", ["Distance", "NearFID"], Lookup)
 
 if __name__ == "__main__":
-    main(FcKnown, FcMapillary, LineFeatureClass, PointDistance)
+    # Stage timings are reported at the end and written as JSON when MAPILLARY_TRACE is set
+    with Instrumentation.StartTrace('Distance', Message=arcpy.AddMessage):
+        main(FcKnown, FcMapillary, LineFeatureClass, PointDistance, OutputTable=OutputTable)
 
 
@@ -0,0 +1,99 @@
+### Description: Batch version of the Image to Object Distance Calculation.  A
+### manifest lists pairs of Mapillary feature classes and the known datasets
+### they should be compared against (for example hydrant photos against the
+### city hydrant dataset and bench photos against the city benches).  The
+### feature classes are read and written one after another with arcpy while
+### the nearest neighbour searches of up to one pair per worker run in threads
+### (see DistancePairs.py).  Each known dataset is read and projected in
+### memory and indexed only once, however many pairs use it.  The distance to
+### the closest known object and its ID are written to each Mapillary feature
+### class like Distance.py does.
+###
+### The columns of the CSV manifest are described in DistancePairs.py.
+###
+### This script was designed to work with ArcGIS 10.4/10.5 and Python 2.7.10,
+### the script may or may not work with other versions ArcGIS and will need to be
+### refactored to work with newer versions of Python (if/when arcpy is updated to
+### work with newer Python versions).
+
+###
+### import modules
+###
+
+import arcpy
+import DistancePairs
+import FeatureArrays
+import Instrumentation
+import WriteBack
+
+###
+### Parameters
+###
+
+# CSV manifest of Mapillary and known feature class pairs
+ManifestPath = arcpy.GetParameterAsText(0)
+# Optional number of pairs searched at the same time (defaults to the number of CPUs)
+Workers = arcpy.GetParameterAsText(1)
+
+###
+### Set work environment
+###
+
+arcpy.env.overwriteOutput = True
+
+###
+### Script Follows
+###
+
+def main(Manifest, WorkerCount):
+    arcpy.AddMessage('Reading the manifest')
+    Pairs = DistancePairs.ReadManifest(Manifest)
+    Instrumentation.Next('DescribeInputs', len(Pairs))
+    SpatialRefs = {}
+    Jobs = []
+    for Pair in Pairs:
+        if Pair['Mapillary'] not in SpatialRefs:
+            SpatialRefs[Pair['Mapillary']] = arcpy.Describe(Pair['Mapillary']).spatialReference
+        # A known dataset is indexed once for each spatial reference it is compared in
+        Jobs.append((Pair, (Pair['Known'], Pair['Line'], SpatialRefs[Pair['Mapillary']].exportToString())))
+    arcpy.AddMessage('Calculating the shortest distances of ' + str(len(Pairs)) + ' pairs')
+    Stage = Instrumentation.Next('ComparePairs', 0)
+    ReadIndex = lambda Pair: KnownIndex(Pair, SpatialRefs[Pair['Mapillary']])
+    # arcpy is only called from this thread, the workers run the searches
+    for Pair, Updated in DistancePairs.RunPairs(Jobs, ReadIndex, MapillaryPoints, InsertDistanceValues,
+                                                int(WorkerCount) if WorkerCount else None):
+        arcpy.AddMessage(Pair['Mapillary'] + ': ' + str(Updated) + ' rows updated')
+        Stage.Rows += Updated
+    arcpy.AddMessage('Script finished successfully')
+
+def KnownIndex(Pair, SpatialRef):
+    '''
+    Function that reads a pair's known dataset in the spatial reference of
+    its Mapillary feature class and returns its spatial index.
+    '''
+    arcpy.AddMessage('Indexing ' + Pair['Known'])
+    return FeatureArrays.ReadKnownIndex(Pair['Known'], SpatialRef, Pair['Line'])
+
+def MapillaryPoints(Pair):
+    '''
+    Function that returns the X and Y arrays and the photo keys of the points
+    of a pair's Mapillary feature class.
+    '''
+    X, Y, Values = FeatureArrays.ReadPoints(Pair['Mapillary'], ["Key"])
+    return X, Y, [Value[0] for Value in Values]
+
+def InsertDistanceValues(Pair, Keys, Distances, IDs):
+    '''
+    Function that writes the distances and known feature IDs of one pair
+    into its Mapillary feature class, joined on the photo key.  Returns the
+    number of rows updated.
+    '''
+    Table = WriteBack.ArcpyTable(Pair['Mapillary'])
+    Table.AddFields([(Pair['DistanceField'], "DOUBLE"), (Pair['IDField'], "LONG")])
+    Lookup = dict((Key, (float(Distance), int(ID))) for Key, Distance, ID in zip(Keys, Distances, IDs))
+    return WriteBack.UpdateByKey(Table, "Key", [Pair['DistanceField'], Pair['IDField']], Lookup)
+
+if __name__ == "__main__":
+    # Stage timings are reported at the end and written as JSON when MAPILLARY_TRACE is set
+    with Instrumentation.StartTrace('DistanceBatch', Message=arcpy.AddMessage):
+        main(ManifestPath, Workers)
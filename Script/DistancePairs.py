@@ -0,0 +1,114 @@
+### Description: Runs the pairs of the batch Image to Object Distance Calculation
+### (DistanceBatch.py).  arcpy is not thread-safe, so every read of a feature
+### class and every write-back happens one after another on the calling
+### thread and only the nearest neighbour searches (NumPy) are handed to a
+### pool of threads.  At most one pair per worker is searched or waiting to be
+### written, so only the points of those pairs are held in memory.  Each known
+### index is read once, however many pairs use it, and dropped once the last
+### pair that uses it has been searched.
+###
+### The manifest is a CSV file with a header row and the columns:
+###     Mapillary         path of the Mapillary feature class
+###     Known             path of the known feature class
+###     LineFeatureClass  true if the known feature class contains lines
+###     DistanceField     optional, name of the distance field (Distance)
+###     IDField           optional, name of the known feature ID field (NearFID)
+###
+### This script was designed to work with ArcGIS 10.4/10.5 and Python 2.7.10,
+### and also runs under Python 3.  It does not require arcpy, the tool passes
+### in the functions that read and write the feature classes.
+
+###
+### import modules
+###
+
+import collections
+import csv
+import multiprocessing
+import multiprocessing.pool
+
+###
+### Script Follows
+###
+
+
+def ReadManifest(Path):
+    '''
+    Function that reads the CSV manifest and returns a list of dictionaries,
+    one per pair, with the optional columns filled with their defaults.
+    '''
+    Pairs = []
+    with open(Path) as Manifest:
+        for Row in csv.DictReader(Manifest):
+            Pairs.append({'Mapillary': Row['Mapillary'].strip(),
+                          'Known': Row['Known'].strip(),
+                          'Line': (Row.get('LineFeatureClass') or '').strip().lower() == 'true',
+                          'DistanceField': (Row.get('DistanceField') or 'Distance').strip(),
+                          'IDField': (Row.get('IDField') or 'NearFID').strip()})
+    return Pairs
+
+
+class KnownIndexes(object):
+    '''
+    Spatial indexes of the known datasets, keyed by anything that tells them
+    apart (the tool uses the dataset, the line flag and the spatial reference).
+    An index is read by the first pair that needs it and dropped when the last
+    of the pairs counted for its key releases it.
+    '''
+
+    def __init__(self, CacheKeys):
+        self.Indexes = {}
+        self.Uses = collections.Counter(CacheKeys)
+
+    def Acquire(self, CacheKey, ReadIndex):
+        if CacheKey not in self.Indexes:
+            self.Indexes[CacheKey] = ReadIndex()
+        return self.Indexes[CacheKey]
+
+    def Release(self, CacheKey):
+        self.Uses[CacheKey] -= 1
+        if not self.Uses[CacheKey]:
+            self.Indexes.pop(CacheKey, None)
+
+
+def RunPairs(Jobs, ReadIndex, ReadPoints, WriteResults, Workers=None):
+    '''
+    Generator that compares every pair and yields each pair with the number
+    of rows written, in the order the pairs finish.  Jobs is a list of (pair,
+    cache key) tuples; ReadIndex(pair) returns the known index of a pair,
+    ReadPoints(pair) the X and Y arrays and keys of its Mapillary points and
+    WriteResults(pair, keys, distances, IDs) writes them back and returns the
+    number of rows updated.  The three are only called on the calling thread.
+    The pairs are run grouped by cache key so an index can be dropped early.
+    '''
+    Jobs = sorted(Jobs, key=lambda Job: Job[1])
+    Indexes = KnownIndexes(CacheKey for Pair, CacheKey in Jobs)
+    Workers = Workers or multiprocessing.cpu_count()
+    Pool = multiprocessing.pool.ThreadPool(Workers)
+    Pending = collections.deque()
+    try:
+        for Pair, CacheKey in Jobs:
+            Index = Indexes.Acquire(CacheKey, lambda: ReadIndex(Pair))
+            X, Y, Keys = ReadPoints(Pair)
+            Pending.append((Pair, CacheKey, Keys, Pool.apply_async(Index.Query, (X, Y))))
+            del Index, X, Y
+            if len(Pending) >= Workers:
+                yield FinishPair(Pending.popleft(), Indexes, WriteResults)
+        while Pending:
+            yield FinishPair(Pending.popleft(), Indexes, WriteResults)
+    finally:
+        Pool.terminate()
+        Pool.join()
+
+
+def FinishPair(Search, Indexes, WriteResults):
+    '''
+    Function that waits for the search of one pair, releases its known index
+    and writes the results.  Returns the pair and the number of rows updated.
+    '''
+    Pair, CacheKey, Keys, Result = Search
+    try:
+        Distances, IDs = Result.get()
+    finally:
+        Indexes.Release(CacheKey)
+    return Pair, WriteResults(Pair, Keys, Distances, IDs)
@@ -0,0 +1,95 @@
+### Description: Reads ArcGIS feature classes into the coordinate arrays used by
+### the array based Mapillary tools.  The geometries are projected while they
+### are read (the spatial_reference option of the arcpy.da cursors) and lines
+### are split into segments in memory, so no projected or converted copy of a
+### feature class has to be written to disk.
+###
+### This script was designed to work with ArcGIS 10.4/10.5 and Python 2.7.10.
+
+###
+### import modules
+###
+
+import arcpy
+import numpy as np
+import Geometry
+import SpatialIndex
+
+###
+### Script Follows
+###
+
+def ReadPoints(FeatureClass, Fields=(), SpatialReference=None):
+    '''
+    Function that reads the X and Y of every point in a feature class,
+    projected to the spatial reference when one is given, along with the
+    values of any extra fields.  Empty geometries are skipped.  Returns the
+    X and Y arrays and a list of tuples of field values.
+    '''
+    X = []
+    Y = []
+    Values = []
+    with arcpy.da.SearchCursor(FeatureClass, ["SHAPE@XY"] + list(Fields), spatial_reference=SpatialReference) as Cursor:
+        for Row in Cursor:
+            # An empty point reads as None or as NaN coordinates
+            if Row[0] is None or None in Row[0] or Row[0][0] != Row[0][0] or Row[0][1] != Row[0][1]:
+                continue
+            X.append(Row[0][0])
+            Y.append(Row[0][1])
+            Values.append(Row[1:])
+    return np.array(X, dtype=np.float64), np.array(Y, dtype=np.float64), Values
+
+
+def ReadPaths(FeatureClass, SpatialReference=None):
+    '''
+    Function that reads the parts of every line (or polygon outline) in a
+    feature class.  Returns a list of vertex arrays and a list with the
+    object ID of the feature each part belongs to.
+    '''
+    Paths = []
+    IDs = []
+    with arcpy.da.SearchCursor(FeatureClass, ["OID@", "SHAPE@"], spatial_reference=SpatialReference) as Cursor:
+        for ID, Shape in Cursor:
+            if Shape is None:
+                continue
+            for Part in Shape:
+                Path = []
+                for Point in Part:
+                    # A None point separates the inner rings of a polygon part
+                    if Point is None:
+                        Paths.append(np.array(Path, dtype=np.float64).reshape(-1, 2))
+                        IDs.append(ID)
+                        Path = []
+                    else:
+                        Path.append((Point.X, Point.Y))
+                Paths.append(np.array(Path, dtype=np.float64).reshape(-1, 2))
+                IDs.append(ID)
+    return Paths, IDs
+
+
+def ReadSegments(FeatureClass, SpatialReference=None):
+    '''
+    Function that reads every line (or polygon outline) in a feature class as
+    line segments.  Returns the start X, start Y, end X, end Y and object ID
+    arrays of the segments.
+    '''
+    Paths, IDs = ReadPaths(FeatureClass, SpatialReference)
+    return Geometry.Segments(Paths, IDs)
+
+
+def ReadKnownIndex(FeatureClass, SpatialReference, LineFeatureClass):
+    '''
+    Function that reads a known dataset in the given spatial reference and
+    returns its spatial index.  Lines are indexed by segment so distances are
+    measured to the closest point of each line, points by location.  The
+    IDs returned by the index are the object IDs of the known features.
+    '''
+    if LineFeatureClass:
+        X0, Y0, X1, Y1, IDs = ReadSegments(FeatureClass, SpatialReference)
+        if X0.size == 0:
+            raise ValueError(FeatureClass + ' does not contain any lines')
+        return SpatialIndex.NearestSegmentIndex(X0, Y0, X1, Y1, IDs)
+    X, Y, Values = ReadPoints(FeatureClass, ["OID@"], SpatialReference)
+    if X.size == 0:
+        raise ValueError(FeatureClass + ' does not contain any points')
+    return SpatialIndex.NearestIndex(X, Y, [Value[0] for Value in Values])
@@ -0,0 +1,216 @@
+### Description: Incremental reader for Mapillary GeoJSON exports.  Instead of
+### loading the whole FeatureCollection with json.load, the file is read in
+### chunks and each feature of the "features" array is decoded on its own and
+### yielded before the next one is read.  Memory use is bounded by the chunk
+### size and the largest single feature, not by the size of the file.
+###
+### This script was designed to work with ArcGIS 10.4/10.5 and Python 2.7.10,
+### and also runs under Python 3.  It does not require arcpy.
+
+###
+### import modules
+###
+
+import io
+import json
+
+###
+### Script Follows
+###
+
+# Number of characters read from the file at a time
+DefaultChunkSize = 1 << 16
+
+Whitespace = ' \t\n\r'
+
+
+def IterFeatures(FilePath, ChunkSize=DefaultChunkSize):
+    '''
+    Generator that yields the feature dictionaries of a GeoJSON
+    FeatureCollection one at a time.  Top level members other than
+    "features" are decoded and skipped.
+    '''
+    with io.open(FilePath, 'r', encoding='utf-8') as RawData:
+        Stream = _Stream(RawData, ChunkSize)
+        Stream.Expect('{')
+        while True:
+            if Stream.Peek() == '}':
+                return
+            Name = Stream.Decode()
+            Stream.Expect(':')
+            if Name == 'features':
+                Stream.Expect('[')
+                if Stream.Peek() == ']':
+                    Stream.Position += 1
+                else:
+                    while True:
+                        yield Stream.Decode()
+                        if Stream.Next() == ']':
+                            break
+            else:
+                Stream.Decode()
+            if Stream.Next() == '}':
+                return
+
+
+def ExtractFeatures(FilePath, ObjectKey, ChunkSize=DefaultChunkSize, Default=0.0):
+    '''
+    Generator that yields the photo key, the value for the object class key
+    and the coordinates of each feature in a Mapillary GeoJSON file.  Mapillary
+    leaves out the classes that were not found in a photo, so a feature without
+    the object class key gets the default value instead of raising KeyError.
+    '''
+    return FeatureRows(IterFeatures(FilePath, ChunkSize), ObjectKey, Default)
+
+
+def ExtractClasses(FilePath, ObjectKeys=None, Threshold=None, ChunkSize=DefaultChunkSize):
+    '''
+    Generator that reads a Mapillary GeoJSON file once and yields the photo
+    key, a dictionary of object class values and the coordinates of each
+    feature.  When a list of object class keys is given only those classes
+    are returned, otherwise every class in the feature is.  Values below the
+    threshold are left out of the dictionary, as are classes the feature
+    does not have.
+    '''
+    return ClassRows(IterFeatures(FilePath, ChunkSize), ObjectKeys, Threshold)
+
+
+def FeatureRows(Features, ObjectKey, Default=0.0):
+    '''
+    Generator that turns feature dictionaries from any source into the rows
+    of ExtractFeatures.
+    '''
+    for Feature in Features:
+        Properties = Feature['properties']
+        yield (Properties['key'], Properties.get(ObjectKey, Default), Feature['geometry']['coordinates'])
+
+
+def ClassRows(Features, ObjectKeys=None, Threshold=None):
+    '''
+    Generator that turns feature dictionaries from any source into the rows
+    of ExtractClasses.
+    '''
+    for Feature in Features:
+        Properties = Feature['properties']
+        if ObjectKeys is None:
+            Classes = dict((Name, Value) for Name, Value in Properties.items() if Name != 'key')
+        else:
+            Classes = dict((Name, Properties[Name]) for Name in ObjectKeys if Name in Properties)
+        if Threshold is not None:
+            Classes = dict((Name, Value) for Name, Value in Classes.items() if Value >= Threshold)
+        yield (Properties['key'], Classes, Feature['geometry']['coordinates'])
+
+
+class FileSource(object):
+    '''
+    Reads the rows of a GeoJSON file with the functions above.  It has the
+    same ExtractFeatures and ExtractClasses methods as the detection cache so
+    the tools can read from either one.
+    '''
+
+    def __init__(self, FilePath):
+        self.FilePath = FilePath
+
+    def ExtractFeatures(self, ObjectKey, Default=0.0):
+        return ExtractFeatures(self.FilePath, ObjectKey, Default=Default)
+
+    def ExtractClasses(self, ObjectKeys=None, Threshold=None):
+        return ExtractClasses(self.FilePath, ObjectKeys, Threshold)
+
+
+def ClassFieldName(ObjectKey, UsedNames=(), MaxLength=10):
+    '''
+    Function that turns an object class key such as construction--flat--bike-lane
+    into a field name that is valid in a shapefile (bike_lane).  The last part
+    of the key is used, cut to the shapefile limit of ten characters and given
+    a number when it clashes with a name that is already in use.
+    '''
+    Name = ObjectKey.split('--')[-1]
+    Name = ''.join(Character if Character.isalnum() else '_' for Character in Name)
+    if not Name or not Name[0].isalpha():
+        Name = 'C' + Name
+    Name = Name[:MaxLength]
+    Used = [Existing.lower() for Existing in UsedNames]
+    Candidate = Name
+    Number = 1
+    while Candidate.lower() in Used:
+        Suffix = str(Number)
+        Candidate = Name[:MaxLength - len(Suffix)] + Suffix
+        Number += 1
+    return Candidate
+
+
+class _Stream(object):
+    '''
+    Character buffer over an open file that refills itself as values are
+    decoded.  Text that has already been decoded is dropped from the buffer.
+    '''
+
+    def __init__(self, File, ChunkSize):
+        self.File = File
+        self.ChunkSize = ChunkSize
+        self.Buffer = u''
+        self.Position = 0
+        self.Finished = False
+        self.Decoder = json.JSONDecoder()
+
+    def _Read(self, Size):
+        '''
+        Appends more of the file to the buffer, returns False at the end of the file.
+        '''
+        if self.Finished:
+            return False
+        Text = self.File.read(Size)
+        if not Text:
+            self.Finished = True
+            return False
+        self.Buffer = self.Buffer[self.Position:] + Text
+        self.Position = 0
+        return True
+
+    def Peek(self):
+        '''
+        Returns the next character that is not whitespace without consuming it.
+        '''
+        while True:
+            while self.Position < len(self.Buffer) and self.Buffer[self.Position] in Whitespace:
+                self.Position += 1
+            if self.Position < len(self.Buffer):
+                return self.Buffer[self.Position]
+            if not self._Read(self.ChunkSize):
+                raise ValueError('Unexpected end of the GeoJSON file')
+
+    def Next(self):
+        '''
+        Consumes and returns the next character that is not whitespace.
+        '''
+        Character = self.Peek()
+        self.Position += 1
+        return Character
+
+    def Expect(self, Character):
+        Found = self.Next()
+        if Found != Character:
+            raise ValueError('Expected "%s" in the GeoJSON file but found "%s"' % (Character, Found))
+
+    def Decode(self):
+        '''
+        Decodes the JSON value that starts at the next character.  A value
+        that runs to the end of the buffer might be cut short, so more of the
+        file is read (in growing amounts) until the value ends before the end
+        of the buffer or the file is finished.
+        '''
+        self.Peek()
+        Size = self.ChunkSize
+        while True:
+            try:
+                Value, End = self.Decoder.raw_decode(self.Buffer, self.Position)
+                if End < len(self.Buffer) or self.Finished:
+                    self.Position = End
+                    return Value
+            except ValueError:
+                if self.Finished:
+                    raise
+            if not self._Read(Size):
+                continue
+            Size *= 2
@@ -20,6 +20,17 @@
 
 import arcpy
 import json
+import numpy as np
+import os
+import sys
+import tempfile
+import BulkWriter
+import DeltaImport
+import DetectionCache
+import DetectionClusters
+import GeoJSONReader
+import Instrumentation
+import Projection
 
 ###
 ### Parameters
@@ -35,8 +46,34 @@ FcField = arcpy.GetParameterAsText(2)
 FcSR = arcpy.GetParameterAsText(3)
 # Path to the GeoJSON dataset
 JsonPath = arcpy.GetParameterAsText(4)
-# Name of the object class dictionary key
+# Name of the object class dictionary key, several keys can be separated by semicolons
+# and ALL extracts every object class that reaches the threshold
 ObjectJsonName = arcpy.GetParameterAsText(5)
+# Optional minimum object class value, lower values are treated as if the class was not found
+ClassThreshold = arcpy.GetParameterAsText(6)
+# Optional layout when several object classes are extracted, WIDE (default) creates one
+# shapefile with a field per class and PER_CLASS creates one shapefile per class
+OutputLayout = arcpy.GetParameterAsText(7)
+# Optional, true to read the GeoJSON through the columnar detection cache (built beside the
+# GeoJSON file on the first run and reused until the file changes)
+UseCache = arcpy.GetParameterAsText(8)
+# Optional import mode, INCREMENTAL updates an output created by an earlier incremental run
+# with only the photos that are new or changed, blank (FULL) creates the output again
+ImportMode = arcpy.GetParameterAsText(9)
+# Optional, true to delete photos that are no longer in the GeoJSON file in incremental mode
+DeleteMissing = arcpy.GetParameterAsText(10)
+# Optional bounding box "XMin YMin XMax YMax" in longitude and latitude, when set the photos are
+# read from the Mapillary API instead of the GeoJSON file (needs Python 3, ArcGIS Pro)
+ApiExtent = arcpy.GetParameterAsText(11)
+# Optional Mapillary API client ID
+ApiClientID = arcpy.GetParameterAsText(12)
+# Optional API address, the Mapillary v3 images address by default
+ApiURL = arcpy.GetParameterAsText(13)
+# Optional radius in metres, when set repeated sightings of an object within the radius are
+# merged into one feature and the photos of each cluster are written to <name>_Members
+ClusterRadius = arcpy.GetParameterAsText(14)
+# Optional minimum object class value of a photo to be clustered, the threshold by default
+ClusterScore = arcpy.GetParameterAsText(15)
 
 ###
 ### Set work environment
@@ -52,60 +89,418 @@ arcpy.env.overwriteOutput = True
 ### Script Follows
 ###
 
-def main(OutFCLocation, FCName, ObjectFieldName, CoordinateSystem, RawDataFilePath, ObjectKey):
-    arcpy.AddMessage('Creating the new shapefile')
-    FeatureClassPath = CreateFeatureClass(OutFCLocation, FCName, ObjectFieldName)
-    arcpy.AddMessage('Extracting GeoJSON data')
-    DataList = ExtractData(RawDataFilePath, ObjectKey)
-    arcpy.AddMessage('Inserting GeoJSON data into the shapefile')
-    InsertFields = ['Key', ObjectFieldName, 'SHAPE@XY']
-    InsertData(FeatureClassPath, InsertFields, DataList)
-    arcpy.AddMessage('Projecting the shapefile in the desired coordinate system')
-    arcpy.Project_management(FeatureClassPath, OutFCLocation + r'\\' + FCName + r'_Projected.shp', CoordinateSystem)
+def main(OutFCLocation, FCName, ObjectFieldName, CoordinateSystem, RawDataFilePath, ObjectKey, Threshold='', Layout='',
+         UseCache='', ImportMode='', DeleteMissing='', ApiExtent='', ApiClientID='', ApiURL='', ClusterRadius='',
+         ClusterScore=''):
+    ObjectKeys = ParseObjectKeys(ObjectKey)
+    if Threshold:
+        Threshold = float(Threshold)
+    else:
+        Threshold = None
+    # Points are projected as they are extracted when the coordinate system is supported,
+    # otherwise the shapefiles are written in WGS 1984 and projected afterwards
+    SpatialRef = OutputSpatialReference(CoordinateSystem)
+    Incremental = ImportMode.upper() == 'INCREMENTAL'
+    if Incremental and (ObjectKeys is None or Layout.upper() == 'PER_CLASS'):
+        arcpy.AddWarning('Incremental imports need a single output with a known list of object classes, '
+                         'running a full import instead')
+        Incremental = False
+    Clustered = bool(ClusterRadius)
+    if Clustered and (Incremental or ObjectKeys is None or len(ObjectKeys) != 1 or Layout.upper() == 'PER_CLASS'):
+        arcpy.AddWarning('Sightings are only clustered in a full import of a single object class, '
+                         'writing every photo instead')
+        Clustered = False
+    # The source is opened once and read by whichever import runs
+    Source = OpenSource(RawDataFilePath, UseCache == 'true', ApiExtent, ApiClientID, ApiURL)
+    if Clustered:
+        arcpy.AddMessage('Clustering repeated sightings of the object class')
+        FeatureClassPaths = InsertClustered(OutFCLocation, FCName, ObjectFieldName, Source, ObjectKeys[0],
+                                            float(ClusterRadius), float(ClusterScore or Threshold or 0.0), SpatialRef)
+    elif Incremental:
+        arcpy.AddMessage('Importing the new and changed photos into the shapefile')
+        FeatureClassPaths = [ImportIncremental(OutFCLocation, FCName, ObjectFieldName, Source, ObjectKeys,
+                                               Threshold, SpatialRef, CoordinateSystem, DeleteMissing == 'true')]
+    elif ObjectKeys is not None and len(ObjectKeys) == 1 and Threshold is None and Layout.upper() != 'PER_CLASS':
+        arcpy.AddMessage('Creating the new shapefile')
+        with Instrumentation.Stage('CreateFeatureClass'):
+            Writer = CreateFeatureClass(OutFCLocation, FCName, ObjectFieldName, SpatialRef)
+        arcpy.AddMessage('Extracting GeoJSON data and inserting it into the shapefile')
+        InsertData(Writer, ExtractChunks(Source, ObjectKeys[0], Writer.Fields, SpatialRef))
+        FeatureClassPaths = [Writer.Path]
+    elif Layout.upper() == 'PER_CLASS':
+        arcpy.AddMessage('Extracting GeoJSON data into one shapefile per object class')
+        FeatureClassPaths = InsertPerClass(OutFCLocation, FCName, ObjectFieldName, Source, ObjectKeys, Threshold, SpatialRef)
+    else:
+        arcpy.AddMessage('Extracting GeoJSON data into one shapefile with a field per object class')
+        FeatureClassPaths = [InsertWide(OutFCLocation, FCName, ObjectFieldName, Source, ObjectKeys, Threshold, SpatialRef)]
+    # Incremental imports project their new and changed rows themselves
+    if SpatialRef is None and not Incremental:
+        ProjectFeatureClasses(OutFCLocation, FeatureClassPaths, CoordinateSystem)
     arcpy.AddMessage('Script finished successfully')
+
+def OutputSpatialReference(CoordinateSystem):
+    '''
+    Function that returns the output spatial reference when the points can be
+    projected to it while they are extracted (WGS 1984, Web Mercator or a WGS
+    1984 UTM zone) and None when the arcpy Project tool has to be used.
+    '''
+    SpatialRef = arcpy.SpatialReference()
+    SpatialRef.loadFromString(CoordinateSystem)
+    if Projection.IsSupported(SpatialRef.factoryCode):
+        return SpatialRef
+    return None
+
+def ProjectCoordinates(Rows, SpatialRef):
+    '''
+    Function that projects the coordinates (last item) of the extracted rows
+    from WGS 1984 to the output spatial reference in blocks of rows.
+    '''
+    if SpatialRef is None or SpatialRef.factoryCode == 4326:
+        return Rows
+    return Projection.ProjectRows(Rows, Projection.Transform(SpatialRef.factoryCode))
+
+def ProjectWithArcpy(Rows, SpatialRef):
+    '''
+    Function that projects the coordinates (last item) of a list of extracted
+    rows from WGS 1984 with arcpy, for the coordinate systems Projection does
+    not support.  Only used for the new and changed rows of an incremental
+    import, so the output is never projected again as a whole.
+    '''
+    WGS84 = arcpy.SpatialReference(4326)
+    Projected = []
+    for Row in Rows:
+        Point = arcpy.PointGeometry(arcpy.Point(*Row[-1]), WGS84).projectAs(SpatialRef).firstPoint
+        Projected.append(tuple(Row[:-1]) + ((Point.X, Point.Y),))
+    return Projected
+
+def ProjectFeatureClasses(OutFCLocation, FeatureClassPaths, CoordinateSystem):
+    '''
+    Function that writes a projected copy of each shapefile for coordinate
+    systems that can not be projected to while extracting the data.
+    '''
+    arcpy.AddMessage('Projecting the shapefile in the desired coordinate system')
+    with Instrumentation.Stage('ProjectFeatureClasses'):
+        for FeatureClassPath in FeatureClassPaths:
+            Name = os.path.splitext(os.path.basename(FeatureClassPath))[0]
+            arcpy.Project_management(FeatureClassPath, OutFCLocation + r'\\' + Name + r'_Projected.shp', CoordinateSystem)
+
+def ParseObjectKeys(ObjectKey):
+    '''
+    Function that splits the object class parameter into a list of keys.
+    Returns None when every object class should be extracted (ALL).
+    '''
+    if ObjectKey.strip().upper() == 'ALL':
+        return None
+    return [Key.strip().strip("'") for Key in ObjectKey.split(';') if Key.strip()]
+
+def ClassFieldNames(ObjectKeys, ObjectFieldName):
+    '''
+    Function that returns the output field name for each object class.  A
+    single class uses the field name given to the tool, otherwise the names
+    are made from the object class keys.
+    '''
+    if len(ObjectKeys) == 1 and ObjectFieldName:
+        return [ObjectFieldName]
+    FieldNames = []
+    for Key in ObjectKeys:
+        FieldNames.append(GeoJSONReader.ClassFieldName(Key, ['Key', 'FID', 'Shape', 'Id'] + FieldNames))
+    return FieldNames
   
-def CreateFeatureClass(OutLocation, Name, ObjectFieldName):
+def CreateFeatureClass(OutLocation, Name, ObjectFieldName, SpatialRef=None):
     '''
     Function that takes an output folder, feature class name and output
-    field name and creates a new shapefile to load the Mapillary data into
-    from the GeoJSON data.  The function adds a field for the unique key
-    associated with each photo and sets the spatial reference to Web
-    Mercator (the Mapillary projection).
-    '''
-    arcpy.CreateFeatureclass_management(OutLocation, Name, "POINT")
-    # Need to set if/else statement for .shp extension
-    FeatureClassPath = OutLocation + r'\\' + Name + r'.shp'
-    arcpy.AddField_management(FeatureClassPath, 'Key', "TEXT")
-    arcpy.AddField_management(FeatureClassPath, ObjectFieldName, "DOUBLE")
-    SR = arcpy.SpatialReference(4326)
-    arcpy.DefineProjection_management(FeatureClassPath, SR)
+    field name (or a list of field names) and creates a new shapefile to
+    load the Mapillary data into from the GeoJSON data.  The shapefile is
+    created with a field for the unique key associated with each photo and
+    the spatial reference given (or WGS 1984, the Mapillary coordinates)
+    before any data is written.  When the output location is a GeoPackage
+    (.gpkg) a table of that name is created in it instead.  Returns the bulk
+    writer for the new feature class.
+    '''
+    if isinstance(ObjectFieldName, list):
+        ObjectFieldNames = ObjectFieldName
+    else:
+        ObjectFieldNames = [ObjectFieldName]
+    Fields = [('Key', "TEXT")] + [(FieldName, "DOUBLE") for FieldName in ObjectFieldNames]
+    if SpatialRef is None:
+        SpatialRef = arcpy.SpatialReference(4326)
+    return BulkWriter.OpenWriter(FeatureClassPathFor(OutLocation, Name), Fields, SpatialRef)
+
+def FeatureClassPathFor(OutLocation, Name):
+    '''
+    Function that returns the path of an output, a table in a GeoPackage or
+    a shapefile in a folder.
+    '''
+    if IsGeoPackage(OutLocation):
+        return OutLocation + r'\\' + Name
+    return OutLocation + r'\\' + Name + r'.shp'
+
+def IsGeoPackage(OutLocation):
+    return os.path.splitext(OutLocation)[1].lower() in BulkWriter.GeoPackageExtensions
+
+def ImportIncremental(OutLocation, Name, ObjectFieldName, Source, ObjectKeys, Threshold, SpatialRef,
+                      CoordinateSystem, DeleteMissing=False):
+    '''
+    Function that brings an output up to date with the rows of the source
+    using the key index kept beside it: new photos are inserted, photos whose
+    values or location changed are updated and, when DeleteMissing is set,
+    photos that are no longer in the source are deleted.  The output is
+    created again when it is missing or the fields, classes, threshold or
+    coordinate system differ from the run that created it.  The output is
+    always written in the coordinate system asked for: when Projection does
+    not support it (SpatialRef is None) the new and changed rows are
+    projected with arcpy and no _Projected copy is made.  Returns the path of
+    the output.
+    '''
+    FieldNames = ClassFieldNames(ObjectKeys, ObjectFieldName)
+    Fields = [('Key', "TEXT")] + [(FieldName, "DOUBLE") for FieldName in FieldNames]
+    if SpatialRef is None:
+        OutputRef = arcpy.SpatialReference()
+        OutputRef.loadFromString(CoordinateSystem)
+        Prepare = lambda Rows: ProjectWithArcpy(Rows, OutputRef)
+    else:
+        OutputRef = SpatialRef
+        Prepare = lambda Rows: list(ProjectCoordinates(Rows, SpatialRef))
+    Wkid = OutputRef.factoryCode
+    # Coordinate systems without a WKID are told apart by their definition
+    Schema = {'Fields': Fields, 'ObjectKeys': ObjectKeys, 'Threshold': Threshold,
+              'Wkid': Wkid or OutputRef.exportToString()}
+    FeatureClassPath = FeatureClassPathFor(OutLocation, Name)
+    IndexPath = DeltaImport.IndexPathFor(FeatureClassPath)
+    if IsGeoPackage(OutLocation):
+        Exists = BulkWriter.TableExists(OutLocation, Name)
+    else:
+        Exists = arcpy.Exists(FeatureClassPath)
+    if DeltaImport.NeedsRebuild(IndexPath, Schema, Exists):
+        arcpy.AddMessage('Creating the new shapefile and key index')
+        with Instrumentation.Stage('CreateFeatureClass'):
+            if os.path.exists(IndexPath):
+                os.remove(IndexPath)
+            CreateFeatureClass(OutLocation, Name, FieldNames, OutputRef).Close()
+            if not IsGeoPackage(OutLocation):
+                arcpy.AddIndex_management(FeatureClassPath, 'Key', 'KeyIndex')
+    if IsGeoPackage(OutLocation):
+        Target = DeltaImport.GeoPackageTarget(OutLocation, Name, Fields, Wkid)
+    else:
+        Target = DeltaImport.ArcpyTarget(FeatureClassPath, Fields)
+    DataRows = WideRows(Source.ExtractClasses(ObjectKeys, Threshold), ObjectKeys)
+    # Only the new and changed rows are projected
+    with Instrumentation.Stage('ImportDelta') as Stage:
+        Counts = DeltaImport.ImportDelta(DataRows, Target, IndexPath, Schema, DeleteMissing, Prepare)
+        Stage.Rows = Counts['Inserted'] + Counts['Updated'] + Counts['Deleted'] + Counts['Unchanged']
+    arcpy.AddMessage('%(Inserted)d photos inserted, %(Updated)d updated, %(Deleted)d deleted and %(Unchanged)d unchanged'
+                     % Counts)
     return FeatureClassPath
     
-def ExtractData(FilePath, ObjectKey):
+def ExtractData(Source, ObjectKey, SpatialRef=None):
+    '''
+    Generator that extracts the data from the source one feature at a time and
+    yields the photo key, object class value and coordinates that will be used
+    to populate the feature class from the new shapefile.  The GeoJSON file is
+    read incrementally (or from the detection cache) so the whole
+    FeatureCollection is never held in memory.  The source from OpenSource and
+    the key for the object being imported are required as inputs, the
+    coordinates are projected when a spatial reference is given.
+    '''
+    for Row in ProjectCoordinates(Source.ExtractFeatures(ObjectKey), SpatialRef):
+        yield Row
+
+def ExtractChunks(Source, ObjectKey, Fields, SpatialRef=None):
+    '''
+    Generator that yields the photo keys, object class values and coordinates
+    as structured array chunks for the bulk writer.  The detection cache is
+    already held as arrays, so its chunks are sliced and projected without
+    handling each feature in Python.
+    '''
+    if not isinstance(Source, DetectionCache.DetectionCache):
+        for Chunk in BulkWriter.RowChunks(ExtractData(Source, ObjectKey, SpatialRef), Fields):
+            yield Chunk
+        return
+    Values = Source.Column(ObjectKey)
+    Projector = None
+    if SpatialRef is not None and SpatialRef.factoryCode != 4326:
+        Projector = Projection.Transform(SpatialRef.factoryCode)
+    for Start in range(0, Source.Count, BulkWriter.DefaultChunkSize):
+        Stop = min(Start + BulkWriter.DefaultChunkSize, Source.Count)
+        Chunk = np.zeros(Stop - Start, dtype=BulkWriter.ChunkDtype(Fields))
+        Chunk[Fields[0][0]] = Source.Keys[Start:Stop].tolist()
+        Chunk[Fields[1][0]] = Values[Start:Stop]
+        LonLat = np.asarray(Source.LonLat[Start:Stop], dtype=np.float64)
+        if Projector is None:
+            Chunk['X'], Chunk['Y'] = LonLat[:, 0], LonLat[:, 1]
+        else:
+            Chunk['X'], Chunk['Y'] = Projector(LonLat[:, 0], LonLat[:, 1])
+        yield Chunk
+
+def OpenSource(FilePath, UseCache=False, ApiExtent='', ApiClientID='', ApiURL=''):
     '''
-    Function that extracts the data from the GeoJSON file and returns a nested
-    list that will be used to populate the feature class from the new shapefile.
-    The path to the GeoJSON file and the key for the object being imported are
-    required as inputs.
+    Function that returns the object the GeoJSON rows are read from: the
+    Mapillary API when a bounding box is given, otherwise the memory-mapped
+    detection cache when UseCache is set or the incremental GeoJSON reader.
     '''
-    DataTransferList = []
-    with open(FilePath) as RawData:
-        DataDictionary = json.load(RawData)
+    if ApiExtent:
+        if sys.version_info[0] < 3:
+            raise ValueError('Reading from the Mapillary API needs Python 3 (ArcGIS Pro), run '
+                             'MapillaryIngest.py with Python 3 to download a GeoJSON file instead')
+        import MapillaryIngest
+        arcpy.AddMessage('Reading the photos from the Mapillary API')
+        return MapillaryIngest.APISource(ApiExtent, ApiClientID, ApiURL, Message=arcpy.AddMessage)
+    if UseCache:
+        arcpy.AddMessage('Opening the detection cache')
+        return DetectionCache.OpenCache(FilePath)
+    return GeoJSONReader.FileSource(FilePath)
 
-    for Row in DataDictionary['features']:
-        DataTransferList.append([Row['properties']['key'], Row['properties'][ObjectKey], Row['geometry']['coordinates']])
-    return DataTransferList
+def InsertData(Writer, Chunks):
+    '''
+    Function that writes the chunks from the extract chunks generator (or any
+    other iterable of structured arrays) to the new shapefile as they are
+    produced and closes the writer.  Requires the bulk writer of the shapefile
+    and the chunks to function properly.  Reading the chunks is part of the
+    stage, the rows are extracted as they are written.
+    '''
+    with Instrumentation.Stage('ExtractAndInsert') as Stage:
+        try:
+            for Chunk in Chunks:
+                Writer.WriteChunk(Chunk)
+        finally:
+            Writer.Close()
+            Stage.Rows = Writer.Count
 
-def InsertData(FeatureClassPath, Fields, DataList):
+def InsertClustered(OutLocation, Name, ObjectFieldName, Source, ObjectKey, Radius, ScoreThreshold, SpatialRef=None):
     '''
-    Function that inserts the output of a nested list into the new shapefile.
-    Requires the path of the shapefile and the nested list to function properly.
+    Function that merges the photos of one object class that see the same
+    object into one feature per cluster: the photos with a value of at least
+    the score threshold within the radius (in metres) of the best photo of a
+    cluster.  The feature is placed at the centre of its photos and keeps the
+    key and value of the best photo, the mean value and the number of photos.
+    The key, cluster and value of every clustered photo are written to a
+    second feature class named <name>_Members.  Returns both paths.
     '''
-    Cursor = arcpy.da.InsertCursor(FeatureClassPath, Fields)
-    for Row in DataList:
-        Cursor.insertRow(Row)
-    del Cursor
+    ObjectFieldName = ObjectFieldName or GeoJSONReader.ClassFieldName(ObjectKey, ['Key', 'FID', 'Shape', 'Id'])
+    Fields = [('Key', "TEXT"), (ObjectFieldName, "DOUBLE")]
+    with Instrumentation.Stage('ExtractDetections') as Stage:
+        Chunks = list(ExtractChunks(Source, ObjectKey, Fields, SpatialRef))
+        Detections = np.concatenate(Chunks) if Chunks else np.zeros(0, dtype=BulkWriter.ChunkDtype(Fields))
+        Stage.Rows = len(Detections)
+    Scores = Detections[ObjectFieldName]
+    with Instrumentation.Stage('ClusterDetections') as Stage:
+        Wkid = SpatialRef.factoryCode if SpatialRef is not None else 4326
+        X, Y = DetectionClusters.MetricCoordinates(Detections['X'], Detections['Y'], Wkid)
+        Labels, Seeds = DetectionClusters.ClusterDetections(X, Y, Scores, Radius, ScoreThreshold)
+        Summary = DetectionClusters.ClusterSummary(Labels, Seeds, Detections['X'], Detections['Y'], Scores)
+        Stage.Rows = len(Seeds)
+    arcpy.AddMessage(str(np.count_nonzero(Labels >= 0)) + ' photos merged into ' + str(len(Seeds)) + ' objects')
+    ClusterFields = Fields + [('MeanScore', "DOUBLE"), ('Photos', "LONG"), ('ClusterID', "LONG")]
+    Clusters = np.zeros(len(Seeds), dtype=BulkWriter.ChunkDtype(ClusterFields))
+    Clusters['Key'] = Detections['Key'][Seeds]
+    Clusters[ObjectFieldName] = Summary['MaxScore']
+    Clusters['MeanScore'] = Summary['MeanScore']
+    Clusters['Photos'] = Summary['Photos']
+    Clusters['ClusterID'] = np.arange(len(Seeds))
+    Clusters['X'], Clusters['Y'] = Summary['X'], Summary['Y']
+    MemberFields = [('Key', "TEXT"), ('ClusterID', "LONG"), (ObjectFieldName, "DOUBLE")]
+    Clustered = np.flatnonzero(Labels >= 0)
+    Members = np.zeros(len(Clustered), dtype=BulkWriter.ChunkDtype(MemberFields))
+    for Field in ('Key', ObjectFieldName, 'X', 'Y'):
+        Members[Field] = Detections[Field][Clustered]
+    Members['ClusterID'] = Labels[Clustered]
+    if SpatialRef is None:
+        SpatialRef = arcpy.SpatialReference(4326)
+    Paths = []
+    for OutName, OutFields, Chunk in ((Name, ClusterFields, Clusters), (Name + '_Members', MemberFields, Members)):
+        with Instrumentation.Stage('CreateFeatureClass'):
+            Writer = BulkWriter.OpenWriter(FeatureClassPathFor(OutLocation, OutName), OutFields, SpatialRef)
+        InsertData(Writer, [Chunk])
+        Paths.append(Writer.Path)
+    return Paths
+
+def InsertWide(OutLocation, Name, ObjectFieldName, Source, ObjectKeys, Threshold, SpatialRef=None):
+    '''
+    Function that reads the source once and writes every feature to a
+    single shapefile with a field for each object class.  Classes that are
+    missing from a feature (or below the threshold) are stored as 0.  When
+    every class is extracted the fields are not known until the end of the
+    file, so the rows are spooled to a temporary file and inserted once the
+    shapefile has been created.  Returns the path of the shapefile.
+    '''
+    if ObjectKeys is not None:
+        FieldNames = ClassFieldNames(ObjectKeys, ObjectFieldName)
+        with Instrumentation.Stage('CreateFeatureClass'):
+            Writer = CreateFeatureClass(OutLocation, Name, FieldNames, SpatialRef)
+        ClassRows = ProjectCoordinates(Source.ExtractClasses(ObjectKeys, Threshold), SpatialRef)
+        InsertData(Writer, BulkWriter.RowChunks(WideRows(ClassRows, ObjectKeys), Writer.Fields))
+        return Writer.Path
+    ObjectKeys = []
+    Found = set()
+    Spool = tempfile.TemporaryFile(mode='w+')
+    try:
+        with Instrumentation.Stage('ExtractToSpool'):
+            ClassRows = ProjectCoordinates(Source.ExtractClasses(None, Threshold), SpatialRef)
+            for Row in Instrumentation.Counted(ClassRows):
+                for Key in Row[1]:
+                    if Key not in Found:
+                        Found.add(Key)
+                        ObjectKeys.append(Key)
+                Spool.write(json.dumps(Row) + '\n')
+        Spool.seek(0)
+        arcpy.AddMessage('Found ' + str(len(ObjectKeys)) + ' object classes')
+        FieldNames = ClassFieldNames(ObjectKeys, '')
+        with Instrumentation.Stage('CreateFeatureClass'):
+            Writer = CreateFeatureClass(OutLocation, Name, FieldNames, SpatialRef)
+        DataRows = WideRows((json.loads(Line) for Line in Spool), ObjectKeys)
+        InsertData(Writer, BulkWriter.RowChunks(DataRows, Writer.Fields))
+    finally:
+        Spool.close()
+    return Writer.Path
+
+def WideRows(ClassRows, ObjectKeys):
+    '''
+    Generator that turns the (key, class dictionary, coordinates) rows from
+    the GeoJSON reader into writer rows with one value per class.
+    '''
+    for Key, Classes, Coordinates in ClassRows:
+        yield [Key] + [Classes.get(ObjectKey, 0.0) for ObjectKey in ObjectKeys] + [Coordinates]
+
+def InsertPerClass(OutLocation, Name, ObjectFieldName, Source, ObjectKeys, Threshold, SpatialRef=None):
+    '''
+    Function that reads the source once and writes each feature to the
+    shapefile of every object class it contains (at or above the threshold).
+    The shapefiles are named after the output name and the class.  When every
+    class is extracted a shapefile is created the first time a class is found.
+    Returns the paths of the shapefiles.
+    '''
+    Writers = {}
+    FeatureClassPaths = []
+    UsedNames = []
+
+    def OpenWriter(ObjectKey):
+        ClassName = GeoJSONReader.ClassFieldName(ObjectKey, UsedNames)
+        UsedNames.append(ClassName)
+        FieldName = ObjectFieldName or ClassName
+        Writers[ObjectKey] = CreateFeatureClass(OutLocation, Name + '_' + ClassName, FieldName, SpatialRef)
+        FeatureClassPaths.append(Writers[ObjectKey].Path)
+
+    with Instrumentation.Stage('ExtractAndInsert') as Stage:
+        try:
+            if ObjectKeys is not None:
+                for ObjectKey in ObjectKeys:
+                    OpenWriter(ObjectKey)
+            ClassRows = ProjectCoordinates(Source.ExtractClasses(ObjectKeys, Threshold), SpatialRef)
+            for Key, Classes, Coordinates in ClassRows:
+                for ObjectKey, Value in Classes.items():
+                    if ObjectKey not in Writers:
+                        OpenWriter(ObjectKey)
+                    Writers[ObjectKey].Append([Key, Value, Coordinates])
+        finally:
+            # Closing the writers writes the buffered rows and removes the locks on the shapefiles
+            for Writer in Writers.values():
+                Writer.Close()
+            Stage.Rows = sum(Writer.Count for Writer in Writers.values())
+    return FeatureClassPaths
 
 if __name__ == "__main__":
-    main(FcFolder, FcName, FcField, FcSR, JsonPath, ObjectJsonName)
+    # Stage timings are reported at the end and written as JSON when MAPILLARY_TRACE is set
+    with Instrumentation.StartTrace('GeoJSONtoESRI', Message=arcpy.AddMessage):
+        main(FcFolder, FcName, FcField, FcSR, JsonPath, ObjectJsonName, ClassThreshold, OutputLayout, UseCache,
+             ImportMode, DeleteMissing, ApiExtent, ApiClientID, ApiURL, ClusterRadius, ClusterScore)
 
@@ -0,0 +1,38 @@
+### Description: Geometry helpers shared by the Mapillary tools that work on
+### coordinate arrays instead of feature classes.
+###
+### This script was designed to work with ArcGIS 10.4/10.5 and Python 2.7.10,
+### and also runs under Python 3.  It needs NumPy but does not require arcpy.
+
+###
+### import modules
+###
+
+import numpy as np
+
+###
+### Script Follows
+###
+
+def Segments(Paths, IDs):
+    '''
+    Function that splits paths (sequences of X,Y vertices) into their line
+    segments.  Returns the start X, start Y, end X, end Y and ID arrays of
+    every segment, each segment carrying the ID of its path.  A path with a
+    single vertex becomes one zero length segment.
+    '''
+    Starts = [np.zeros((0, 2))]
+    Ends = [np.zeros((0, 2))]
+    AllIDs = [np.zeros(0, dtype=np.int64)]
+    for Path, ID in zip(Paths, IDs):
+        Path = np.asarray(Path, dtype=np.float64).reshape(-1, 2)
+        if Path.shape[0] == 0:
+            continue
+        if Path.shape[0] == 1:
+            Path = np.vstack((Path, Path))
+        Starts.append(Path[:-1])
+        Ends.append(Path[1:])
+        AllIDs.append(np.full(Path.shape[0] - 1, ID, dtype=np.int64))
+    Starts = np.concatenate(Starts)
+    Ends = np.concatenate(Ends)
+    return Starts[:, 0], Starts[:, 1], Ends[:, 0], Ends[:, 1], np.concatenate(AllIDs)
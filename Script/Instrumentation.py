@@ -0,0 +1,264 @@
+### Description: Stage timing for the Mapillary tools.  Each tool starts a trace
+### and runs its work as named stages; every stage records its wall time, CPU
+### time, the peak memory of the process and the number of rows it handled.
+### At the end the trace is written as JSON (one file per run) and, when
+### profiling is turned on, a cProfile dump of the whole run is written beside
+### it so slow nights can be compared with earlier runs.
+###
+### Tracing is turned on without changing the tool parameters by setting the
+### environment variables:
+###     MAPILLARY_TRACE    folder for the JSON traces (or the path of a .json file)
+###     MAPILLARY_PROFILE  true to also write a cProfile dump (<trace>.prof)
+### Without MAPILLARY_TRACE the stages are still timed and summarised with the
+### tool's message function, but nothing is written.
+###
+### Stages can be opened as context managers (with Stage('Name'):) or, in
+### scripts that run from top to bottom, one after the other with
+### Next('Name'), which ends the stage before it.  Both report to the trace
+### started last and record nothing when no trace has been started.
+###
+### This script was designed to work with ArcGIS 10.4/10.5 and Python 2.7.10,
+### and also runs under Python 3.  It does not require arcpy.
+
+###
+### import modules
+###
+
+import cProfile
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+
+###
+### Script Follows
+###
+
+TraceEnvironment = 'MAPILLARY_TRACE'
+ProfileEnvironment = 'MAPILLARY_PROFILE'
+
+# Trace that module level Stage and AddRows calls report to
+_Active = None
+
+
+def PeakMemory():
+    '''
+    Function that returns the peak resident memory of the process in bytes,
+    or None when it can not be measured on this platform.
+    '''
+    try:
+        import resource
+        Peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes and macOS bytes
+        return Peak if sys.platform == 'darwin' else Peak * 1024
+    except ImportError:
+        pass
+    try:
+        import ctypes
+        import ctypes.wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', ctypes.wintypes.DWORD), ('PageFaultCount', ctypes.wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        Counters = ProcessMemoryCounters()
+        Counters.cb = ctypes.sizeof(Counters)
+        Process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(Process, ctypes.byref(Counters), Counters.cb):
+            return int(Counters.PeakWorkingSetSize)
+    except (ImportError, AttributeError, OSError, ValueError):
+        pass
+    return None
+
+
+def CPUTime():
+    '''
+    Function that returns the user plus system CPU time of the process.
+    '''
+    Times = os.times()
+    return Times[0] + Times[1]
+
+
+def TracePaths(ToolName, TracePath=None, Profile=None):
+    '''
+    Function that returns the JSON trace path and the cProfile dump path of a
+    run (either can be None) from the arguments or the environment.
+    '''
+    if TracePath is None:
+        TracePath = os.environ.get(TraceEnvironment) or None
+    if Profile is None:
+        Profile = os.environ.get(ProfileEnvironment, '').lower() == 'true'
+    if TracePath and not TracePath.lower().endswith('.json'):
+        Stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        TracePath = os.path.join(TracePath, '%s_%s_%d.json' % (ToolName, Stamp, os.getpid()))
+    ProfilePath = os.path.splitext(TracePath)[0] + '.prof' if TracePath and Profile else None
+    return TracePath, ProfilePath
+
+
+def StartTrace(ToolName, TracePath=None, Profile=None, Message=None):
+    '''
+    Function that starts the trace of a tool run and makes it the trace the
+    module level Stage and AddRows functions report to.
+    '''
+    global _Active
+    TracePath, ProfilePath = TracePaths(ToolName, TracePath, Profile)
+    _Active = Trace(ToolName, TracePath, ProfilePath, Message)
+    return _Active
+
+
+def Stage(Name, Rows=None):
+    '''
+    Function that opens a stage of the active trace, or a stage that records
+    nothing when no trace has been started.
+    '''
+    if _Active is None:
+        return StageTimer(None, Name, Rows)
+    return _Active.Stage(Name, Rows)
+
+
+def Next(Name, Rows=None):
+    '''
+    Function that ends the stage started by the last Next call of the active
+    trace and starts a new one, for scripts that run from top to bottom.
+    '''
+    if _Active is None:
+        return StageTimer(None, Name, Rows)
+    return _Active.Next(Name, Rows)
+
+
+def AddRows(Count):
+    '''
+    Function that adds to the row count of the innermost open stage of the
+    active trace.
+    '''
+    if _Active is not None and _Active.Open:
+        _Active.Open[-1].Rows = (_Active.Open[-1].Rows or 0) + Count
+
+
+def Counted(Rows):
+    '''
+    Generator that passes rows through unchanged while adding each of them
+    to the row count of the stage that is open when the row is read.
+    '''
+    for Row in Rows:
+        AddRows(1)
+        yield Row
+
+
+class StageTimer(object):
+    '''
+    A stage of a trace.  The measurements are taken when the stage is
+    entered and exited and added to the trace as a dictionary.
+    '''
+
+    def __init__(self, Owner, Name, Rows=None):
+        self.Owner = Owner
+        self.Name = Name
+        self.Rows = Rows
+
+    def __enter__(self):
+        self.Start()
+        return self
+
+    def __exit__(self, ExceptionType, Value, Traceback):
+        self.Stop(ExceptionType is None)
+
+    def Start(self):
+        self.Wall = time.time()
+        self.CPU = CPUTime()
+        self.PeakAtStart = PeakMemory()
+        if self.Owner is not None:
+            self.Depth = len(self.Owner.Open)
+            self.Owner.Open.append(self)
+
+    def Stop(self, Succeeded=True):
+        Peak = PeakMemory()
+        Record = {'Name': self.Name, 'Wall': time.time() - self.Wall, 'CPU': CPUTime() - self.CPU,
+                  'PeakMemory': Peak, 'Rows': self.Rows, 'Succeeded': Succeeded,
+                  'MemoryGrowth': Peak - self.PeakAtStart if Peak is not None and self.PeakAtStart is not None else None}
+        if self.Owner is not None:
+            Record['Start'] = self.Wall - self.Owner.Wall
+            Record['Depth'] = self.Depth
+            if self in self.Owner.Open:
+                self.Owner.Open.remove(self)
+            self.Owner.Stages.append(Record)
+        return Record
+
+
+class Trace(object):
+    '''
+    The stages of one tool run.  Finish ends any open stage, writes the JSON
+    trace and the cProfile dump (when their paths are set) and returns the
+    trace as a dictionary.  A trace can also be used as a context manager,
+    which finishes it even when the tool fails.
+    '''
+
+    def __init__(self, ToolName, TracePath=None, ProfilePath=None, Message=None):
+        self.ToolName = ToolName
+        self.TracePath = TracePath
+        self.ProfilePath = ProfilePath
+        self.Message = Message
+        self.Stages = []
+        self.Open = []
+        self.Current = None
+        self.Started = datetime.datetime.now()
+        self.Wall = time.time()
+        self.CPU = CPUTime()
+        self.Profiler = None
+        if ProfilePath:
+            self.Profiler = cProfile.Profile()
+            self.Profiler.enable()
+
+    def Stage(self, Name, Rows=None):
+        return StageTimer(self, Name, Rows)
+
+    def Next(self, Name, Rows=None):
+        '''
+        Ends the stage started by the last Next call and starts a new one.
+        '''
+        if self.Current is not None:
+            self.Current.Stop()
+        self.Current = StageTimer(self, Name, Rows)
+        self.Current.Start()
+        return self.Current
+
+    def Finish(self, Succeeded=True):
+        global _Active
+        if self.Current is not None:
+            self.Current.Stop(Succeeded)
+            self.Current = None
+        if self.TracePath:
+            Folder = os.path.dirname(self.TracePath)
+            if Folder and not os.path.isdir(Folder):
+                os.makedirs(Folder)
+        if self.Profiler is not None:
+            self.Profiler.disable()
+            self.Profiler.dump_stats(self.ProfilePath)
+            self.Profiler = None
+        Result = {'Tool': self.ToolName, 'Started': self.Started.isoformat(), 'Succeeded': Succeeded,
+                  'Wall': time.time() - self.Wall, 'CPU': CPUTime() - self.CPU, 'PeakMemory': PeakMemory(),
+                  'Python': platform.python_version(), 'Platform': platform.platform(),
+                  'Profile': self.ProfilePath, 'Stages': sorted(self.Stages, key=lambda Record: Record['Start'])}
+        if self.TracePath:
+            with open(self.TracePath, 'w') as TraceFile:
+                json.dump(Result, TraceFile, indent=1, sort_keys=True)
+        if self.Message is not None:
+            for Record in Result['Stages']:
+                self.Message('%s%s: %.2f s wall, %.2f s CPU%s' % ('  ' * Record['Depth'], Record['Name'], Record['Wall'],
+                                                                 Record['CPU'], '' if Record['Rows'] is None
+                                                                 else ', %d rows' % Record['Rows']))
+            self.Message('Total: %.2f s wall, %.2f s CPU' % (Result['Wall'], Result['CPU']))
+        if _Active is self:
+            _Active = None
+        return Result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ExceptionType, Value, Traceback):
+        self.Finish(ExceptionType is None)
@@ -0,0 +1,520 @@
+### Description: Pulls the photos of a city straight from the Mapillary API
+### instead of a GeoJSON file downloaded by hand.  The bounding box of the
+### city is split into tiles and each tile is requested page by page
+### (following the next link of every page).  Tiles are fetched at the same
+### time with asyncio, a bounded number at once, over a pool of kept-alive
+### connections.  Failed requests, rate limits (429) and server errors are
+### retried with exponential backoff, and every page is kept in an on-disk
+### cache so a refresh that is stopped or repeated does not fetch it again.
+###
+### The features are handed to the caller page by page as they arrive,
+### through a small bounded queue, so the full FeatureCollection is never
+### held in memory and the extractor (GeoJSONtoESRI) writes the first
+### features while later tiles are still being fetched.  APISource has the
+### same ExtractFeatures and ExtractClasses methods as GeoJSONReader.FileSource.
+### A photo on the edge of two tiles is only yielded once.
+###
+### The API address is a parameter, so the ingestion can be run against a
+### local mock server (see Benchmark/MockMapillaryServer.py).  Run from the
+### command line it writes the features to a GeoJSON file:
+###     python MapillaryIngest.py "XMin YMin XMax YMax" output.geojson
+###         [--client-id ID] [--url URL] [--cache folder] [--concurrency 8]
+###
+### This script needs Python 3.5 or later (ArcGIS Pro) for asyncio and does
+### not require arcpy.  With ArcMap and Python 2.7, run it from the command
+### line with Python 3 and import the GeoJSON file it writes.
+
+###
+### import modules
+###
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import queue
+import random
+import ssl
+import sys
+import threading
+import time
+import zlib
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+import GeoJSONReader
+
+###
+### Script Follows
+###
+
+DefaultURL = 'https://a.mapillary.com/v3/images'
+# Tile size in degrees (about 1 km), small enough to keep each tile to a few pages
+DefaultTileSize = 0.01
+DefaultPageSize = 1000
+# Number of tiles fetched at the same time, and the size of the connection pool
+DefaultConcurrency = 8
+DefaultRetries = 5
+DefaultTimeout = 60.0
+# Cached pages younger than this many seconds are used instead of fetching them again
+DefaultCacheAge = 24 * 3600
+DefaultCacheFolder = os.path.join(os.path.expanduser('~'), '.mapillary_cache')
+# Backoff before retry n is BackoffBase * 2 ** n seconds (at most BackoffLimit), with jitter
+BackoffBase = 0.5
+BackoffLimit = 30.0
+RetryStatuses = (429, 500, 502, 503, 504)
+# Query parameters holding credentials, left out of the cache keys
+SecretParameters = ('client_id', 'access_token')
+# Pages waiting for the extractor, per tile fetched at the same time
+QueuedPagesPerWorker = 2
+UserAgent = 'UW_Capstone_Mapillary'
+
+
+class HTTPError(Exception):
+    '''
+    Raised for a response that is not retried (or is still failing after
+    the last retry).
+    '''
+
+    def __init__(self, Status, URL):
+        Exception.__init__(self, 'HTTP %d for %s' % (Status, RemoveSecrets(URL)))
+        self.Status = Status
+        self.URL = URL
+
+
+class _Stopped(Exception):
+    '''
+    Raised in the fetching thread when the extractor stops reading.
+    '''
+
+
+def ParseExtent(Extent):
+    '''
+    Function that reads a bounding box given as "XMin YMin XMax YMax" in
+    longitude and latitude (spaces or commas) or as a sequence of numbers.
+    '''
+    if isinstance(Extent, str):
+        Extent = Extent.replace(',', ' ').split()
+    Extent = [float(Value) for Value in Extent]
+    if len(Extent) != 4 or Extent[0] >= Extent[2] or Extent[1] >= Extent[3]:
+        raise ValueError('The extent must be XMin YMin XMax YMax, got %r' % (Extent,))
+    return tuple(Extent)
+
+
+def Tiles(Extent, TileSize=DefaultTileSize):
+    '''
+    Function that splits a bounding box into a list of tiles of at most
+    TileSize degrees, row by row from the south west.
+    '''
+    XMin, YMin, XMax, YMax = Extent
+    Columns = max(1, int(-(-(XMax - XMin) // TileSize)))
+    Rows = max(1, int(-(-(YMax - YMin) // TileSize)))
+    Width, Height = (XMax - XMin) / Columns, (YMax - YMin) / Rows
+    return [(XMin + Column * Width, YMin + Row * Height,
+             XMax if Column == Columns - 1 else XMin + (Column + 1) * Width,
+             YMax if Row == Rows - 1 else YMin + (Row + 1) * Height)
+            for Row in range(Rows) for Column in range(Columns)]
+
+
+def TileURL(BaseURL, Tile, ClientID='', PageSize=DefaultPageSize):
+    '''
+    Function that returns the address of the first page of a tile.
+    '''
+    Parameters = [('bbox', ','.join(repr(float(Value)) for Value in Tile)), ('per_page', str(PageSize))]
+    if ClientID:
+        Parameters.append(('client_id', ClientID))
+    return BaseURL + ('&' if '?' in BaseURL else '?') + urlencode(Parameters)
+
+
+def RemoveSecrets(URL):
+    '''
+    Function that returns an address without its credential parameters,
+    used for the cache keys and in messages.
+    '''
+    Parts = urlsplit(URL)
+    Query = [(Name, Value) for Name, Value in parse_qsl(Parts.query, keep_blank_values=True)
+             if Name not in SecretParameters]
+    return urlunsplit(Parts._replace(query=urlencode(Query)))
+
+
+def NextURL(URL, Headers, Body):
+    '''
+    Function that returns the address of the page after a response, from its
+    Link header (rel="next") or a next member of the body, or None for the
+    last page.  Relative addresses are resolved against the page address.
+    '''
+    for Link in Headers.get('link', '').split(','):
+        Parts = Link.split(';')
+        if len(Parts) > 1 and any(Part.strip().replace(' ', '') in ('rel="next"', 'rel=next') for Part in Parts[1:]):
+            return urljoin(URL, Parts[0].strip().strip('<>'))
+    Next = None
+    if isinstance(Body, dict):
+        Next = Body.get('next') or (Body.get('paging') or {}).get('next')
+    return urljoin(URL, Next) if Next else None
+
+
+def Backoff(Attempt, RetryAfter=None):
+    '''
+    Function that returns the seconds to wait before a retry, the server's
+    Retry-After when it gives one.
+    '''
+    if RetryAfter:
+        try:
+            return min(float(RetryAfter), BackoffLimit)
+        except ValueError:
+            pass
+    return min(BackoffLimit, BackoffBase * 2 ** Attempt) * random.uniform(0.5, 1.0)
+
+
+class ResponseCache(object):
+    '''
+    Pages kept on disk, one gzip compressed JSON file per page address
+    (without credentials) holding the features and the next page address.
+    Files are written under another name first so an interrupted run never
+    leaves half a page.
+    '''
+
+    def __init__(self, Folder, MaxAge=DefaultCacheAge):
+        self.Folder = Folder
+        self.MaxAge = MaxAge
+        if not os.path.isdir(Folder):
+            os.makedirs(Folder)
+
+    def PathFor(self, URL):
+        return os.path.join(self.Folder, hashlib.sha1(RemoveSecrets(URL).encode('utf-8')).hexdigest() + '.json.gz')
+
+    def Get(self, URL):
+        Path = self.PathFor(URL)
+        try:
+            if time.time() - os.path.getmtime(Path) > self.MaxAge:
+                return None
+            with gzip.open(Path, 'rt', encoding='utf-8') as CacheFile:
+                Page = json.load(CacheFile)
+        except (OSError, IOError, ValueError, EOFError):
+            return None
+        return Page['Features'], Page['Next']
+
+    def Put(self, URL, Features, Next):
+        Path = self.PathFor(URL)
+        with gzip.open(Path + '.part', 'wt', encoding='utf-8') as CacheFile:
+            json.dump({'URL': RemoveSecrets(URL), 'Next': Next, 'Features': Features}, CacheFile)
+        os.replace(Path + '.part', Path)
+
+
+class ConnectionPool(object):
+    '''
+    HTTP/1.1 connections kept alive between requests, up to Size idle
+    connections for each host.  Responses may be sent with a content length,
+    chunked or until the connection closes, and gzip or deflate encoded.
+    '''
+
+    def __init__(self, Size=DefaultConcurrency, Timeout=DefaultTimeout):
+        self.Size = Size
+        self.Timeout = Timeout
+        self.Idle = {}
+        self.SSLContext = None
+
+    async def Get(self, URL):
+        '''
+        Returns the status, headers (lower case names) and body of a GET
+        request.  A kept-alive connection the server has closed in the
+        meantime is replaced by a new one without counting as a failure.
+        '''
+        Parts = urlsplit(URL)
+        Key = (Parts.scheme, Parts.hostname, Parts.port or (443 if Parts.scheme == 'https' else 80))
+        Path = (Parts.path or '/') + ('?' + Parts.query if Parts.query else '')
+        while self.Idle.get(Key):
+            Reader, Writer = self.Idle[Key].pop()
+            try:
+                return await self._Request(Key, Reader, Writer, Parts.netloc, Path)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                Writer.close()
+        Reader, Writer = await asyncio.wait_for(self._Open(Key), self.Timeout)
+        return await self._Request(Key, Reader, Writer, Parts.netloc, Path)
+
+    async def _Open(self, Key):
+        Scheme, Host, Port = Key
+        if Scheme == 'https':
+            if self.SSLContext is None:
+                self.SSLContext = ssl.create_default_context()
+            return await asyncio.open_connection(Host, Port, ssl=self.SSLContext)
+        return await asyncio.open_connection(Host, Port)
+
+    async def _Request(self, Key, Reader, Writer, Host, Path):
+        try:
+            Status, Headers, Body, KeepAlive = await asyncio.wait_for(
+                self._Exchange(Reader, Writer, Host, Path), self.Timeout)
+        except BaseException:
+            Writer.close()
+            raise
+        if KeepAlive and len(self.Idle.setdefault(Key, [])) < self.Size:
+            self.Idle[Key].append((Reader, Writer))
+        else:
+            Writer.close()
+        return Status, Headers, Body
+
+    async def _Exchange(self, Reader, Writer, Host, Path):
+        Writer.write(('GET %s HTTP/1.1\r\nHost: %s\r\nUser-Agent: %s\r\nAccept: application/json\r\n'
+                      'Accept-Encoding: gzip, deflate\r\nConnection: keep-alive\r\n\r\n'
+                      % (Path, Host, UserAgent)).encode('latin-1'))
+        await Writer.drain()
+        StatusLine = await Reader.readline()
+        if not StatusLine:
+            raise ConnectionError('The server closed the connection')
+        Version, Status = StatusLine.decode('latin-1').split(None, 2)[:2]
+        Headers = {}
+        while True:
+            Line = await Reader.readline()
+            if Line in (b'\r\n', b'\n', b''):
+                break
+            Name, Separator, Value = Line.decode('latin-1').partition(':')
+            Headers[Name.strip().lower()] = Value.strip()
+        KeepAlive = Version == 'HTTP/1.1' and Headers.get('connection', '').lower() != 'close'
+        if 'chunked' in Headers.get('transfer-encoding', '').lower():
+            Chunks = []
+            while True:
+                Size = int((await Reader.readline()).split(b';')[0], 16)
+                if Size == 0:
+                    # Trailers end with an empty line
+                    while (await Reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                Chunks.append(await Reader.readexactly(Size))
+                await Reader.readline()
+            Body = b''.join(Chunks)
+        elif 'content-length' in Headers:
+            Body = await Reader.readexactly(int(Headers['content-length']))
+        else:
+            Body = await Reader.read()
+            KeepAlive = False
+        Encoding = Headers.get('content-encoding', '').lower()
+        if Encoding == 'gzip':
+            Body = gzip.decompress(Body)
+        elif Encoding == 'deflate':
+            Body = zlib.decompress(Body)
+        return int(Status), Headers, Body, KeepAlive
+
+    def Close(self):
+        for Connections in self.Idle.values():
+            for Reader, Writer in Connections:
+                Writer.close()
+        self.Idle = {}
+
+
+class Fetcher(object):
+    '''
+    Fetches pages through the cache, the connection pool and the retries,
+    and keeps count of what was done.
+    '''
+
+    def __init__(self, Pool, Cache=None, Retries=DefaultRetries):
+        self.Pool = Pool
+        self.Cache = Cache
+        self.Retries = Retries
+        self.Counts = {'Pages': 0, 'Cached': 0, 'Retries': 0, 'Features': 0}
+
+    async def Page(self, URL):
+        '''
+        Returns the features of a page and the address of the next page.
+        '''
+        if self.Cache is not None:
+            Cached = self.Cache.Get(URL)
+            if Cached is not None:
+                self.Counts['Cached'] += 1
+                return Cached
+        Attempt = 0
+        while True:
+            RetryAfter = None
+            try:
+                Status, Headers, Body = await self.Pool.Get(URL)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                if Attempt >= self.Retries:
+                    raise
+            else:
+                if Status == 200:
+                    Document = json.loads(Body.decode('utf-8'))
+                    Features = Document.get('features', []) if isinstance(Document, dict) else Document
+                    Next = NextURL(URL, Headers, Document)
+                    if self.Cache is not None:
+                        self.Cache.Put(URL, Features, Next)
+                    self.Counts['Pages'] += 1
+                    return Features, Next
+                if Status not in RetryStatuses or Attempt >= self.Retries:
+                    raise HTTPError(Status, URL)
+                RetryAfter = Headers.get('retry-after')
+            self.Counts['Retries'] += 1
+            await asyncio.sleep(Backoff(Attempt, RetryAfter))
+            Attempt += 1
+
+
+async def Ingest(Extent, Deliver, URL=DefaultURL, ClientID='', TileSize=DefaultTileSize, PageSize=DefaultPageSize,
+                 Concurrency=DefaultConcurrency, Retries=DefaultRetries, CacheFolder=DefaultCacheFolder,
+                 CacheAge=DefaultCacheAge, Timeout=DefaultTimeout):
+    '''
+    Coroutine that fetches every page of every tile of a bounding box,
+    Concurrency tiles at a time, and passes the features of each page to
+    Deliver (a blocking function, run in a thread so it can wait for the
+    extractor).  Returns the counts of pages fetched and read from the
+    cache, retries and features.  No cache is used when CacheFolder is blank.
+    '''
+    Loop = asyncio.get_event_loop()
+    Pending = asyncio.Queue()
+    for Tile in Tiles(ParseExtent(Extent), TileSize):
+        Pending.put_nowait(TileURL(URL, Tile, ClientID, PageSize))
+    Pool = ConnectionPool(Concurrency, Timeout)
+    Source = Fetcher(Pool, ResponseCache(CacheFolder, CacheAge) if CacheFolder else None, Retries)
+
+    async def Worker():
+        while not Pending.empty():
+            PageURL = Pending.get_nowait()
+            while PageURL:
+                Features, PageURL = await Source.Page(PageURL)
+                Source.Counts['Features'] += len(Features)
+                if Features:
+                    await Loop.run_in_executor(None, Deliver, Features)
+
+    Workers = [asyncio.ensure_future(Worker()) for Number in range(max(1, Concurrency))]
+    try:
+        await asyncio.gather(*Workers)
+    finally:
+        for Task in Workers:
+            Task.cancel()
+        await asyncio.gather(*Workers, return_exceptions=True)
+        Pool.Close()
+    return Source.Counts
+
+
+def IterFeatures(Extent, URL=DefaultURL, ClientID='', TileSize=DefaultTileSize, PageSize=DefaultPageSize,
+                 Concurrency=DefaultConcurrency, Retries=DefaultRetries, CacheFolder=DefaultCacheFolder,
+                 CacheAge=DefaultCacheAge, Message=None):
+    '''
+    Generator that yields the feature dictionaries of a bounding box as the
+    pages arrive.  The pages are fetched by Ingest in a background thread
+    and wait in a queue of a few pages, so fetching runs ahead of the
+    extractor without holding the whole city.  Message, when given, is
+    called with a summary at the end.
+    '''
+    Pages = queue.Queue(max(1, Concurrency) * QueuedPagesPerWorker)
+    Stop = threading.Event()
+    Finished = []
+
+    def Put(Item):
+        while not Stop.is_set():
+            try:
+                Pages.put(Item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        raise _Stopped()
+
+    def Run():
+        Loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(Loop)
+        try:
+            Finished.append(Loop.run_until_complete(Ingest(Extent, Put, URL, ClientID, TileSize, PageSize,
+                                                           Concurrency, Retries, CacheFolder, CacheAge)))
+            Put(None)
+        except _Stopped:
+            pass
+        except BaseException as Error:
+            try:
+                Put(Error)
+            except _Stopped:
+                pass
+        finally:
+            Loop.close()
+
+    Thread = threading.Thread(target=Run)
+    Thread.daemon = True
+    Thread.start()
+    Seen = set()
+    try:
+        while True:
+            Item = Pages.get()
+            if Item is None:
+                break
+            if isinstance(Item, BaseException):
+                raise Item
+            for Feature in Item:
+                Key = (Feature.get('properties') or {}).get('key')
+                if Key is not None:
+                    if Key in Seen:
+                        continue
+                    Seen.add(Key)
+                yield Feature
+    finally:
+        Stop.set()
+        Thread.join()
+    if Message is not None and Finished:
+        Message('%(Pages)d pages fetched, %(Cached)d read from the cache, %(Retries)d retries' % Finished[0]
+                + ', %d photos' % len(Seen))
+
+
+class APISource(object):
+    '''
+    Reads the rows of a bounding box from the API with the functions above.
+    It has the same ExtractFeatures and ExtractClasses methods as
+    GeoJSONReader.FileSource and the detection cache.
+    '''
+
+    def __init__(self, Extent, ClientID='', URL='', CacheFolder=DefaultCacheFolder, Message=None, **Options):
+        self.Extent = ParseExtent(Extent)
+        self.ClientID = ClientID
+        self.URL = URL or DefaultURL
+        self.CacheFolder = CacheFolder
+        self.Message = Message
+        self.Options = Options
+
+    def Features(self):
+        return IterFeatures(self.Extent, self.URL, self.ClientID, CacheFolder=self.CacheFolder,
+                            Message=self.Message, **self.Options)
+
+    def ExtractFeatures(self, ObjectKey, Default=0.0):
+        return GeoJSONReader.FeatureRows(self.Features(), ObjectKey, Default)
+
+    def ExtractClasses(self, ObjectKeys=None, Threshold=None):
+        return GeoJSONReader.ClassRows(self.Features(), ObjectKeys, Threshold)
+
+
+def WriteFeatureCollection(Features, Path):
+    '''
+    Function that writes features to a GeoJSON FeatureCollection as they
+    arrive and returns the number written.
+    '''
+    Count = 0
+    with open(Path + '.part', 'w') as OutFile:
+        OutFile.write('{"type":"FeatureCollection","features":[')
+        for Feature in Features:
+            OutFile.write((',' if Count else '') + json.dumps(Feature, separators=(',', ':')))
+            Count += 1
+        OutFile.write(']}')
+    os.replace(Path + '.part', Path)
+    return Count
+
+
+def main(Arguments):
+    Start = time.time()
+    Features = IterFeatures(Arguments.extent, Arguments.url, Arguments.client_id, Arguments.tile_size,
+                            Arguments.page_size, Arguments.concurrency, Arguments.retries, Arguments.cache,
+                            Message=print)
+    Count = WriteFeatureCollection(Features, Arguments.output)
+    print('Wrote %d photos to %s in %.1f seconds' % (Count, Arguments.output, time.time() - Start))
+
+
+def ParseArguments():
+    Parser = argparse.ArgumentParser(description='Downloads the Mapillary photos of a bounding box to GeoJSON.')
+    Parser.add_argument('extent', help='"XMin YMin XMax YMax" in longitude and latitude')
+    Parser.add_argument('output', help='GeoJSON file to write')
+    Parser.add_argument('--client-id', default=os.environ.get('MAPILLARY_CLIENT_ID', ''),
+                        help='API client ID (defaults to MAPILLARY_CLIENT_ID)')
+    Parser.add_argument('--url', default=DefaultURL, help='API address of the photos')
+    Parser.add_argument('--cache', default=DefaultCacheFolder, help='response cache folder, blank for none')
+    Parser.add_argument('--concurrency', type=int, default=DefaultConcurrency, help='tiles fetched at the same time')
+    Parser.add_argument('--tile-size', type=float, default=DefaultTileSize, help='tile size in degrees')
+    Parser.add_argument('--page-size', type=int, default=DefaultPageSize, help='features per page')
+    Parser.add_argument('--retries', type=int, default=DefaultRetries, help='retries of a failed request')
+    return Parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(ParseArguments())
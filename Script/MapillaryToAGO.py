@@ -18,10 +18,15 @@
 ###
 
 import arcpy
+import numpy as np
 import os
 import sys
-import xml.dom.minidom as DOM
 import shutil
+import time
+import Instrumentation
+import PublishCache
+import SDDraft
+import SummaryTiles
 
 ###
 ### Input Parameters
@@ -33,111 +38,135 @@ path2MXD = arcpy.GetParameterAsText(1)
 serviceName = arcpy.GetParameterAsText(2)
 serviceSummary = arcpy.GetParameterAsText(3)
 serviceTags = arcpy.GetParameterAsText(4)
+# Optional, true publishes the service even when the MXD and its data have not changed
+forcePublish = arcpy.GetParameterAsText(5).lower() == 'true'
+# Optional feature classes (separated by semicolons) summarised into tiles before publishing,
+# such as the Mapillary photos with their distances and the priority ranking grid
+summaryInputs = arcpy.GetParameterAsText(6)
+# Optional folder for the summary tiles, SummaryTiles beside the MXD by default
+summaryFolder = arcpy.GetParameterAsText(7)
+# Optional zoom levels of the summary tiles as "MinZoom MaxZoom", 10 to 16 by default
+summaryZooms = arcpy.GetParameterAsText(8)
 
 ###
 ### Script Follows
 ###
 
-arcpy.AddMessage('Creating temporary working folder')
-# Create temp folder in local directory, if necessary delete old temp folder first
-tempPath = sys.path[0] + r"\tempArcGISOnline"
-if os.path.isdir(tempPath):
-    shutil.rmtree(tempPath)
-os.makedirs(tempPath)
-
-arcpy.AddMessage('Setting output file parameters')
-# Set file paths to service files
-arcpy.env.overwriteOutput = True
-SDdraft = os.path.join(tempPath, "tempdraft.sddraft")
-newSDdraft = os.path.join(tempPath, "updatedDraft.sddraft")
-SD = os.path.join(tempPath, serviceName + ".sd")
-
-arcpy.AddMessage('Creating initial service definition file')
-#Create service definition draft
-mxd = arcpy.mapping.MapDocument(path2MXD)
-arcpy.mapping.CreateMapSDDraft(mxd, SDdraft, serviceName, "MY_HOSTED_SERVICES", "", True, "", serviceSummary, serviceTags)
-
-
-###
-### From here to the end was mostly developed by ESRI
-### For more info review example 7 here: http://desktop.arcgis.com/en/arcmap/10.3/analyze/arcpy-mapping/createmapsddraft.htm 
-###
-
-arcpy.AddMessage('Updating service definition to enable feature access')
-# Read the contents of the original SDDraft into an xml parser
-doc = DOM.parse(SDdraft)
-
-# The following 5 code pieces modify the SDDraft from a new MapService
-# with caching capabilities to a FeatureService with Query,Create,
-# Update,Delete,Uploads,Editing capabilities. The first two code
-# pieces handle overwriting an existing service. The last three pieces
-# change Map to Feature Service, disable caching and set appropriate
-# capabilities. You can customize the capabilities by removing items.
-# Note you cannot disable Query from a Feature Service.
-tagsType = doc.getElementsByTagName('Type')
-for tagType in tagsType:
-    if tagType.parentNode.tagName == 'SVCManifest':
-        if tagType.hasChildNodes():
-            tagType.firstChild.data = "esriServiceDefinitionType_Replacement"
-
-tagsState = doc.getElementsByTagName('State')
-for tagState in tagsState:
-    if tagState.parentNode.tagName == 'SVCManifest':
-        if tagState.hasChildNodes():
-            tagState.firstChild.data = "esriSDState_Published"
-
-# Change service type from map service to feature service
-typeNames = doc.getElementsByTagName('TypeName')
-for typeName in typeNames:
-    if typeName.firstChild.data == "MapServer":
-        typeName.firstChild.data = "FeatureServer"
-
-# Turn off caching
-configProps = doc.getElementsByTagName('ConfigurationProperties')[0]
-propArray = configProps.firstChild
-propSets = propArray.childNodes
-for propSet in propSets:
-    keyValues = propSet.childNodes
-    for keyValue in keyValues:
-        if keyValue.tagName == 'Key':
-            if keyValue.firstChild.data == "isCached":
-                keyValue.nextSibling.firstChild.data = "false"
-
-# Turn on feature access capabilities
-configProps = doc.getElementsByTagName('Info')[0]
-propArray = configProps.firstChild
-propSets = propArray.childNodes
-for propSet in propSets:
-    keyValues = propSet.childNodes
-    for keyValue in keyValues:
-        if keyValue.tagName == 'Key':
-            if keyValue.firstChild.data == "WebCapabilities":
-                keyValue.nextSibling.firstChild.data = "Query,Create,Update,Delete,Uploads,Editing"
-
-# Write the new draft to disk
-f = open(newSDdraft, 'w')
-doc.writexml( f )
-f.close()
-
-# Analyze the service
-analysis = arcpy.mapping.AnalyzeForSD(newSDdraft)
-
-arcpy.AddMessage('Uploading service definition to ArcGIS Online')
-if analysis['errors'] == {}:
-    # Stage the service
-    arcpy.StageService_server(newSDdraft, SD)
-
-    # Upload the service. The OVERRIDE_DEFINITION parameter allows you to override the
-    # sharing properties set in the service definition with new values. In this case,
-    # the feature service will be shared to everyone on ArcGIS.com by specifying the
-    # SHARE_ONLINE and PUBLIC parameters. Optionally you can share to specific groups
-    # using the last parameter, in_groups.
-    arcpy.UploadServiceDefinition_server(SD, "My Hosted Services", serviceName,
-                                         "", "", "", "", "OVERRIDE_DEFINITION", "SHARE_ONLINE",
-                                         "PRIVATE", "NO_SHARE_ORGANIZATION", "")
-
-    print "Uploaded and overwrote service"
-
-else:
-    # If the sddraft analysis contained errors, display them and quit.
-    print analysis['errors']
+# Stage timings are reported at the end and written as JSON when MAPILLARY_TRACE is set
+# (the finally clause records a run that stops with an error as failed)
+Trace = Instrumentation.StartTrace('MapillaryToAGO', Message=arcpy.AddMessage)
+succeeded = False
+try:
+    if summaryInputs:
+        arcpy.AddMessage('Updating the summary tiles')
+        summaryStage = Trace.Next('SummaryTiles')
+        # Web clients read the bins of these tiles instead of every feature of the service,
+        # only the tiles where features were added, changed or removed are written again.
+        # The folder is not part of the service, hosting it for the web apps is a separate step
+        minZoom, maxZoom = SummaryTiles.ParseZooms(summaryZooms)
+        if not summaryFolder:
+            summaryFolder = os.path.join(os.path.dirname(path2MXD), "SummaryTiles")
+        summaryStage.Rows = 0
+        for summaryInput in [name.strip().strip("'") for name in summaryInputs.split(';') if name.strip()]:
+            # Every Double field is summarised (scores, distances, priority), IDs and counts are not
+            fields = [field.name for field in arcpy.ListFields(summaryInput) if field.type in ('Double', 'Single')]
+            features = arcpy.da.FeatureClassToNumPyArray(summaryInput, ['SHAPE@XY'] + fields,
+                                                         spatial_reference=arcpy.SpatialReference(4326),
+                                                         null_value=dict((field, float('nan')) for field in fields))
+            values = [features[field] for field in fields]
+            values = np.column_stack(values) if values else np.zeros((len(features), 0))
+            layerName = os.path.splitext(os.path.basename(arcpy.Describe(summaryInput).catalogPath))[0]
+            counts = SummaryTiles.UpdateTiles(os.path.join(summaryFolder, layerName), features['SHAPE@XY'][:, 0],
+                                              features['SHAPE@XY'][:, 1], fields, values, minZoom, maxZoom)
+            arcpy.AddMessage('%s: %d tiles written, %d removed, %d areas unchanged'
+                             % (layerName, counts['Written'], counts['Removed'], counts['Unchanged']))
+            summaryStage.Rows += len(features)
+        arcpy.AddMessage('The summary tiles are in %s, they are not uploaded with the service' % summaryFolder)
+
+    arcpy.AddMessage('Checking for changes since the last upload')
+    hashStage = Trace.Next('HashContent')
+    # Hash the MXD, the files of its layers and tables and the service settings,
+    # an unchanged hash means the hosted service is already up to date
+    mxd = arcpy.mapping.MapDocument(path2MXD)
+    dataSources = [layer.dataSource for layer in arcpy.mapping.ListLayers(mxd) if layer.supportsDataSource]
+    dataSources += [table.dataSource for table in arcpy.mapping.ListTableViews(mxd)]
+    statePath = PublishCache.StatePathFor(path2MXD)
+    publishState = PublishCache.ReadState(statePath)
+    contentHash, contentFiles = PublishCache.ContentHash(path2MXD, dataSources,
+                                                         [serviceName, serviceSummary, serviceTags],
+                                                         PublishCache.KnownFiles(publishState, serviceName))
+    hashStage.Rows = len(contentFiles)
+    if not forcePublish and PublishCache.IsUnchanged(publishState, serviceName, contentHash):
+        arcpy.AddMessage('The MXD and its data have not changed since the last upload, the service is up to date')
+        succeeded = True
+        sys.exit(0)
+
+    arcpy.AddMessage('Creating temporary working folder')
+    Trace.Next('CreateTempFolder')
+    # Create temp folder in local directory, if necessary delete old temp folder first
+    tempPath = sys.path[0] + r"\tempArcGISOnline"
+    if os.path.isdir(tempPath):
+        shutil.rmtree(tempPath)
+    os.makedirs(tempPath)
+
+    arcpy.AddMessage('Setting output file parameters')
+    # Set file paths to service files
+    arcpy.env.overwriteOutput = True
+    SDdraft = os.path.join(tempPath, "tempdraft.sddraft")
+    newSDdraft = os.path.join(tempPath, "updatedDraft.sddraft")
+    SD = os.path.join(tempPath, serviceName + ".sd")
+
+    arcpy.AddMessage('Creating initial service definition file')
+    #Create service definition draft
+    Trace.Next('CreateMapSDDraft')
+    arcpy.mapping.CreateMapSDDraft(mxd, SDdraft, serviceName, "MY_HOSTED_SERVICES", "", True, "", serviceSummary, serviceTags)
+
+
+    ###
+    ### From here to the end was mostly developed by ESRI
+    ### For more info review example 7 here: http://desktop.arcgis.com/en/arcmap/10.3/analyze/arcpy-mapping/createmapsddraft.htm 
+    ###
+
+    arcpy.AddMessage('Updating service definition to enable feature access')
+    updateStage = Trace.Next('UpdateSDDraft')
+    # The draft is rewritten in a single streaming pass (see SDDraft.py) that
+    # modifies it from a new MapService with caching capabilities to a
+    # FeatureService with Query,Create,Update,Delete,Uploads,Editing
+    # capabilities.  The first two edits handle overwriting an existing service.
+    # The last three change Map to Feature Service, disable caching and set
+    # appropriate capabilities. You can customize the capabilities by removing
+    # items. Note you cannot disable Query from a Feature Service.
+    edits = SDDraft.RewriteSDDraft(SDdraft, newSDdraft, "Query,Create,Update,Delete,Uploads,Editing")
+    updateStage.Rows = sum(edits.values())
+
+    # Analyze the service
+    Trace.Next('AnalyzeForSD')
+    analysis = arcpy.mapping.AnalyzeForSD(newSDdraft)
+
+    arcpy.AddMessage('Uploading service definition to ArcGIS Online')
+    if analysis['errors'] == {}:
+        # Stage the service
+        Trace.Next('StageService')
+        arcpy.StageService_server(newSDdraft, SD)
+
+        # Upload the service. The OVERRIDE_DEFINITION parameter allows you to override the
+        # sharing properties set in the service definition with new values. In this case,
+        # the feature service will be shared to everyone on ArcGIS.com by specifying the
+        # SHARE_ONLINE and PUBLIC parameters. Optionally you can share to specific groups
+        # using the last parameter, in_groups.
+        Trace.Next('UploadServiceDefinition')
+        arcpy.UploadServiceDefinition_server(SD, "My Hosted Services", serviceName,
+                                             "", "", "", "", "OVERRIDE_DEFINITION", "SHARE_ONLINE",
+                                             "PRIVATE", "NO_SHARE_ORGANIZATION", "")
+
+        print "Uploaded and overwrote service"
+        # Remember what was published so the next run can skip an unchanged MXD
+        PublishCache.Record(statePath, publishState, serviceName, contentHash, contentFiles,
+                            time.strftime('%Y-%m-%d %H:%M:%S'))
+
+    else:
+        # If the sddraft analysis contained errors, display them and quit.
+        print analysis['errors']
+    succeeded = analysis['errors'] == {}
+finally:
+    Trace.Finish(succeeded)
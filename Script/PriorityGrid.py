@@ -0,0 +1,404 @@
+### Description: Capture priority ranking of a city grid calculated from arrays
+### instead of a chain of geoprocessing tools.  It produces the same fields as
+### the GridRanking feature class of SpatiallyAnalyzePhotos.py:
+###
+###     Join_Count      photos within the buffer distance of a known feature
+###                     that fall in the grid cell
+###     SUM_Shape_Area  area of the cell within the buffer distance of a known
+###                     feature
+###     MCE_Photo_Count 1 - Join_Count / largest Join_Count
+###     MCE_Shape_Area  SUM_Shape_Area / largest SUM_Shape_Area
+###     Priority        PhotoWeight * MCE_Photo_Count + AreaWeight * MCE_Shape_Area
+###
+### The grid covers the extent of the boundary and keeps the cells that touch
+### the boundary (like GridIndexFeatures with INTERSECTFEATURE), numbered from
+### the top left corner row by row.  The buffered area is measured on a lattice
+### of sample points in each cell.  Each sample counts for the share of its
+### square that is estimated to be within the buffer distance of a known
+### point, from how far inside or outside the buffer edge it is (a plain in or
+### out test over-counted by 2 to 3% when the known points lined up with the
+### lattice).  With the default spacing the area of a buffer is within 1% of
+### the exact area.  Overlapping buffers are counted once, where the
+### Buffer/Identity/Statistics chain added up the area of every buffer piece.
+### Known lines should be passed as points densified along the lines at a
+### spacing well below the buffer distance.
+###
+### RankGridTiled splits the grid into square tiles of cells and ranks the
+### tiles in a multiprocessing pool.  Each tile only needs its own photos and
+### the known points within the buffer distance of the tile (the halo), and
+### every cell belongs to one tile, so the merged result is the same as the
+### serial one.  Because the ArcGIS tool scripts run their code when they are
+### imported, tools should call RankGridInSubprocess, which runs the pool from
+### this module in a separate Python process:
+###
+###     python PriorityGrid.py <input .npz> <output .npy> <workers>
+###
+### This script was designed to work with ArcGIS 10.4/10.5 and Python 2.7.10,
+### and also runs under Python 3.  It needs NumPy but does not require arcpy.
+
+###
+### import modules
+###
+
+import math
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import numpy as np
+import SpatialIndex
+
+###
+### Script Follows
+###
+
+# Fields of the ranked grid returned by RankGrid
+GridFields = [('PageNumber', np.int64), ('Row', np.int64), ('Column', np.int64),
+              ('XMin', np.float64), ('YMin', np.float64), ('XMax', np.float64), ('YMax', np.float64),
+              ('Join_Count', np.int64), ('SUM_Shape_Area', np.float64),
+              ('MCE_Photo_Count', np.float64), ('MCE_Shape_Area', np.float64), ('Priority', np.float64)]
+
+# Number of boundary test points along each side of a cell
+BoundaryTestPoints = 5
+# Upper limit on the number of area sample points handled in one array step
+MaxSamplesPerStep = 1000000
+# Number of tiles per worker when the tile size is not given
+TilesPerWorker = 4
+
+
+def RankGrid(PhotoX, PhotoY, KnownX, KnownY, BoundaryRings, CellSize, BufferDistance,
+             PhotoWeight=0.5, AreaWeight=0.5, SampleSpacing=None):
+    '''
+    Function that ranks the grid cells covering a boundary by capture
+    priority.  Takes the photo and known point coordinates as arrays, the
+    boundary as a list of rings (each a sequence of X,Y pairs), the grid cell
+    size and buffer distance in map units and the MCE weights.  The area
+    sample spacing defaults to a fifth of the buffer distance.  Returns a
+    NumPy structured array with one record per cell (see GridFields).
+    '''
+    Grid = CellGrid(BoundaryRings, CellSize)
+    KnownX = np.asarray(KnownX, dtype=np.float64).ravel()
+    KnownY = np.asarray(KnownY, dtype=np.float64).ravel()
+    if KnownX.size:
+        Index = SpatialIndex.NearestIndex(KnownX, KnownY)
+    else:
+        Index = None
+    Counts = CountPhotos(Grid, PhotoX, PhotoY, Index, BufferDistance)
+    Areas = BufferArea(Grid, Index, BufferDistance, SampleSpacing)
+    return ScoreGrid(Grid, Counts, Areas, PhotoWeight, AreaWeight)
+
+
+def ScoreGrid(Grid, Counts, Areas, PhotoWeight=0.5, AreaWeight=0.5):
+    '''
+    Function that builds the ranked grid records from the photo count and
+    buffered area of each cell and calculates the MCE priority score.
+    '''
+    Ranked = np.zeros(Grid.Count, dtype=GridFields)
+    Ranked['PageNumber'] = np.arange(1, Grid.Count + 1)
+    Ranked['Row'] = Grid.Rows
+    Ranked['Column'] = Grid.Columns
+    Ranked['XMin'], Ranked['YMin'], Ranked['XMax'], Ranked['YMax'] = Grid.CellExtents()
+    Ranked['Join_Count'] = Counts
+    Ranked['SUM_Shape_Area'] = Areas
+    return ScoreRecords(Ranked, PhotoWeight, AreaWeight)
+
+
+def ScoreRecords(Ranked, PhotoWeight=0.5, AreaWeight=0.5):
+    '''
+    Function that fills in the MCE fields of ranked grid records from their
+    Join_Count and SUM_Shape_Area.  A field whose largest value is 0 gives an
+    MCE value of 0 instead of dividing by zero.
+    '''
+    MaxPhotos = Ranked['Join_Count'].max() if Ranked.size else 0
+    MaxArea = Ranked['SUM_Shape_Area'].max() if Ranked.size else 0
+    if MaxPhotos > 0:
+        Ranked['MCE_Photo_Count'] = 1 - Ranked['Join_Count'] / float(MaxPhotos)
+    else:
+        Ranked['MCE_Photo_Count'] = 0.0
+    if MaxArea > 0:
+        Ranked['MCE_Shape_Area'] = Ranked['SUM_Shape_Area'] / MaxArea
+    else:
+        Ranked['MCE_Shape_Area'] = 0.0
+    Ranked['Priority'] = PhotoWeight * Ranked['MCE_Photo_Count'] + AreaWeight * Ranked['MCE_Shape_Area']
+    return Ranked
+
+
+def CountPhotos(Grid, PhotoX, PhotoY, Index, BufferDistance):
+    '''
+    Function that counts, for each grid cell, the photos that are within the
+    buffer distance of a known point.
+    '''
+    PhotoX = np.asarray(PhotoX, dtype=np.float64).ravel()
+    PhotoY = np.asarray(PhotoY, dtype=np.float64).ravel()
+    if Index is None or PhotoX.size == 0:
+        return np.zeros(Grid.Count, dtype=np.int64)
+    Cells = Grid.CellOf(PhotoX, PhotoY)
+    Near = Cells >= 0
+    Distances = Index.Query(PhotoX[Near], PhotoY[Near])[0]
+    Cells = Cells[Near][np.asarray(Distances) <= BufferDistance]
+    return np.bincount(Cells, minlength=Grid.Count)
+
+
+def BufferArea(Grid, Index, BufferDistance, SampleSpacing=None):
+    '''
+    Function that measures, for each grid cell, the area within the buffer
+    distance of a known point.
+    '''
+    if Index is None or Grid.Count == 0:
+        return np.zeros(Grid.Count)
+    XMin, YMin, XMax, YMax = Grid.CellExtents()
+    return CellBufferArea(XMin, YMin, Grid.CellSize, Index, BufferDistance, SampleSpacing)
+
+
+def CellBufferArea(XMin, YMin, CellSize, Index, BufferDistance, SampleSpacing=None):
+    '''
+    Function that measures the area within the buffer distance of a known
+    point for the cells with the given lower left corners.  A lattice of
+    sample points is laid over the cells that can reach a known point and
+    each sample counts for the part of its square estimated to be within the
+    buffer distance: all of it half a step inside the buffer edge, none of it
+    half a step outside and a straight line share in between.
+    '''
+    Areas = np.zeros(XMin.size)
+    if SampleSpacing is None:
+        SampleSpacing = BufferDistance / 5.0
+    PerSide = max(1, int(math.ceil(CellSize / float(SampleSpacing))))
+    Step = CellSize / PerSide
+    # Cells whose centre is further than the buffer plus half a diagonal cannot touch a buffer
+    CentreDistance = np.asarray(Index.Query(XMin + CellSize / 2, YMin + CellSize / 2)[0])
+    Candidates = np.flatnonzero(CentreDistance <= BufferDistance + CellSize * math.sqrt(2) / 2)
+    Offsets = (np.arange(PerSide) + 0.5) * Step
+    OffsetX = np.tile(Offsets, PerSide)
+    OffsetY = np.repeat(Offsets, PerSide)
+    CellsPerStep = max(1, MaxSamplesPerStep // OffsetX.size)
+    for Start in range(0, Candidates.size, CellsPerStep):
+        Cells = Candidates[Start:Start + CellsPerStep]
+        SampleX = (XMin[Cells][:, None] + OffsetX[None, :]).ravel()
+        SampleY = (YMin[Cells][:, None] + OffsetY[None, :]).ravel()
+        Distances = np.asarray(Index.Query(SampleX, SampleY)[0])
+        Covered = np.clip((BufferDistance - Distances) / Step + 0.5, 0.0, 1.0)
+        Areas[Cells] = Covered.reshape(Cells.size, OffsetX.size).sum(axis=1) * Step ** 2
+    return Areas
+
+
+def RankGridTiled(PhotoX, PhotoY, KnownX, KnownY, BoundaryRings, CellSize, BufferDistance,
+                  PhotoWeight=0.5, AreaWeight=0.5, SampleSpacing=None, Workers=None, TileCells=None):
+    '''
+    Function that ranks the grid like RankGrid with the cells split into
+    tiles that are processed in a pool of worker processes.  Workers defaults
+    to the number of CPUs and TileCells (the width of a tile in grid cells)
+    to a size that gives each worker a few tiles.  The tile results are
+    merged by cell number, so the output does not depend on the order the
+    tiles finish in.
+    '''
+    if not Workers:
+        Workers = multiprocessing.cpu_count()
+    Grid = CellGrid(BoundaryRings, CellSize)
+    if TileCells is None:
+        TileCells = max(1, int(math.ceil(math.sqrt(Grid.Count / float(Workers * TilesPerWorker)))))
+    Tasks = TileTasks(Grid, PhotoX, PhotoY, KnownX, KnownY, BufferDistance, SampleSpacing, TileCells)
+    if Workers == 1:
+        Results = [RankTile(Task) for Task in Tasks]
+    else:
+        Pool = multiprocessing.Pool(Workers)
+        try:
+            Results = Pool.map(RankTile, Tasks, 1)
+        finally:
+            Pool.close()
+            Pool.join()
+    Counts = np.zeros(Grid.Count, dtype=np.int64)
+    Areas = np.zeros(Grid.Count)
+    for Cells, TileCounts, TileAreas in Results:
+        Counts[Cells] = TileCounts
+        Areas[Cells] = TileAreas
+    return ScoreGrid(Grid, Counts, Areas, PhotoWeight, AreaWeight)
+
+
+def TileTasks(Grid, PhotoX, PhotoY, KnownX, KnownY, BufferDistance, SampleSpacing, TileCells):
+    '''
+    Function that splits the kept cells of a grid into square tiles and
+    returns one task per tile for RankTile.  A task holds the tile's cells,
+    the photos that fall in them and the known points within the buffer
+    distance of the tile.
+    '''
+    PhotoX = np.asarray(PhotoX, dtype=np.float64).ravel()
+    PhotoY = np.asarray(PhotoY, dtype=np.float64).ravel()
+    KnownX = np.asarray(KnownX, dtype=np.float64).ravel()
+    KnownY = np.asarray(KnownY, dtype=np.float64).ravel()
+    XMin, YMin, XMax, YMax = Grid.CellExtents()
+    TileColumns = int(math.ceil(Grid.NColumns / float(TileCells)))
+    CellTiles = (Grid.Rows // TileCells) * TileColumns + Grid.Columns // TileCells
+    PhotoCells = Grid.CellOf(PhotoX, PhotoY)
+    Inside = np.flatnonzero(PhotoCells >= 0)
+    PhotoOrder = Inside[np.argsort(CellTiles[PhotoCells[Inside]], kind='mergesort')]
+    PhotoTiles = CellTiles[PhotoCells[PhotoOrder]]
+    Tasks = []
+    for Tile in np.unique(CellTiles):
+        Cells = np.flatnonzero(CellTiles == Tile)
+        Photos = PhotoOrder[np.searchsorted(PhotoTiles, Tile, 'left'):np.searchsorted(PhotoTiles, Tile, 'right')]
+        Halo = ((KnownX >= XMin[Cells].min() - BufferDistance) & (KnownX <= XMax[Cells].max() + BufferDistance) &
+                (KnownY >= YMin[Cells].min() - BufferDistance) & (KnownY <= YMax[Cells].max() + BufferDistance))
+        LocalCells = np.searchsorted(Cells, PhotoCells[Photos])
+        Tasks.append((Cells, XMin[Cells], YMin[Cells], Grid.CellSize, LocalCells, PhotoX[Photos], PhotoY[Photos],
+                      KnownX[Halo], KnownY[Halo], BufferDistance, SampleSpacing))
+    return Tasks
+
+
+def RankTile(Task):
+    '''
+    Function run by the workers that returns the cell numbers, photo counts
+    and buffered areas of one tile.
+    '''
+    Cells, XMin, YMin, CellSize, PhotoCells, PhotoX, PhotoY, KnownX, KnownY, BufferDistance, SampleSpacing = Task
+    if KnownX.size == 0:
+        return Cells, np.zeros(Cells.size, dtype=np.int64), np.zeros(Cells.size)
+    Index = SpatialIndex.NearestIndex(KnownX, KnownY)
+    Counts = np.zeros(Cells.size, dtype=np.int64)
+    if PhotoX.size:
+        Within = np.asarray(Index.Query(PhotoX, PhotoY)[0]) <= BufferDistance
+        Counts = np.bincount(PhotoCells[Within], minlength=Cells.size)
+    return Cells, Counts, CellBufferArea(XMin, YMin, CellSize, Index, BufferDistance, SampleSpacing)
+
+
+def RankGridInSubprocess(PhotoX, PhotoY, KnownX, KnownY, BoundaryRings, CellSize, BufferDistance,
+                         PhotoWeight=0.5, AreaWeight=0.5, Workers=None):
+    '''
+    Function that runs RankGridTiled in a separate Python process and returns
+    its ranked grid.  The inputs and result are passed through temporary
+    NumPy files.
+    '''
+    Folder = tempfile.mkdtemp()
+    InputPath = os.path.join(Folder, 'RankGridInput.npz')
+    OutputPath = os.path.join(Folder, 'RankGridOutput.npy')
+    Rings = [np.asarray(Ring, dtype=np.float64).reshape(-1, 2) for Ring in BoundaryRings]
+    try:
+        np.savez(InputPath, PhotoX=PhotoX, PhotoY=PhotoY, KnownX=KnownX, KnownY=KnownY,
+                 RingVertices=np.concatenate(Rings), RingSizes=np.array([Ring.shape[0] for Ring in Rings]),
+                 Settings=np.array([CellSize, BufferDistance, PhotoWeight, AreaWeight]))
+        subprocess.check_call([PythonExecutable(), os.path.abspath(__file__), InputPath, OutputPath, str(Workers or 0)])
+        return np.load(OutputPath)
+    finally:
+        for Path in (InputPath, OutputPath):
+            if os.path.exists(Path):
+                os.remove(Path)
+        os.rmdir(Folder)
+
+
+def PythonExecutable():
+    '''
+    Returns the Python interpreter to start worker processes with.  Inside
+    ArcMap sys.executable is ArcMap itself, so the python.exe installed
+    beside it is used instead.
+    '''
+    if os.path.basename(sys.executable).lower().startswith('python'):
+        return sys.executable
+    return os.path.join(sys.exec_prefix, 'python.exe')
+
+
+def PointsInPolygon(X, Y, Rings, EdgesPerStep=256):
+    '''
+    Function that returns a boolean array that is True for the points inside
+    a polygon given as a list of rings.  Uses the even-odd rule, so holes
+    (interior rings) are handled without knowing which ring is which.
+    '''
+    X = np.asarray(X, dtype=np.float64).ravel()
+    Y = np.asarray(Y, dtype=np.float64).ravel()
+    Inside = np.zeros(X.size, dtype=bool)
+    Starts = []
+    Ends = []
+    for Ring in Rings:
+        Ring = np.asarray(Ring, dtype=np.float64).reshape(-1, 2)
+        if Ring.shape[0] < 3:
+            continue
+        Starts.append(Ring)
+        Ends.append(np.roll(Ring, -1, axis=0))
+    if not Starts:
+        return Inside
+    Starts = np.concatenate(Starts)
+    Ends = np.concatenate(Ends)
+    for Start in range(0, Starts.shape[0], EdgesPerStep):
+        X0 = Starts[Start:Start + EdgesPerStep, 0][:, None]
+        Y0 = Starts[Start:Start + EdgesPerStep, 1][:, None]
+        X1 = Ends[Start:Start + EdgesPerStep, 0][:, None]
+        Y1 = Ends[Start:Start + EdgesPerStep, 1][:, None]
+        Straddles = (Y0 > Y[None, :]) != (Y1 > Y[None, :])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            CrossX = X0 + (Y[None, :] - Y0) * (X1 - X0) / (Y1 - Y0)
+        Crossings = Straddles & (X[None, :] < CrossX)
+        Inside ^= (Crossings.sum(axis=0) % 2).astype(bool)
+    return Inside
+
+
+class CellGrid(object):
+    '''
+    The grid cells that cover a boundary.  XMin and YTop are the top left
+    corner of the grid, NRows and NColumns its full size and Rows/Columns the
+    position of each cell that touches the boundary, in page number order.
+    '''
+
+    def __init__(self, BoundaryRings, CellSize):
+        self.CellSize = float(CellSize)
+        self.BoundaryRings = [np.asarray(Ring, dtype=np.float64).reshape(-1, 2) for Ring in BoundaryRings]
+        Vertices = np.concatenate(self.BoundaryRings)
+        self.XMin = Vertices[:, 0].min()
+        YMin = Vertices[:, 1].min()
+        self.NColumns = max(1, int(math.ceil((Vertices[:, 0].max() - self.XMin) / self.CellSize)))
+        self.NRows = max(1, int(math.ceil((Vertices[:, 1].max() - YMin) / self.CellSize)))
+        self.YTop = YMin + self.NRows * self.CellSize
+        Keep = self._TouchesBoundary(Vertices)
+        self.Rows, self.Columns = np.divmod(np.flatnonzero(Keep), self.NColumns)
+        self.Count = self.Rows.size
+        # Lookup from the position in the full grid to the kept cell number (-1 for dropped cells)
+        self.Lookup = np.full(self.NRows * self.NColumns, -1, dtype=np.int64)
+        self.Lookup[np.flatnonzero(Keep)] = np.arange(self.Count)
+
+    def _TouchesBoundary(self, Vertices):
+        '''
+        Returns a flag for every cell of the full grid that is True when the
+        cell holds a boundary vertex or one of its test points is inside the
+        boundary.
+        '''
+        Keep = np.zeros(self.NRows * self.NColumns, dtype=bool)
+        Column = np.floor((Vertices[:, 0] - self.XMin) / self.CellSize).astype(np.int64)
+        Row = np.floor((self.YTop - Vertices[:, 1]) / self.CellSize).astype(np.int64)
+        Valid = (Column >= 0) & (Column < self.NColumns) & (Row >= 0) & (Row < self.NRows)
+        Keep[Row[Valid] * self.NColumns + Column[Valid]] = True
+        Fractions = np.linspace(0, 1, BoundaryTestPoints)
+        AllRows, AllColumns = np.divmod(np.arange(self.NRows * self.NColumns), self.NColumns)
+        Undecided = np.flatnonzero(~Keep)
+        TestX = (self.XMin + (AllColumns[Undecided][:, None] + np.tile(Fractions, BoundaryTestPoints)[None, :]) * self.CellSize).ravel()
+        TestY = (self.YTop - (AllRows[Undecided][:, None] + np.repeat(Fractions, BoundaryTestPoints)[None, :]) * self.CellSize).ravel()
+        Inside = PointsInPolygon(TestX, TestY, self.BoundaryRings).reshape(Undecided.size, -1)
+        Keep[Undecided[Inside.any(axis=1)]] = True
+        return Keep
+
+    def CellExtents(self):
+        '''
+        Returns the XMin, YMin, XMax and YMax arrays of the kept cells.
+        '''
+        XMin = self.XMin + self.Columns * self.CellSize
+        YMax = self.YTop - self.Rows * self.CellSize
+        return XMin, YMax - self.CellSize, XMin + self.CellSize, YMax
+
+    def CellOf(self, X, Y):
+        '''
+        Returns the kept cell number of each point, -1 for points outside of
+        the kept cells.
+        '''
+        Column = np.floor((X - self.XMin) / self.CellSize).astype(np.int64)
+        Row = np.floor((self.YTop - Y) / self.CellSize).astype(np.int64)
+        Valid = (Column >= 0) & (Column < self.NColumns) & (Row >= 0) & (Row < self.NRows)
+        Cells = np.full(X.size, -1, dtype=np.int64)
+        Cells[Valid] = self.Lookup[Row[Valid] * self.NColumns + Column[Valid]]
+        return Cells
+
+
+if __name__ == "__main__":
+    Inputs = np.load(sys.argv[1])
+    RingEnds = np.cumsum(Inputs['RingSizes'])
+    Rings = np.split(Inputs['RingVertices'], RingEnds[:-1])
+    CellSize, BufferDistance, PhotoWeight, AreaWeight = Inputs['Settings']
+    Ranked = RankGridTiled(Inputs['PhotoX'], Inputs['PhotoY'], Inputs['KnownX'], Inputs['KnownY'], Rings,
+                           CellSize, BufferDistance, PhotoWeight, AreaWeight, Workers=int(sys.argv[3]) or None)
+    np.save(sys.argv[2], Ranked)
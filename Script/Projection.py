@@ -0,0 +1,189 @@
+### Description: Coordinate transformations for the Mapillary tools done on whole
+### NumPy arrays instead of feature class copies.  Mapillary coordinates are
+### longitude and latitude on WGS 1984 (EPSG:4326) and can be projected to Web
+### Mercator (EPSG:3857, also known to ArcGIS as 102100) or to any WGS 1984 UTM
+### zone (EPSG:32601-32660 north, 32701-32760 south).  UTM uses the Kruger
+### series for the transverse Mercator, accurate to well under a millimetre
+### within a zone.
+###
+### This script was designed to work with ArcGIS 10.4/10.5 and Python 2.7.10,
+### and also runs under Python 3.  It needs NumPy but does not require arcpy.
+
+###
+### import modules
+###
+
+import math
+import numpy as np
+
+###
+### Script Follows
+###
+
+# WGS 1984 ellipsoid
+SemiMajorAxis = 6378137.0
+Flattening = 1 / 298.257223563
+# Web Mercator stops at the latitude where the map becomes square
+MaxMercatorLatitude = 85.0511287798066
+# Number of rows projected together by ProjectRows
+DefaultBlockSize = 10000
+
+# Series coefficients of the transverse Mercator in the third flattening
+_N = Flattening / (2 - Flattening)
+_Eccentricity = math.sqrt(Flattening * (2 - Flattening))
+_RectifyingRadius = SemiMajorAxis / (1 + _N) * (1 + _N ** 2 / 4 + _N ** 4 / 64)
+_Alpha = (_N / 2 - 2 * _N ** 2 / 3 + 5 * _N ** 3 / 16 + 41 * _N ** 4 / 180,
+          13 * _N ** 2 / 48 - 3 * _N ** 3 / 5 + 557 * _N ** 4 / 1440,
+          61 * _N ** 3 / 240 - 103 * _N ** 4 / 140,
+          49561 * _N ** 4 / 161280)
+_Beta = (_N / 2 - 2 * _N ** 2 / 3 + 37 * _N ** 3 / 96 - _N ** 4 / 360,
+         _N ** 2 / 48 + _N ** 3 / 15 - 437 * _N ** 4 / 1440,
+         17 * _N ** 3 / 480 - 37 * _N ** 4 / 840,
+         4397 * _N ** 4 / 161280)
+_Delta = (2 * _N - 2 * _N ** 2 / 3 - 2 * _N ** 3 + 116 * _N ** 4 / 45,
+          7 * _N ** 2 / 3 - 8 * _N ** 3 / 5 - 227 * _N ** 4 / 45,
+          56 * _N ** 3 / 15 - 136 * _N ** 4 / 35,
+          4279 * _N ** 4 / 630)
+UTMScale = 0.9996
+UTMFalseEasting = 500000.0
+UTMFalseNorthingSouth = 10000000.0
+
+
+def WebMercator(Lon, Lat):
+    '''
+    Function that projects longitude and latitude arrays to Web Mercator
+    metres.  Latitudes beyond the limit of the projection are clamped.
+    '''
+    Lon = np.asarray(Lon, dtype=np.float64)
+    Lat = np.clip(np.asarray(Lat, dtype=np.float64), -MaxMercatorLatitude, MaxMercatorLatitude)
+    X = SemiMajorAxis * np.radians(Lon)
+    Y = SemiMajorAxis * np.log(np.tan(np.pi / 4 + np.radians(Lat) / 2))
+    return X, Y
+
+
+def InverseWebMercator(X, Y):
+    '''
+    Function that returns the longitude and latitude of Web Mercator points.
+    '''
+    Lon = np.degrees(np.asarray(X, dtype=np.float64) / SemiMajorAxis)
+    Lat = np.degrees(2 * np.arctan(np.exp(np.asarray(Y, dtype=np.float64) / SemiMajorAxis)) - np.pi / 2)
+    return Lon, Lat
+
+
+def UTMZone(Lon, Lat=0.0):
+    '''
+    Function that returns the UTM zone number and hemisphere (True for
+    north) of a longitude and latitude, usually the centre of a dataset.
+    '''
+    Zone = int(math.floor((float(Lon) + 180) / 6)) % 60 + 1
+    return Zone, float(Lat) >= 0
+
+
+def UTMWkid(Zone, North=True):
+    '''
+    Function that returns the WKID of a WGS 1984 UTM zone.
+    '''
+    return (32600 if North else 32700) + int(Zone)
+
+
+def UTM(Lon, Lat, Zone, North=True):
+    '''
+    Function that projects longitude and latitude arrays to easting and
+    northing in metres for a WGS 1984 UTM zone.
+    '''
+    Phi = np.radians(np.asarray(Lat, dtype=np.float64))
+    Lambda = np.radians(np.asarray(Lon, dtype=np.float64) - (6 * int(Zone) - 183))
+    # Wrap the longitude difference so zones near the antimeridian work
+    Lambda = (Lambda + np.pi) % (2 * np.pi) - np.pi
+    SinPhi = np.sin(Phi)
+    Tau = np.sinh(np.arctanh(SinPhi) - _Eccentricity * np.arctanh(_Eccentricity * SinPhi))
+    XiPrime = np.arctan2(Tau, np.cos(Lambda))
+    EtaPrime = np.arcsinh(np.sin(Lambda) / np.hypot(Tau, np.cos(Lambda)))
+    Xi = XiPrime.copy()
+    Eta = EtaPrime.copy()
+    for Order, Alpha in enumerate(_Alpha, 1):
+        Xi += Alpha * np.sin(2 * Order * XiPrime) * np.cosh(2 * Order * EtaPrime)
+        Eta += Alpha * np.cos(2 * Order * XiPrime) * np.sinh(2 * Order * EtaPrime)
+    X = UTMFalseEasting + UTMScale * _RectifyingRadius * Eta
+    Y = UTMScale * _RectifyingRadius * Xi
+    if not North:
+        Y = Y + UTMFalseNorthingSouth
+    return X, Y
+
+
+def InverseUTM(X, Y, Zone, North=True):
+    '''
+    Function that returns the longitude and latitude of points in a WGS 1984
+    UTM zone.
+    '''
+    Y = np.asarray(Y, dtype=np.float64)
+    if not North:
+        Y = Y - UTMFalseNorthingSouth
+    Xi = Y / (UTMScale * _RectifyingRadius)
+    Eta = (np.asarray(X, dtype=np.float64) - UTMFalseEasting) / (UTMScale * _RectifyingRadius)
+    XiPrime = Xi.copy()
+    EtaPrime = Eta.copy()
+    for Order, Beta in enumerate(_Beta, 1):
+        XiPrime -= Beta * np.sin(2 * Order * Xi) * np.cosh(2 * Order * Eta)
+        EtaPrime -= Beta * np.cos(2 * Order * Xi) * np.sinh(2 * Order * Eta)
+    Chi = np.arcsin(np.sin(XiPrime) / np.cosh(EtaPrime))
+    Phi = Chi.copy()
+    for Order, Delta in enumerate(_Delta, 1):
+        Phi += Delta * np.sin(2 * Order * Chi)
+    Lon = np.degrees(np.arctan2(np.sinh(EtaPrime), np.cos(XiPrime))) + (6 * int(Zone) - 183)
+    return Lon, np.degrees(Phi)
+
+
+def IsSupported(Wkid):
+    '''
+    Function that returns True when points can be projected from WGS 1984
+    to the coordinate system with the given WKID by this module.
+    '''
+    Wkid = int(Wkid or 0)
+    return Wkid in (4326, 3857, 102100, 102113) or 32601 <= Wkid <= 32660 or 32701 <= Wkid <= 32760
+
+
+def Transform(Wkid):
+    '''
+    Function that returns a function projecting longitude and latitude
+    arrays to the coordinate system with the given WKID.  Raises ValueError
+    for coordinate systems that are not supported.
+    '''
+    Wkid = int(Wkid or 0)
+    if Wkid == 4326:
+        return lambda Lon, Lat: (np.asarray(Lon, dtype=np.float64), np.asarray(Lat, dtype=np.float64))
+    if Wkid in (3857, 102100, 102113):
+        return WebMercator
+    if 32601 <= Wkid <= 32660 or 32701 <= Wkid <= 32760:
+        Zone = Wkid % 100
+        North = Wkid < 32700
+        return lambda Lon, Lat: UTM(Lon, Lat, Zone, North)
+    raise ValueError('Projecting to WKID ' + str(Wkid) + ' is not supported')
+
+
+def ProjectRows(Rows, Projector, BlockSize=DefaultBlockSize):
+    '''
+    Generator that projects the coordinates of rows, such as the ones
+    produced by the GeoJSON readers, in blocks.  The coordinates are the last
+    item of each row and are replaced with the projected X,Y pair.  Rows are
+    yielded as tuples in their original order.
+    '''
+    Block = []
+    for Row in Rows:
+        Block.append(Row)
+        if len(Block) >= BlockSize:
+            for Projected in _ProjectBlock(Block, Projector):
+                yield Projected
+            Block = []
+    if Block:
+        for Projected in _ProjectBlock(Block, Projector):
+            yield Projected
+
+
+def _ProjectBlock(Block, Projector):
+    '''
+    Projects the coordinates of a list of rows with one array call.
+    '''
+    LonLat = np.array([Row[-1][:2] for Row in Block], dtype=np.float64)
+    X, Y = Projector(LonLat[:, 0], LonLat[:, 1])
+    return [tuple(Row[:-1]) + ((float(PointX), float(PointY)),) for Row, PointX, PointY in zip(Block, X, Y)]
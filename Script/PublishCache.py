@@ -0,0 +1,164 @@
+### Description: Decides whether a map document has to be published again.
+### A hash is made of the content of the MXD, of every file of the data its
+### layers and tables read and of the service settings, and kept beside the
+### MXD (<mxd>.publish.json) for each service name once the service has been
+### uploaded.  When a later run finds the same hash nothing has changed and
+### staging and uploading the service can be skipped, which keeps a job that
+### republishes every hour from uploading the same data again and again.
+###
+### The hash of each file is kept with its size and modification time so
+### files that have not been touched since the last run are not read again.
+### Data sources that are not files (enterprise geodatabases, web services)
+### cannot be checked and always cause the service to be published.
+###
+### This script was designed to work with ArcGIS 10.4/10.5 and Python 2.7.10,
+### and also runs under Python 3.  It does not require arcpy.
+
+###
+### import modules
+###
+
+import hashlib
+import json
+import os
+
+###
+### Script Follows
+###
+
+# Suffix of the file kept beside the MXD
+StateSuffix = '.publish.json'
+# Bytes read from a file at a time while hashing it
+ReadSize = 1 << 20
+# Files that come and go while a dataset is open, never part of its content
+LockSuffix = '.lock'
+
+
+def StatePathFor(MXDPath):
+    '''
+    Function that returns the path of the publish state kept for an MXD.
+    '''
+    return MXDPath + StateSuffix
+
+
+def ReadState(StatePath):
+    '''
+    Function that returns the publish state of every service as a
+    dictionary, empty when there is none or it cannot be read.
+    '''
+    try:
+        with open(StatePath) as InFile:
+            return json.load(InFile)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def WriteState(StatePath, State):
+    '''
+    Function that writes the publish state, first under another name so an
+    interrupted run does not leave half a file.
+    '''
+    with open(StatePath + '.part', 'w') as OutFile:
+        json.dump(State, OutFile, indent=1, sort_keys=True)
+    if os.path.exists(StatePath):
+        os.remove(StatePath)
+    os.rename(StatePath + '.part', StatePath)
+
+
+def IsLockFile(Path):
+    return Path.lower().endswith(LockSuffix)
+
+
+def DataFiles(DataSource):
+    '''
+    Function that returns the files holding a data source, or None when it
+    is not stored in files.  A shapefile (or raster) is every file sharing
+    its name, a dataset in a file geodatabase is the whole .gdb folder.
+    '''
+    Path = os.path.normpath(DataSource)
+    # Walk up from a feature class (or feature dataset) to its file geodatabase
+    Folder = Path
+    while Folder and not Folder.lower().endswith('.gdb'):
+        Parent = os.path.dirname(Folder)
+        Folder = Parent if Parent != Folder else ''
+    if Folder and os.path.isdir(Folder):
+        Path = Folder
+    if os.path.isdir(Path):
+        return sorted(os.path.join(Root, Name) for Root, Folders, Names in os.walk(Path)
+                      for Name in Names if not IsLockFile(Name))
+    if os.path.isfile(Path):
+        Folder, Name = os.path.split(Path)
+        Stem = os.path.splitext(Name)[0].lower() + '.'
+        return sorted(os.path.join(Folder, Other) for Other in os.listdir(Folder or '.')
+                      if Other.lower().startswith(Stem) and not IsLockFile(Other))
+    return None
+
+
+def FileHash(Path, Known):
+    '''
+    Function that returns the size, modification time and SHA-1 of a file,
+    reusing the hash in Known when the size and time have not changed.
+    '''
+    Status = os.stat(Path)
+    Previous = Known.get(Path)
+    if Previous and Previous[0] == Status.st_size and Previous[1] == Status.st_mtime:
+        return Previous
+    Hash = hashlib.sha1()
+    with open(Path, 'rb') as InFile:
+        Block = InFile.read(ReadSize)
+        while Block:
+            Hash.update(Block)
+            Block = InFile.read(ReadSize)
+    return [Status.st_size, Status.st_mtime, Hash.hexdigest()]
+
+
+def ContentHash(MXDPath, DataSources, Settings=(), Known=None):
+    '''
+    Function that returns the hash of an MXD, the files of its data sources
+    and the service settings, together with the hash of each file read (to
+    be given as Known next time).  The hash is None when a data source is
+    not stored in files.
+    '''
+    Known = Known or {}
+    Files = {}
+    Hash = hashlib.sha1()
+    for Setting in Settings:
+        Hash.update(('%s\n' % Setting).encode('utf-8'))
+    Paths = [MXDPath]
+    Complete = True
+    for DataSource in sorted(set(DataSources)):
+        SourceFiles = DataFiles(DataSource)
+        if SourceFiles is None:
+            Complete = False
+        else:
+            Paths.extend(SourceFiles)
+    for Path in Paths:
+        if Path in Files:
+            continue
+        Files[Path] = FileHash(Path, Known)
+        Hash.update(('%s\n%s\n' % (os.path.normcase(Path), Files[Path][2])).encode('utf-8'))
+    return (Hash.hexdigest() if Complete else None), Files
+
+
+def IsUnchanged(State, ServiceName, Hash):
+    '''
+    Function that returns True when the service was last published from
+    content with the same hash.
+    '''
+    return Hash is not None and State.get(ServiceName, {}).get('Hash') == Hash
+
+
+def KnownFiles(State, ServiceName):
+    '''
+    Function that returns the file hashes recorded for a service.
+    '''
+    return State.get(ServiceName, {}).get('Files', {})
+
+
+def Record(StatePath, State, ServiceName, Hash, Files, Published):
+    '''
+    Function that records that a service was published from content with a
+    hash, Published being the time as text.
+    '''
+    State[ServiceName] = {'Hash': Hash, 'Files': Files, 'Published': Published}
+    WriteState(StatePath, State)
@@ -0,0 +1,138 @@
+### Description: Rewrites the service definition draft (.sddraft) made by
+### arcpy.mapping.CreateMapSDDraft so the service is published as a hosted
+### feature service.  The draft is streamed through a SAX parser and written
+### out as it is read, so the edits are made in a single pass without
+### building the document tree or searching it once per edit:
+###     SVCManifest/Type       esriServiceDefinitionType_Replacement (overwrite)
+###     SVCManifest/State      esriSDState_Published
+###     TypeName MapServer     FeatureServer
+###     isCached               false (first ConfigurationProperties)
+###     WebCapabilities        the feature access capabilities (first Info)
+### These are the edits of ESRI's example 7 for CreateMapSDDraft.
+###
+### This script was designed to work with ArcGIS 10.4/10.5 and Python 2.7.10,
+### and also runs under Python 3.  It does not require arcpy.
+
+###
+### import modules
+###
+
+import xml.sax
+import xml.sax.handler
+import xml.sax.saxutils
+
+###
+### Script Follows
+###
+
+DefaultCapabilities = 'Query,Create,Update,Delete,Uploads,Editing'
+# Text of the elements replaced wherever they sit below their parent
+ManifestValues = {'Type': 'esriServiceDefinitionType_Replacement', 'State': 'esriSDState_Published'}
+
+
+def RewriteSDDraft(InPath, OutPath, Capabilities=DefaultCapabilities):
+    '''
+    Function that writes a copy of a service definition draft with the
+    feature service edits made.  Returns a dictionary with the number of
+    elements changed by each edit.
+    '''
+    with open(OutPath, 'wb') as OutFile:
+        Handler = _DraftRewriter(xml.sax.saxutils.XMLGenerator(OutFile, 'utf-8'), Capabilities)
+        Parser = xml.sax.make_parser()
+        # Entities outside the document are never needed by a draft, do not fetch them
+        Parser.setFeature(xml.sax.handler.feature_external_ges, False)
+        Parser.setContentHandler(Handler)
+        Parser.parse(InPath)
+    return Handler.Counts
+
+
+class _DraftRewriter(xml.sax.handler.ContentHandler):
+    '''
+    Passes the SAX events on to an XML writer, replacing the text of the
+    elements that are edited.  The text of an element is collected until
+    the element ends (or a child starts) so a value split over several
+    character events is replaced as a whole.
+    '''
+
+    def __init__(self, Writer, Capabilities):
+        xml.sax.handler.ContentHandler.__init__(self)
+        self.Writer = Writer
+        self.Capabilities = Capabilities
+        self.Stack = []
+        self.Text = []
+        # Key of the property set being read, and which property arrays are edited
+        self.LastKey = None
+        self.Seen = {'ConfigurationProperties': 0, 'Info': 0}
+        self.EditedArray = []
+        self.Counts = {'Type': 0, 'State': 0, 'TypeName': 0, 'isCached': 0, 'WebCapabilities': 0}
+
+    def startDocument(self):
+        self.Writer.startDocument()
+
+    def endDocument(self):
+        self.Writer.endDocument()
+
+    def startElement(self, Name, Attributes):
+        self._FlushText()
+        if Name in self.Seen:
+            self.Seen[Name] += 1
+        # Only the first ConfigurationProperties and Info elements are edited
+        self.EditedArray.append(Name if Name in self.Seen and self.Seen[Name] == 1 else None)
+        self.Stack.append(Name)
+        if Name == 'PropertySetProperty':
+            self.LastKey = None
+        self.Writer.startElement(Name, Attributes)
+
+    def endElement(self, Name):
+        Text = ''.join(self.Text)
+        self.Text = []
+        Replacement = self._Replacement(Name, Text)
+        if Replacement is not None:
+            Text = Replacement
+        if Name == 'Key':
+            self.LastKey = Text
+        if Text:
+            self.Writer.characters(Text)
+        self.Stack.pop()
+        self.EditedArray.pop()
+        self.Writer.endElement(Name)
+
+    def characters(self, Content):
+        self.Text.append(Content)
+
+    def ignorableWhitespace(self, Content):
+        self.Text.append(Content)
+
+    def processingInstruction(self, Target, Data):
+        self._FlushText()
+        self.Writer.processingInstruction(Target, Data)
+
+    def _FlushText(self):
+        if self.Text:
+            self.Writer.characters(''.join(self.Text))
+            self.Text = []
+
+    def _Replacement(self, Name, Text):
+        '''
+        Returns the new text of an element that ends, or None to keep it.
+        Elements without text are left as they are.
+        '''
+        if not Text:
+            return None
+        Parent = self.Stack[-2] if len(self.Stack) > 1 else None
+        if Name in ManifestValues and Parent == 'SVCManifest':
+            self.Counts[Name] += 1
+            return ManifestValues[Name]
+        if Name == 'TypeName' and Text == 'MapServer':
+            self.Counts['TypeName'] += 1
+            return 'FeatureServer'
+        # Value of a Key/Value pair in ConfigurationProperties/PropertyArray/PropertySetProperty
+        if Name == 'Value' and len(self.Stack) >= 4 and self.Stack[-2] == 'PropertySetProperty':
+            Edited = self.EditedArray[-4]
+            if Edited == 'ConfigurationProperties' and self.LastKey == 'isCached':
+                self.Counts['isCached'] += 1
+                return 'false'
+            if Edited == 'Info' and self.LastKey == 'WebCapabilities':
+                self.Counts['WebCapabilities'] += 1
+                return self.Capabilities
+        return None
@@ -0,0 +1,625 @@
+### Description: Nearest neighbour search for the Mapillary tools.  A uniform
+### grid is built once over the known points and every query is answered by
+### searching outward from the query's grid cell, ring by ring, until no
+### unsearched cell can hold a closer point.  The result is exact and matches
+### the brute force comparison that Distance.py used to run, including the
+### choice of the first known point when two are equally close.
+###
+### Line datasets are indexed by segment with the same grid.  Each segment is
+### stored in every cell its bounding box touches and the exact distance from
+### a query point to the closest point of the segment is measured, so lines
+### no longer have to be converted to points along their length first.
+###
+### The cells are sized from the density of the middle of the data.  Known
+### features far outside of it (a stray point at 0,0 among city data) are
+### kept out of the grid, which would otherwise stretch over them and put
+### the city in a handful of cells, and are held in a second index of their
+### own that every query also searches.
+###
+### Query points that are not finite (NaN from an empty geometry) are not
+### searched, they get a distance of NaN and an ID of -1.
+###
+### When NumPy is available the queries are run as whole arrays, otherwise
+### a pure Python version of the same grid is used.  The module does not
+### require arcpy so it can be used and tested outside of ArcMap.
+###
+### This script was designed to work with ArcGIS 10.4/10.5 and Python 2.7.10,
+### and also runs under Python 3.
+
+###
+### import modules
+###
+
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+###
+### Script Follows
+###
+
+# Average number of known points that should fall in each grid cell
+PointsPerCell = 2.0
+# Upper limit on the number of (query, cell) pairs handled in one array step
+MaxPairsPerStep = 1000000
+# Share of the known features at each end of the X and Y ranges left out when
+# measuring the dense middle of the data
+OutlierShare = 0.01
+# Upper limit on the number of grid cells per known feature
+MaxCellsPerItem = 16
+
+
+def NearestIndex(X, Y, IDs=None, CellSize=None):
+    '''
+    Function that builds the spatial index for a set of known points.  The
+    NumPy grid is returned when NumPy can be imported and the pure Python
+    grid otherwise.  X and Y are sequences of coordinates and IDs is an
+    optional sequence with the ID of each point (defaults to the position).
+    '''
+    if np is not None:
+        return GridIndex(X, Y, IDs, CellSize)
+    return PurePythonGridIndex(X, Y, IDs, CellSize)
+
+
+def NearestNeighbours(QueryPoints, KnownPoints, KnownIDs=None):
+    '''
+    Function that takes a list of query X,Y pairs and a list of known X,Y
+    pairs and returns two lists, the distance to the closest known point and
+    the ID of that point for each query point.
+    '''
+    Index = NearestIndex([Point[0] for Point in KnownPoints],
+                         [Point[1] for Point in KnownPoints], KnownIDs)
+    Distances, IDs = Index.Query([Point[0] for Point in QueryPoints],
+                                 [Point[1] for Point in QueryPoints])
+    return list(Distances), list(IDs)
+
+
+def NearestSegmentIndex(X0, Y0, X1, Y1, IDs=None, CellSize=None):
+    '''
+    Function that builds the spatial index for a set of known line segments
+    running from X0,Y0 to X1,Y1.  IDs is an optional sequence with the ID of
+    each segment, usually the ID of the line it belongs to.
+    '''
+    if np is not None:
+        return GridSegmentIndex(X0, Y0, X1, Y1, IDs, CellSize)
+    return PurePythonSegmentIndex(X0, Y0, X1, Y1, IDs, CellSize)
+
+
+def ChooseCellSize(XMin, YMin, XMax, YMax, Count):
+    '''
+    Function that picks a grid cell size so that on average a couple of
+    points fall in each cell.  Degenerate extents (a single point or points
+    along a vertical/horizontal line) are handled.
+    '''
+    Width = XMax - XMin
+    Height = YMax - YMin
+    if Width > 0 and Height > 0:
+        return math.sqrt(Width * Height * PointsPerCell / Count)
+    Span = max(Width, Height)
+    if Span > 0:
+        return Span * PointsPerCell / Count
+    return 1.0
+
+
+def Quantile(Values, Share):
+    '''
+    Function that returns the value below which a share of the values lie.
+    '''
+    if np is not None:
+        return float(np.percentile(Values, 100.0 * Share))
+    Sorted = sorted(Values)
+    return Sorted[int(round(Share * (len(Sorted) - 1)))]
+
+
+def GridLayout(BoxX0, BoxY0, BoxX1, BoxY1, CellSize=None, MinimumCellSize=0.0):
+    '''
+    Function that lays out the grid for known features with the given
+    bounding boxes.  The dense middle of the data is the box holding all but
+    OutlierShare of the features at each end in X and Y; the grid covers it
+    grown by its own size on every side (but no further than the features)
+    and its cells are sized from the number of features in it.  Returns the
+    grid extent (XMin, YMin, XMax, YMax), the cell size and a flag for each
+    feature, True when it lies in the grid.
+    '''
+    if np is not None:
+        BoxX0, BoxY0, BoxX1, BoxY1 = [np.asarray(Values, dtype=np.float64) for Values in (BoxX0, BoxY0, BoxX1, BoxY1)]
+        Full = (float(BoxX0.min()), float(BoxY0.min()), float(BoxX1.max()), float(BoxY1.max()))
+    else:
+        Full = (min(BoxX0), min(BoxY0), max(BoxX1), max(BoxY1))
+    Dense = (Quantile(BoxX0, OutlierShare), Quantile(BoxY0, OutlierShare),
+             Quantile(BoxX1, 1 - OutlierShare), Quantile(BoxY1, 1 - OutlierShare))
+    Margin = max(Dense[2] - Dense[0], Dense[3] - Dense[1], 0.0)
+    Extent = (max(Full[0], Dense[0] - Margin), max(Full[1], Dense[1] - Margin),
+              min(Full[2], Dense[2] + Margin), min(Full[3], Dense[3] + Margin))
+    Inside = Within(BoxX0, BoxY0, BoxX1, BoxY1, Extent)
+    if not (Inside.any() if np is not None else any(Inside)):
+        Extent = Full
+        Inside = Within(BoxX0, BoxY0, BoxX1, BoxY1, Extent)
+    if CellSize is None:
+        InDense = Within(BoxX0, BoxY0, BoxX1, BoxY1, Dense)
+        DenseCount = max(int(sum(InDense)) if np is None else int(InDense.sum()), 1)
+        CellSize = max(ChooseCellSize(Dense[0], Dense[1], Dense[2], Dense[3], DenseCount), MinimumCellSize)
+        # Never more than MaxCellsPerItem cells for each feature, whatever the spread of the data
+        Width = Extent[2] - Extent[0]
+        Height = Extent[3] - Extent[1]
+        MaxCells = MaxCellsPerItem * float(len(Inside))
+        CellSize = max(CellSize, math.sqrt(Width * Height / MaxCells), max(Width, Height) / MaxCells)
+    return Extent, float(CellSize), Inside
+
+
+def Within(BoxX0, BoxY0, BoxX1, BoxY1, Extent):
+    '''
+    Function that flags the boxes lying entirely within an extent.
+    '''
+    if np is not None:
+        return (BoxX0 >= Extent[0]) & (BoxY0 >= Extent[1]) & (BoxX1 <= Extent[2]) & (BoxY1 <= Extent[3])
+    return [X0 >= Extent[0] and Y0 >= Extent[1] and X1 <= Extent[2] and Y1 <= Extent[3]
+            for X0, Y0, X1, Y1 in zip(BoxX0, BoxY0, BoxX1, BoxY1)]
+
+
+class GridIndex(object):
+    '''
+    Uniform grid over a set of known points stored as NumPy arrays.  The
+    points are sorted by cell so the contents of any cell are a contiguous
+    slice of the sorted order (the same layout as a compressed sparse row
+    matrix).
+    '''
+
+    def __init__(self, X, Y, IDs=None, CellSize=None):
+        self.X = np.asarray(X, dtype=np.float64).ravel()
+        self.Y = np.asarray(Y, dtype=np.float64).ravel()
+        self.Count = self.X.size
+        if self.Count == 0:
+            raise ValueError('The spatial index requires at least one known point')
+        if IDs is None:
+            self.IDs = np.arange(self.Count)
+        else:
+            self.IDs = np.asarray(IDs)
+        Inside = self._SetGrid(GridLayout(self.X, self.Y, self.X, self.Y, CellSize))
+        Positions = np.flatnonzero(Inside)
+        CellX, CellY = self.CellOf(self.X[Positions], self.Y[Positions])
+        self._Fill(CellY * self.NX + CellX, Positions)
+
+    def _SetGrid(self, Layout):
+        '''
+        Sets the grid from a layout (see GridLayout) and indexes the known
+        features outside of it on their own.  Returns the flags of the
+        features in the grid.
+        '''
+        (self.XMin, self.YMin, XMax, YMax), self.CellSize, Inside = Layout
+        self.NX = int((XMax - self.XMin) // self.CellSize) + 1
+        self.NY = int((YMax - self.YMin) // self.CellSize) + 1
+        self.Outliers = None
+        if not Inside.all():
+            self.Outliers = self._Subset(np.flatnonzero(~Inside))
+        return Inside
+
+    def _Subset(self, Positions):
+        '''
+        Returns an index of some of the known points, with their positions
+        in this index as IDs.
+        '''
+        return GridIndex(self.X[Positions], self.Y[Positions], Positions)
+
+    def _Fill(self, EntryCells, EntryItems):
+        '''
+        Stores the grid entries, each an item (a position in the known
+        arrays) and the ID of a cell it falls in, sorted by cell.
+        '''
+        # A stable sort keeps the original order of the items within a cell
+        Sorter = np.argsort(EntryCells, kind='mergesort')
+        self.Order = EntryItems[Sorter]
+        self.Starts = np.searchsorted(EntryCells[Sorter], np.arange(self.NX * self.NY + 1))
+
+    def CellOf(self, X, Y):
+        '''
+        Returns the column and row of the cell containing each point.  Points
+        outside of the grid are clamped to the closest edge cell.
+        '''
+        CellX = np.floor((X - self.XMin) / self.CellSize)
+        CellY = np.floor((Y - self.YMin) / self.CellSize)
+        CellX = np.clip(CellX, 0, self.NX - 1).astype(np.int64)
+        CellY = np.clip(CellY, 0, self.NY - 1).astype(np.int64)
+        return CellX, CellY
+
+    def Query(self, X, Y):
+        '''
+        Returns two arrays, the distance from each query point to the nearest
+        known point and the ID of that known point (NaN and -1 for query
+        points that are not finite).
+        '''
+        QX = np.asarray(X, dtype=np.float64).ravel()
+        QY = np.asarray(Y, dtype=np.float64).ravel()
+        Finite = np.isfinite(QX) & np.isfinite(QY)
+        if Finite.all():
+            BestD2, BestIndex = self._Nearest(QX, QY)
+            return np.sqrt(BestD2), self.IDs[BestIndex]
+        BestD2, BestIndex = self._Nearest(QX[Finite], QY[Finite])
+        Distances = np.full(QX.size, np.nan)
+        Distances[Finite] = np.sqrt(BestD2)
+        IDs = np.full(QX.size, -1, dtype=self.IDs.dtype if self.IDs.dtype.kind in 'iuf' else object)
+        IDs[Finite] = self.IDs[BestIndex]
+        return Distances, IDs
+
+    def _Nearest(self, QX, QY):
+        '''
+        Returns the squared distance from each query point to the nearest
+        known point and the position of that point, searching the grid and
+        then the features outside of it.
+        '''
+        BestD2 = np.full(QX.size, np.inf)
+        # The sentinel is larger than any real position so real points always win ties
+        BestIndex = np.full(QX.size, self.Count, dtype=np.int64)
+        QCellX, QCellY = self.CellOf(QX, QY)
+        Active = np.arange(QX.size)
+        Ring = 0
+        while Active.size:
+            OffsetX, OffsetY = RingOffsets(Ring)
+            Step = max(1, MaxPairsPerStep // OffsetX.size)
+            for Start in range(0, Active.size, Step):
+                self._SearchCells(Active[Start:Start + Step], OffsetX, OffsetY,
+                                  QX, QY, QCellX, QCellY, BestD2, BestIndex)
+            Bound = self._UnsearchedDistance(QX[Active], QY[Active],
+                                             QCellX[Active], QCellY[Active], Ring)
+            # Stay active while an unsearched point could be closer or equally close
+            Active = Active[BestD2[Active] >= Bound]
+            Ring += 1
+        if self.Outliers is not None:
+            OutlierD2, OutlierIndex = self.Outliers._Nearest(QX, QY)
+            OutlierIndex = self.Outliers.IDs[OutlierIndex]
+            Better = (OutlierD2 < BestD2) | ((OutlierD2 == BestD2) & (OutlierIndex < BestIndex))
+            BestD2 = np.where(Better, OutlierD2, BestD2)
+            BestIndex = np.where(Better, OutlierIndex, BestIndex)
+        return BestD2, BestIndex
+
+    def _SearchCells(self, Queries, OffsetX, OffsetY, QX, QY, QCellX, QCellY, BestD2, BestIndex):
+        '''
+        Compares a block of query points with every known point in the cells
+        at the given offsets and keeps the closest match for each query.
+        '''
+        CellX = QCellX[Queries][:, None] + OffsetX[None, :]
+        CellY = QCellY[Queries][:, None] + OffsetY[None, :]
+        Valid = (CellX >= 0) & (CellX < self.NX) & (CellY >= 0) & (CellY < self.NY)
+        PairQuery = np.broadcast_to(Queries[:, None], CellX.shape)[Valid]
+        CellIDs = CellY[Valid] * self.NX + CellX[Valid]
+        Starts = self.Starts[CellIDs]
+        Counts = self.Starts[CellIDs + 1] - Starts
+        Total = int(Counts.sum())
+        if Total == 0:
+            return
+        # Expand each (query, cell) pair into one entry per point in the cell
+        Query = np.repeat(PairQuery, Counts)
+        Offsets = np.repeat(Starts - (np.cumsum(Counts) - Counts), Counts)
+        Candidate = self.Order[Offsets + np.arange(Total)]
+        D2 = self._Distance2(QX[Query], QY[Query], Candidate)
+        # The candidates are grouped by query, so the closest candidate of each
+        # query is a segmented minimum with ties broken by the original point order
+        First = np.ones(Query.size, dtype=bool)
+        First[1:] = Query[1:] != Query[:-1]
+        GroupStarts = np.flatnonzero(First)
+        GroupMin = np.minimum.reduceat(D2, GroupStarts)
+        Sizes = np.diff(np.append(GroupStarts, Query.size))
+        Tied = D2 == np.repeat(GroupMin, Sizes)
+        Candidate = np.minimum.reduceat(np.where(Tied, Candidate, self.Count), GroupStarts)
+        Query = Query[GroupStarts]
+        D2 = GroupMin
+        Better = (D2 < BestD2[Query]) | ((D2 == BestD2[Query]) & (Candidate < BestIndex[Query]))
+        BestD2[Query[Better]] = D2[Better]
+        BestIndex[Query[Better]] = Candidate[Better]
+
+    def _Distance2(self, QX, QY, Candidate):
+        '''
+        Returns the squared distance from each query point to its candidate.
+        '''
+        return (QX - self.X[Candidate]) ** 2 + (QY - self.Y[Candidate]) ** 2
+
+    def _UnsearchedDistance(self, QX, QY, QCellX, QCellY, Ring):
+        '''
+        Returns the squared distance from each query point to the closest
+        grid cell that has not been searched after the given ring.
+        '''
+        GridX0 = self.XMin
+        GridY0 = self.YMin
+        GridX1 = self.XMin + self.NX * self.CellSize
+        GridY1 = self.YMin + self.NY * self.CellSize
+        Bound = np.full(QX.size, np.inf)
+        Sides = (
+            (QCellX - Ring > 0, GridX0, GridX0 + (QCellX - Ring) * self.CellSize, GridY0, GridY1),
+            (QCellX + Ring < self.NX - 1, GridX0 + (QCellX + Ring + 1) * self.CellSize, GridX1, GridY0, GridY1),
+            (QCellY - Ring > 0, GridX0, GridX1, GridY0, GridY0 + (QCellY - Ring) * self.CellSize),
+            (QCellY + Ring < self.NY - 1, GridX0, GridX1, GridY0 + (QCellY + Ring + 1) * self.CellSize, GridY1),
+        )
+        for Open, BoxX0, BoxX1, BoxY0, BoxY1 in Sides:
+            DX = np.maximum(np.maximum(BoxX0 - QX, QX - BoxX1), 0)
+            DY = np.maximum(np.maximum(BoxY0 - QY, QY - BoxY1), 0)
+            Bound = np.where(Open, np.minimum(Bound, DX ** 2 + DY ** 2), Bound)
+        return Bound
+
+
+class GridSegmentIndex(GridIndex):
+    '''
+    Uniform grid over a set of known line segments.  A segment is entered in
+    every cell overlapped by its bounding box, so a segment that has not been
+    found after a ring lies entirely in unsearched cells and the search stops
+    with the same bound used for points.
+    '''
+
+    def __init__(self, X0, Y0, X1, Y1, IDs=None, CellSize=None):
+        self.X = np.asarray(X0, dtype=np.float64).ravel()
+        self.Y = np.asarray(Y0, dtype=np.float64).ravel()
+        self.DX = np.asarray(X1, dtype=np.float64).ravel() - self.X
+        self.DY = np.asarray(Y1, dtype=np.float64).ravel() - self.Y
+        self.Length2 = self.DX ** 2 + self.DY ** 2
+        self.Count = self.X.size
+        if self.Count == 0:
+            raise ValueError('The spatial index requires at least one known segment')
+        if IDs is None:
+            self.IDs = np.arange(self.Count)
+        else:
+            self.IDs = np.asarray(IDs)
+        BoxX0 = np.minimum(self.X, self.X + self.DX)
+        BoxY0 = np.minimum(self.Y, self.Y + self.DY)
+        BoxX1 = np.maximum(self.X, self.X + self.DX)
+        BoxY1 = np.maximum(self.Y, self.Y + self.DY)
+        # Cells about as large as a typical segment keep the number of
+        # cells each segment is entered in small
+        Median = float(np.median(np.maximum(BoxX1 - BoxX0, BoxY1 - BoxY0)))
+        Inside = self._SetGrid(GridLayout(BoxX0, BoxY0, BoxX1, BoxY1, CellSize, Median))
+        Positions = np.flatnonzero(Inside)
+        CellX0, CellY0 = self.CellOf(BoxX0[Positions], BoxY0[Positions])
+        CellX1, CellY1 = self.CellOf(BoxX1[Positions], BoxY1[Positions])
+        Width = CellX1 - CellX0 + 1
+        Counts = Width * (CellY1 - CellY0 + 1)
+        Segment = np.repeat(Positions, Counts)
+        Width = np.repeat(Width, Counts)
+        CellX0 = np.repeat(CellX0, Counts)
+        CellY0 = np.repeat(CellY0, Counts)
+        Step = np.arange(Segment.size) - np.repeat(np.cumsum(Counts) - Counts, Counts)
+        CellX = CellX0 + Step % Width
+        CellY = CellY0 + Step // Width
+        self._Fill(CellY * self.NX + CellX, Segment)
+
+    def _Subset(self, Positions):
+        '''
+        Returns an index of some of the known segments, with their positions
+        in this index as IDs.
+        '''
+        X0 = self.X[Positions]
+        Y0 = self.Y[Positions]
+        return GridSegmentIndex(X0, Y0, X0 + self.DX[Positions], Y0 + self.DY[Positions], Positions)
+
+    def _Distance2(self, QX, QY, Candidate):
+        '''
+        Returns the squared distance from each query point to the closest
+        point of its candidate segment.
+        '''
+        X0 = self.X[Candidate]
+        Y0 = self.Y[Candidate]
+        DX = self.DX[Candidate]
+        DY = self.DY[Candidate]
+        Length2 = self.Length2[Candidate]
+        Along = (QX - X0) * DX + (QY - Y0) * DY
+        # Zero length segments are measured as points
+        Along = np.divide(Along, Length2, out=np.zeros_like(Along), where=Length2 > 0)
+        Along = np.clip(Along, 0.0, 1.0)
+        return (QX - X0 - Along * DX) ** 2 + (QY - Y0 - Along * DY) ** 2
+
+
+def RingOffsets(Ring):
+    '''
+    Returns the column and row offsets of the cells that make up the square
+    ring at the given distance (in cells) from the centre cell.
+    '''
+    if Ring == 0:
+        return np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64)
+    Side = np.arange(-Ring, Ring + 1)
+    Inner = np.arange(-Ring + 1, Ring)
+    OffsetX = np.concatenate((Side, Side, np.full(Inner.size, -Ring), np.full(Inner.size, Ring)))
+    OffsetY = np.concatenate((np.full(Side.size, -Ring), np.full(Side.size, Ring), Inner, Inner))
+    return OffsetX.astype(np.int64), OffsetY.astype(np.int64)
+
+
+class PurePythonGridIndex(object):
+    '''
+    The same uniform grid as GridIndex for use when NumPy is not available.
+    Each cell is a dictionary entry holding the positions of its points.
+    '''
+
+    def __init__(self, X, Y, IDs=None, CellSize=None):
+        self.X = [float(Value) for Value in X]
+        self.Y = [float(Value) for Value in Y]
+        self.Count = len(self.X)
+        if self.Count == 0:
+            raise ValueError('The spatial index requires at least one known point')
+        if IDs is None:
+            self.IDs = list(range(self.Count))
+        else:
+            self.IDs = list(IDs)
+        Inside = self._SetGrid(GridLayout(self.X, self.Y, self.X, self.Y, CellSize))
+        self.Cells = {}
+        for Position in range(self.Count):
+            if Inside[Position]:
+                Cell = self.CellOf(self.X[Position], self.Y[Position])
+                self.Cells.setdefault(Cell, []).append(Position)
+
+    def _SetGrid(self, Layout):
+        '''
+        Sets the grid from a layout (see GridLayout) and indexes the known
+        features outside of it on their own.  Returns the flags of the
+        features in the grid.
+        '''
+        (self.XMin, self.YMin, XMax, YMax), self.CellSize, Inside = Layout
+        self.NX = int((XMax - self.XMin) // self.CellSize) + 1
+        self.NY = int((YMax - self.YMin) // self.CellSize) + 1
+        self.Outliers = None
+        if not all(Inside):
+            self.Outliers = self._Subset([Position for Position in range(self.Count) if not Inside[Position]])
+        return Inside
+
+    def _Subset(self, Positions):
+        '''
+        Returns an index of some of the known points, with their positions
+        in this index as IDs.
+        '''
+        return PurePythonGridIndex([self.X[Position] for Position in Positions],
+                                   [self.Y[Position] for Position in Positions], Positions)
+
+    def CellOf(self, X, Y):
+        '''
+        Returns the column and row of the cell containing a point, clamped
+        to the closest edge cell for points outside of the grid.
+        '''
+        CellX = int(math.floor((X - self.XMin) / self.CellSize))
+        CellY = int(math.floor((Y - self.YMin) / self.CellSize))
+        return min(max(CellX, 0), self.NX - 1), min(max(CellY, 0), self.NY - 1)
+
+    def Query(self, X, Y):
+        '''
+        Returns two lists, the distance from each query point to the nearest
+        known point and the ID of that known point (NaN and -1 for query
+        points that are not finite).
+        '''
+        Distances = []
+        IDs = []
+        for QueryX, QueryY in zip(X, Y):
+            QueryX, QueryY = float(QueryX), float(QueryY)
+            if math.isnan(QueryX - QueryX) or math.isnan(QueryY - QueryY):
+                Distances.append(float('nan'))
+                IDs.append(-1)
+                continue
+            Distance, Position = self.QueryPoint(QueryX, QueryY)
+            Distances.append(Distance)
+            IDs.append(self.IDs[Position])
+        return Distances, IDs
+
+    def QueryPoint(self, QX, QY):
+        '''
+        Returns the distance to and the position of the nearest known point.
+        '''
+        BestD2, BestPosition = self._Nearest(QX, QY)
+        return math.sqrt(BestD2), BestPosition
+
+    def _Nearest(self, QX, QY):
+        '''
+        Returns the squared distance to and the position of the nearest known
+        point, searching the grid and then the features outside of it.
+        '''
+        QCellX, QCellY = self.CellOf(QX, QY)
+        BestD2 = float('inf')
+        BestPosition = self.Count
+        Ring = 0
+        while True:
+            for CellX in range(QCellX - Ring, QCellX + Ring + 1):
+                for CellY in range(QCellY - Ring, QCellY + Ring + 1):
+                    if max(abs(CellX - QCellX), abs(CellY - QCellY)) != Ring:
+                        continue
+                    for Position in self.Cells.get((CellX, CellY), ()):
+                        D2 = self._Distance2(QX, QY, Position)
+                        if D2 < BestD2 or (D2 == BestD2 and Position < BestPosition):
+                            BestD2 = D2
+                            BestPosition = Position
+            if BestD2 < self._UnsearchedDistance(QX, QY, QCellX, QCellY, Ring):
+                break
+            Ring += 1
+        if self.Outliers is not None:
+            OutlierD2, OutlierPosition = self.Outliers._Nearest(QX, QY)
+            OutlierPosition = self.Outliers.IDs[OutlierPosition]
+            if OutlierD2 < BestD2 or (OutlierD2 == BestD2 and OutlierPosition < BestPosition):
+                return OutlierD2, OutlierPosition
+        return BestD2, BestPosition
+
+    def _Distance2(self, QX, QY, Position):
+        '''
+        Returns the squared distance from a query point to a known point.
+        '''
+        return (QX - self.X[Position]) ** 2 + (QY - self.Y[Position]) ** 2
+
+    def _UnsearchedDistance(self, QX, QY, QCellX, QCellY, Ring):
+        '''
+        Returns the squared distance from a query point to the closest grid
+        cell that has not been searched after the given ring.
+        '''
+        GridX0 = self.XMin
+        GridY0 = self.YMin
+        GridX1 = self.XMin + self.NX * self.CellSize
+        GridY1 = self.YMin + self.NY * self.CellSize
+        Bound = float('inf')
+        Sides = []
+        if QCellX - Ring > 0:
+            Sides.append((GridX0, GridX0 + (QCellX - Ring) * self.CellSize, GridY0, GridY1))
+        if QCellX + Ring < self.NX - 1:
+            Sides.append((GridX0 + (QCellX + Ring + 1) * self.CellSize, GridX1, GridY0, GridY1))
+        if QCellY - Ring > 0:
+            Sides.append((GridX0, GridX1, GridY0, GridY0 + (QCellY - Ring) * self.CellSize))
+        if QCellY + Ring < self.NY - 1:
+            Sides.append((GridX0, GridX1, GridY0 + (QCellY + Ring + 1) * self.CellSize, GridY1))
+        for BoxX0, BoxX1, BoxY0, BoxY1 in Sides:
+            DX = max(BoxX0 - QX, QX - BoxX1, 0)
+            DY = max(BoxY0 - QY, QY - BoxY1, 0)
+            Bound = min(Bound, DX ** 2 + DY ** 2)
+        return Bound
+
+
+class PurePythonSegmentIndex(PurePythonGridIndex):
+    '''
+    The same segment grid as GridSegmentIndex for use when NumPy is not
+    available.
+    '''
+
+    def __init__(self, X0, Y0, X1, Y1, IDs=None, CellSize=None):
+        self.X = [float(Value) for Value in X0]
+        self.Y = [float(Value) for Value in Y0]
+        self.DX = [float(Value) - Start for Value, Start in zip(X1, self.X)]
+        self.DY = [float(Value) - Start for Value, Start in zip(Y1, self.Y)]
+        self.Count = len(self.X)
+        if self.Count == 0:
+            raise ValueError('The spatial index requires at least one known segment')
+        if IDs is None:
+            self.IDs = list(range(self.Count))
+        else:
+            self.IDs = list(IDs)
+        Boxes = [(min(X, X + DX), min(Y, Y + DY), max(X, X + DX), max(Y, Y + DY))
+                 for X, Y, DX, DY in zip(self.X, self.Y, self.DX, self.DY)]
+        Sizes = sorted(max(Box[2] - Box[0], Box[3] - Box[1]) for Box in Boxes)
+        Middle = len(Sizes) // 2
+        Median = Sizes[Middle] if len(Sizes) % 2 else (Sizes[Middle - 1] + Sizes[Middle]) / 2.0
+        Inside = self._SetGrid(GridLayout([Box[0] for Box in Boxes], [Box[1] for Box in Boxes],
+                                          [Box[2] for Box in Boxes], [Box[3] for Box in Boxes], CellSize, Median))
+        self.Cells = {}
+        for Position, Box in enumerate(Boxes):
+            if not Inside[Position]:
+                continue
+            CellX0, CellY0 = self.CellOf(Box[0], Box[1])
+            CellX1, CellY1 = self.CellOf(Box[2], Box[3])
+            for CellX in range(CellX0, CellX1 + 1):
+                for CellY in range(CellY0, CellY1 + 1):
+                    self.Cells.setdefault((CellX, CellY), []).append(Position)
+
+    def _Subset(self, Positions):
+        '''
+        Returns an index of some of the known segments, with their positions
+        in this index as IDs.
+        '''
+        X0 = [self.X[Position] for Position in Positions]
+        Y0 = [self.Y[Position] for Position in Positions]
+        X1 = [self.X[Position] + self.DX[Position] for Position in Positions]
+        Y1 = [self.Y[Position] + self.DY[Position] for Position in Positions]
+        return PurePythonSegmentIndex(X0, Y0, X1, Y1, Positions)
+
+    def _Distance2(self, QX, QY, Position):
+        '''
+        Returns the squared distance from a query point to the closest point
+        of a known segment.
+        '''
+        X0 = self.X[Position]
+        Y0 = self.Y[Position]
+        DX = self.DX[Position]
+        DY = self.DY[Position]
+        Length2 = DX ** 2 + DY ** 2
+        Along = 0.0
+        if Length2 > 0:
+            Along = min(max(((QX - X0) * DX + (QY - Y0) * DY) / Length2, 0.0), 1.0)
+        return (QX - X0 - Along * DX) ** 2 + (QY - Y0 - Along * DY) ** 2
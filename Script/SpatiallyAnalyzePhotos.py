@@ -10,8 +10,16 @@
 # Import modules and settings
 import arcpy
 import time
+import ColumnStatistics
+import Instrumentation
+import KernelDensity
+import PriorityGrid
+import Projection
 start = time.time()
 
+class LicenseError(Exception):
+    pass
+
 arcpy.env.workspace = arcpy.GetParameterAsText(0)
 arcpy.env.overwriteOutput = True
 
@@ -20,6 +28,18 @@ SFBoundary = arcpy.GetParameterAsText(1)
 MPhotos = arcpy.GetParameterAsText(2)
 KData = arcpy.GetParameterAsText(3)
 BufferDist = arcpy.GetParameterAsText(4)
+# Optional heat map engine: SPATIAL_ANALYST, NUMPY or blank to use Spatial Analyst when a
+# licence is available and the built-in NumPy kernel density otherwise
+HeatMapEngine = arcpy.GetParameterAsText(5).upper()
+# Optional ranking engine: ARRAY for the array based PriorityGrid engine, blank for geoprocessing
+RankingEngine = arcpy.GetParameterAsText(6).upper()
+# Optional MCE weights for the photo count and buffered area criteria (0.5 each by default)
+PhotoWeight = float(arcpy.GetParameterAsText(7) or 0.5)
+AreaWeight = float(arcpy.GetParameterAsText(8) or 0.5)
+# Optional number of worker processes for the ARRAY engine, the grid is split into tiles that are
+# ranked in parallel (0 uses every CPU, blank or 1 ranks the whole grid in this process); the
+# GEOPROCESSING engine always runs serially and ignores it
+Workers = arcpy.GetParameterAsText(9)
 GridRanking = "GridRanking"
 HeatMap = "HeatMap"
 Grid = "in_memory\Grid"
@@ -29,90 +49,202 @@ KDataBuffer = "in_memory\KDataBuffer"
 KDataBufferID = "KDataBufferID"
 KDataBufferIDLayer = "in_memory\KDataBufferID_Layer"
 KDataBufferID_Stat = "in_memory\KDataBufferID_Stat"
-
-# Create heat map
-if arcpy.CheckExtension("Spatial") == "Available":
-        arcpy.CheckOutExtension("Spatial")
-        arcpy.gp.KernelDensity_sa(MPhotos, "NONE", HeatMap, "100", "400", "SQUARE_METERS", "DENSITIES", "PLANAR")
-        arcpy.CheckInExtension("Spatial")
-else:
-        raise LicenseError
-
-# Clean-up input data
-KDatacopy = "in_memory\KData1"
-arcpy.CopyFeatures_management(KData, KDatacopy)
-KData = KDatacopy
-
-MPhotoscopy = "in_memory\MPhotos1"
-arcpy.CopyFeatures_management(MPhotos, MPhotoscopy)
-MPhotos = MPhotoscopy
-
-for f in arcpy.ListFields(KData):
-  if (f.type == 'OID' or f.type == 'Geometry'):
-    print()
-  else:
-    arcpy.DeleteField_management(KData, f.name)
-for f in arcpy.ListFields(MPhotos):
-  if (f.type == 'OID' or f.type == 'Geometry'):
-    print()
-  else:
-    arcpy.DeleteField_management(MPhotos, f.name)
-
-# Create grid
-arcpy.GridIndexFeatures_cartography(Grid, SFBoundary, "INTERSECTFEATURE", "NO_USEPAGEUNIT", "", "0.5 Miles", "0.5 Miles")
-
-# Buffer known data
-arcpy.Buffer_analysis(KData, KDataBuffer, str(BufferDist) + " Meters", "FULL", "ROUND", "NONE", "", "PLANAR")
-
-# Select mapillary photos within buffer
-arcpy.MakeFeatureLayer_management(MPhotos, MPhotosLayer) 
-arcpy.SelectLayerByLocation_management(MPhotosLayer, "INTERSECT", KDataBuffer, "", "NEW_SELECTION", "NOT_INVERT")
-
-# Get count of mapillary photos within buffer for each grid square
-arcpy.SpatialJoin_analysis(Grid, MPhotosLayer, GridRanking)
-
-# Clip buffer to grid
-arcpy.Identity_analysis(KDataBuffer, GridRanking, KDataBufferID, "ALL", "", "NO_RELATIONSHIPS")
-
-# Delete clipped buffers outside grid
-arcpy.MakeFeatureLayer_management(KDataBufferID, KDataBufferIDLayer)
-arcpy.SelectLayerByAttribute_management(KDataBufferIDLayer, "NEW_SELECTION", "FID_GridRanking = -1")
-arcpy.DeleteFeatures_management(KDataBufferIDLayer)
-
-# Sum buffer by grid number
-arcpy.Statistics_analysis(KDataBufferIDLayer, KDataBufferID_Stat, "Shape_Area SUM", "PageNumber")
-
-# Get area values for grids
-arcpy.JoinField_management(GridRanking, "PageNumber", KDataBufferID_Stat, "PageNumber", "SUM_Shape_Area")
-
-# Add fields to grid feature class
-arcpy.AddField_management(GridRanking, "MCE_Photo_Count", "DOUBLE")
-arcpy.AddField_management(GridRanking, "MCE_Shape_Area", "DOUBLE")
-arcpy.AddField_management(GridRanking, "Priority", "DOUBLE")
-
-# Calculate max values for area and photos
-MaxArea = []  
-rows = arcpy.SearchCursor(GridRanking)  
-for row in rows:  
-    MaxArea.append(row.getValue("SUM_Shape_Area"))  
-del rows            
-MaxArea.sort()    
-MaxArea = MaxArea[-1]
-
-MaxPhotos = []  
-rows = arcpy.SearchCursor(GridRanking)  
-for row in rows:  
-    MaxPhotos.append(row.getValue("Join_Count"))  
-del rows            
-MaxPhotos.sort()    
-MaxPhotos = MaxPhotos[-1]
-
-# MCE calculation/priority ranking
-arcpy.CalculateField_management(GridRanking, "MCE_Photo_Count", "1-([Join_Count]/ " + str(MaxPhotos)+")", "VB", "")
-arcpy.CalculateField_management(GridRanking, "MCE_Shape_Area", "[SUM_Shape_Area]/ " + str(MaxArea), "VB", "")
-arcpy.CalculateField_management(GridRanking, "Priority", "(0.5* [MCE_Photo_Count])+(0.5* [MCE_Shape_Area])", "VB", "")
-
-# Cleanup
-arcpy.Delete_management(KDataBufferID)
+# Grid cell size (0.5 Miles) in meters
+GridCellMeters = 804.672
+
+# Functions used by the array ranking engine and the NumPy heat map
+def ReadPlanarPhotos(FeatureClass):
+    '''
+    Returns the X and Y arrays of the photos and their spatial reference.  Photos
+    stored in WGS 1984 longitude and latitude (the Mapillary coordinates) are
+    projected to the UTM zone at their centre so distances are in meters.
+    '''
+    SpatialReference = arcpy.Describe(FeatureClass).spatialReference
+    Points = arcpy.da.FeatureClassToNumPyArray(FeatureClass, ["SHAPE@X", "SHAPE@Y"])
+    X = Points["SHAPE@X"]
+    Y = Points["SHAPE@Y"]
+    if SpatialReference.factoryCode == 4326 and X.size:
+        Zone, North = Projection.UTMZone(X.mean(), Y.mean())
+        X, Y = Projection.UTM(X, Y, Zone, North)
+        SpatialReference = arcpy.SpatialReference(Projection.UTMWkid(Zone, North))
+    return X, Y, SpatialReference
+
+def ReadKnownPoints(FeatureClass, SpatialReference, Spacing):
+    '''
+    Returns the X and Y lists of the known features, lines and polygon
+    outlines are densified so their vertices are no more than the spacing apart.
+    '''
+    KnownX = []
+    KnownY = []
+    with arcpy.da.SearchCursor(FeatureClass, ["SHAPE@"], spatial_reference=SpatialReference) as Cursor:
+        for Row in Cursor:
+            Shape = Row[0]
+            if Shape is None:
+                continue
+            if Shape.type in ("polyline", "polygon"):
+                Shape = Shape.densify("DISTANCE", Spacing, Spacing)
+            if Shape.type == "point":
+                Parts = [[Shape.firstPoint]]
+            elif Shape.type == "multipoint":
+                Parts = [list(Shape)]
+            else:
+                Parts = Shape
+            for Part in Parts:
+                for Point in Part:
+                    if Point is not None:
+                        KnownX.append(Point.X)
+                        KnownY.append(Point.Y)
+    return KnownX, KnownY
+
+def ReadBoundaryRings(FeatureClass, SpatialReference):
+    '''
+    Returns the rings (outer and inner) of every boundary polygon as lists of X,Y pairs.
+    '''
+    Rings = []
+    with arcpy.da.SearchCursor(FeatureClass, ["SHAPE@"], spatial_reference=SpatialReference) as Cursor:
+        for Row in Cursor:
+            for Part in Row[0]:
+                Ring = []
+                for Point in Part:
+                    # A None point separates the inner rings of a part
+                    if Point is None:
+                        Rings.append(Ring)
+                        Ring = []
+                    else:
+                        Ring.append((Point.X, Point.Y))
+                Rings.append(Ring)
+    return Rings
+
+def WriteGridRanking(Ranked, OutName, SpatialReference):
+    '''
+    Writes the ranked grid records from PriorityGrid to a new polygon feature class.
+    '''
+    arcpy.CreateFeatureclass_management(arcpy.env.workspace, OutName, "POLYGON", "", "", "", SpatialReference)
+    Fields = [("PageNumber", "LONG"), ("Join_Count", "LONG"), ("SUM_Shape_Area", "DOUBLE"),
+              ("MCE_Photo_Count", "DOUBLE"), ("MCE_Shape_Area", "DOUBLE"), ("Priority", "DOUBLE")]
+    for Name, FieldType in Fields:
+        arcpy.AddField_management(OutName, Name, FieldType)
+    with arcpy.da.InsertCursor(OutName, ["SHAPE@"] + [Name for Name, FieldType in Fields]) as Cursor:
+        for Record in Ranked:
+            Corners = [(Record["XMin"], Record["YMin"]), (Record["XMin"], Record["YMax"]), (Record["XMax"], Record["YMax"]),
+                       (Record["XMax"], Record["YMin"]), (Record["XMin"], Record["YMin"])]
+            Cell = arcpy.Polygon(arcpy.Array([arcpy.Point(X, Y) for X, Y in Corners]), SpatialReference)
+            Cursor.insertRow([Cell] + [Record[Name].item() for Name, FieldType in Fields])
+
+# Stage timings are reported at the end and written as JSON when MAPILLARY_TRACE is set
+# (the trace is finished as failed when a stage raises an error)
+with Instrumentation.StartTrace("SpatiallyAnalyzePhotos", Message=arcpy.AddMessage) as Trace:
+    # Create heat map
+    HeatMapCellSize = 100
+    HeatMapRadius = 400
+    Trace.Next("HeatMap")
+    if HeatMapEngine != "NUMPY" and arcpy.CheckExtension("Spatial") == "Available":
+            arcpy.CheckOutExtension("Spatial")
+            arcpy.gp.KernelDensity_sa(MPhotos, "NONE", HeatMap, str(HeatMapCellSize), str(HeatMapRadius), "SQUARE_METERS", "DENSITIES", "PLANAR")
+            arcpy.CheckInExtension("Spatial")
+    elif HeatMapEngine != "SPATIAL_ANALYST":
+            # Same quartic kernel, cell size and search radius without a Spatial Analyst licence
+            PhotoX, PhotoY, PhotoSR = ReadPlanarPhotos(MPhotos)
+            Density, Extent = KernelDensity.DensityGrid(PhotoX, PhotoY, HeatMapCellSize, HeatMapRadius, Oversample=3)
+            Raster = arcpy.NumPyArrayToRaster(Density, arcpy.Point(Extent[0], Extent[1]), HeatMapCellSize, HeatMapCellSize)
+            Raster.save(HeatMap)
+            arcpy.DefineProjection_management(HeatMap, PhotoSR)
+    else:
+            raise LicenseError("A Spatial Analyst licence is not available")
+
+    # Rank the grid by capture priority
+    if RankingEngine == "ARRAY":
+        Trace.Next("ReadInputs")
+        PhotoX, PhotoY, SR = ReadPlanarPhotos(MPhotos)
+        # The buffer distance and cell size are in meters, the engine works in map units
+        MetersPerUnit = SR.metersPerUnit
+        Buffer = float(BufferDist) / MetersPerUnit
+        KnownX, KnownY = ReadKnownPoints(KData, SR, Buffer / 10.0)
+        BoundaryRings = ReadBoundaryRings(SFBoundary, SR)
+        Trace.Next("RankGrid", len(PhotoX))
+        if Workers and int(Workers) != 1:
+            Ranked = PriorityGrid.RankGridInSubprocess(PhotoX, PhotoY, KnownX, KnownY, BoundaryRings,
+                                                       GridCellMeters / MetersPerUnit, Buffer, PhotoWeight, AreaWeight, int(Workers))
+        else:
+            Ranked = PriorityGrid.RankGrid(PhotoX, PhotoY, KnownX, KnownY, BoundaryRings,
+                                           GridCellMeters / MetersPerUnit, Buffer, PhotoWeight, AreaWeight)
+        Trace.Next("WriteGridRanking", len(Ranked))
+        WriteGridRanking(Ranked, GridRanking, SR)
+    else:
+        # Clean-up input data
+        Trace.Next("CopyInputs")
+        KDatacopy = "in_memory\KData1"
+        arcpy.CopyFeatures_management(KData, KDatacopy)
+        KData = KDatacopy
+
+        MPhotoscopy = "in_memory\MPhotos1"
+        arcpy.CopyFeatures_management(MPhotos, MPhotoscopy)
+        MPhotos = MPhotoscopy
+
+        for f in arcpy.ListFields(KData):
+          if (f.type == 'OID' or f.type == 'Geometry'):
+            print()
+          else:
+            arcpy.DeleteField_management(KData, f.name)
+        for f in arcpy.ListFields(MPhotos):
+          if (f.type == 'OID' or f.type == 'Geometry'):
+            print()
+          else:
+            arcpy.DeleteField_management(MPhotos, f.name)
+
+        # Create grid
+        Trace.Next("GridIndexFeatures")
+        arcpy.GridIndexFeatures_cartography(Grid, SFBoundary, "INTERSECTFEATURE", "NO_USEPAGEUNIT", "", "0.5 Miles", "0.5 Miles")
+
+        # Buffer known data
+        Trace.Next("Buffer")
+        arcpy.Buffer_analysis(KData, KDataBuffer, str(BufferDist) + " Meters", "FULL", "ROUND", "NONE", "", "PLANAR")
+
+        # Select mapillary photos within buffer
+        Trace.Next("SelectPhotos")
+        arcpy.MakeFeatureLayer_management(MPhotos, MPhotosLayer) 
+        arcpy.SelectLayerByLocation_management(MPhotosLayer, "INTERSECT", KDataBuffer, "", "NEW_SELECTION", "NOT_INVERT")
+
+        # Get count of mapillary photos within buffer for each grid square
+        Trace.Next("SpatialJoin")
+        arcpy.SpatialJoin_analysis(Grid, MPhotosLayer, GridRanking)
+
+        # Clip buffer to grid
+        Trace.Next("Identity")
+        arcpy.Identity_analysis(KDataBuffer, GridRanking, KDataBufferID, "ALL", "", "NO_RELATIONSHIPS")
+
+        # Delete clipped buffers outside grid
+        arcpy.MakeFeatureLayer_management(KDataBufferID, KDataBufferIDLayer)
+        arcpy.SelectLayerByAttribute_management(KDataBufferIDLayer, "NEW_SELECTION", "FID_GridRanking = -1")
+        arcpy.DeleteFeatures_management(KDataBufferIDLayer)
+
+        # Sum buffer by grid number
+        Trace.Next("Statistics")
+        arcpy.Statistics_analysis(KDataBufferIDLayer, KDataBufferID_Stat, "Shape_Area SUM", "PageNumber")
+
+        # Get area values for grids
+        arcpy.JoinField_management(GridRanking, "PageNumber", KDataBufferID_Stat, "PageNumber", "SUM_Shape_Area")
+
+        # Add fields to grid feature class
+        Trace.Next("Priority")
+        arcpy.AddField_management(GridRanking, "MCE_Photo_Count", "DOUBLE")
+        arcpy.AddField_management(GridRanking, "MCE_Shape_Area", "DOUBLE")
+        arcpy.AddField_management(GridRanking, "Priority", "DOUBLE")
+
+        # Calculate max values for area and photos in one pass over the grid
+        Stats = ColumnStatistics.SummarizeTable(GridRanking, ["SUM_Shape_Area", "Join_Count"])
+        MaxArea = Stats["SUM_Shape_Area"]["Max"] or 0
+        MaxPhotos = Stats["Join_Count"]["Max"] or 0
+
+        # MCE calculation/priority ranking, cells without buffered area (null) count as 0
+        with arcpy.da.UpdateCursor(GridRanking, ["Join_Count", "SUM_Shape_Area", "MCE_Photo_Count", "MCE_Shape_Area", "Priority"]) as Cursor:
+            for Row in Cursor:
+                MCEPhotos = 1 - (Row[0] or 0) / float(MaxPhotos) if MaxPhotos else 0.0
+                MCEArea = (Row[1] or 0) / float(MaxArea) if MaxArea else 0.0
+                Cursor.updateRow([Row[0], Row[1], MCEPhotos, MCEArea, PhotoWeight * MCEPhotos + AreaWeight * MCEArea])
+
+        # Cleanup
+        Trace.Next("Cleanup")
+        arcpy.Delete_management(KDataBufferID)
 end = time.time()
 print("Completed in "+ str(round(end - start,0))+" seconds")
@@ -0,0 +1,263 @@
+### Description: Pre-aggregated summary tiles of the features published to
+### ArcGIS Online, so web maps of a city with hundreds of thousands of photos
+### fetch a few KB of summaries per view instead of every point.  For every
+### zoom level in a range the features are counted into square bins: each
+### web map tile (the usual z/x/y Web Mercator tiles) is split into
+### BinsPerTile x BinsPerTile bins and a tile file holds the bins that have
+### features, with the number of features and the mean and largest value of
+### each summary field (class scores, distances, priority):
+###
+###     <folder>/<z>/<x>/<y>.json   {"z": z, "x": x, "y": y,
+###                                  "Bins": [[Column, Row, Count, Mean, Max, ...], ...]}
+###     <folder>/metadata.json      fields, zoom range, bins per tile and extent
+###
+### Columns and rows of the bins count from the top left of the tile.  The
+### tiles are only written to the folder, serving them to web maps (copying
+### the folder to a web server) is a separate step.
+###
+### The tiles are updated incrementally.  A digest of the features in every
+### tile of the finest zoom level is kept in <folder>/tiles.state.json, and a
+### later run only rebuilds the tiles (at every zoom level) above the finest
+### tiles whose digest changed, so new photos only rewrite the tiles they
+### fall in.  Everything is rebuilt when the fields, zoom range or bins
+### change.
+###
+### This script was designed to work with ArcGIS 10.4/10.5 and Python 2.7.10,
+### and also runs under Python 3.  It needs NumPy but does not require arcpy.
+
+###
+### import modules
+###
+
+import json
+import math
+import os
+import shutil
+import numpy as np
+import Projection
+
+###
+### Script Follows
+###
+
+DefaultMinZoom = 10
+DefaultMaxZoom = 16
+# Bins along each side of a tile, a power of 2 so the bins of a zoom level nest in the next
+BinsPerTile = 16
+StateName = 'tiles.state.json'
+MetadataName = 'metadata.json'
+# Significant digits kept of the summary values
+Digits = 6
+# Width of the Web Mercator world in metres
+WorldWidth = 2 * math.pi * Projection.SemiMajorAxis
+# Constants of the 64 bit mix used to hash the features (splitmix64)
+MixConstants = (np.uint64(0x9E3779B97F4A7C15), np.uint64(0xBF58476D1CE4E5B9), np.uint64(0x94D049BB133111EB))
+
+
+def ParseZooms(Text):
+    '''
+    Function that returns the smallest and largest zoom level from text like
+    "10 16", or the defaults when the text is blank.
+    '''
+    if not Text or not Text.strip():
+        return DefaultMinZoom, DefaultMaxZoom
+    Zooms = [int(Value) for Value in Text.replace(',', ' ').split()]
+    if len(Zooms) != 2 or not 0 <= Zooms[0] <= Zooms[1] <= 22:
+        raise ValueError('The zoom levels must be given as "MinZoom MaxZoom" between 0 and 22')
+    return Zooms[0], Zooms[1]
+
+
+def FinestBins(Lon, Lat, MaxZoom, Bins=BinsPerTile):
+    '''
+    Function that returns the column and row (from the top left of the
+    world) of the bin each point falls in at the finest zoom level.  The
+    coordinates must be finite, UpdateTiles leaves out the other points.
+    '''
+    X, Y = Projection.WebMercator(Lon, Lat)
+    Count = (2 ** MaxZoom) * Bins
+    Column = np.floor((X + WorldWidth / 2) / WorldWidth * Count)
+    Row = np.floor((WorldWidth / 2 - Y) / WorldWidth * Count)
+    return (np.clip(Column, 0, Count - 1).astype(np.int64), np.clip(Row, 0, Count - 1).astype(np.int64))
+
+
+def Mix(Values):
+    with np.errstate(over='ignore'):
+        Values = (Values ^ (Values >> np.uint64(30))) * MixConstants[1]
+        Values = (Values ^ (Values >> np.uint64(27))) * MixConstants[2]
+        return Values ^ (Values >> np.uint64(31))
+
+
+def FeatureHashes(Lon, Lat, Values):
+    '''
+    Function that returns a 64 bit hash of the location and values of each
+    feature, computed on whole arrays.
+    '''
+    Hashes = np.zeros(len(Lon), dtype=np.uint64)
+    Columns = [np.asarray(Lon, dtype=np.float64), np.asarray(Lat, dtype=np.float64)]
+    Columns.extend(Values[:, Field] for Field in range(Values.shape[1]))
+    with np.errstate(over='ignore'):
+        for Column in Columns:
+            Hashes = Mix(Hashes + MixConstants[0] + np.ascontiguousarray(Column, dtype=np.float64).view(np.uint64))
+    return Hashes
+
+
+def TileDigests(TileKeys, Hashes):
+    '''
+    Function that returns a dictionary of tile key to digest, the number of
+    features in the tile and the sum of their hashes, which does not depend
+    on the order the features are read in.
+    '''
+    if len(TileKeys) == 0:
+        return {}
+    Order = np.argsort(TileKeys, kind='mergesort')
+    Keys, Starts, Counts = np.unique(TileKeys[Order], return_index=True, return_counts=True)
+    with np.errstate(over='ignore'):
+        Sums = np.add.reduceat(Hashes[Order], Starts)
+    return dict((str(Key), '%d:%016x' % (Count, Sum)) for Key, Count, Sum in
+                zip(Keys.tolist(), Counts.tolist(), Sums.tolist()))
+
+
+def Rounded(Value):
+    if Value != Value:
+        return None
+    return float('%.*g' % (Digits, Value))
+
+
+def TilePath(Folder, Zoom, X, Y):
+    return os.path.join(Folder, str(Zoom), str(X), '%d.json' % Y)
+
+
+def ReadState(Folder):
+    try:
+        with open(os.path.join(Folder, StateName)) as InFile:
+            return json.load(InFile)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def WriteJSON(Path, Document):
+    '''
+    Function that writes a JSON file, first under another name so a client
+    never reads half a file.
+    '''
+    Folder = os.path.dirname(Path)
+    if not os.path.isdir(Folder):
+        os.makedirs(Folder)
+    with open(Path + '.part', 'w') as OutFile:
+        json.dump(Document, OutFile, separators=(',', ':'))
+    if os.path.exists(Path):
+        os.remove(Path)
+    os.rename(Path + '.part', Path)
+
+
+def SummariseBins(BinKeys, Values):
+    '''
+    Function that groups features by bin key and returns the keys, the
+    number of features and the mean and largest value of each field (NaN
+    values, such as nulls, are left out).
+    '''
+    Keys, Inverse = np.unique(BinKeys, return_inverse=True)
+    Counts = np.bincount(Inverse, minlength=len(Keys))
+    Means = []
+    Maxima = []
+    for Field in range(Values.shape[1]):
+        Column = Values[:, Field]
+        Valid = ~np.isnan(Column)
+        Sums = np.bincount(Inverse[Valid], Column[Valid], len(Keys))
+        ValidCounts = np.bincount(Inverse[Valid], minlength=len(Keys))
+        Largest = np.full(len(Keys), -np.inf)
+        np.maximum.at(Largest, Inverse[Valid], Column[Valid])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            Means.append(np.where(ValidCounts > 0, Sums / np.maximum(ValidCounts, 1), np.nan))
+        Maxima.append(np.where(ValidCounts > 0, Largest, np.nan))
+    return Keys, Counts, Means, Maxima
+
+
+def UpdateTiles(Folder, Lon, Lat, Fields, Values, MinZoom=DefaultMinZoom, MaxZoom=DefaultMaxZoom,
+                Bins=BinsPerTile):
+    '''
+    Function that brings the summary tiles in a folder up to date with a set
+    of features: longitude and latitude arrays and a (features, fields)
+    array of summary values.  Only the tiles above finest tiles whose
+    features changed are written, tiles left without features are removed.
+    Features with a non-finite longitude or latitude are left out.
+    Returns a dictionary with the number of tiles written, removed and of
+    finest tiles that were unchanged.
+    '''
+    Lon = np.asarray(Lon, dtype=np.float64)
+    Lat = np.asarray(Lat, dtype=np.float64)
+    Values = np.asarray(Values, dtype=np.float64).reshape(len(Lon), len(Fields))
+    # Features without a location (null or NaN shapes) cannot be binned
+    Located = np.isfinite(Lon) & np.isfinite(Lat)
+    if not Located.all():
+        Lon, Lat, Values = Lon[Located], Lat[Located], Values[Located]
+    Shift = int(math.log(Bins, 2))
+    if 2 ** Shift != Bins:
+        raise ValueError('The number of bins per tile must be a power of 2')
+    Schema = {'Fields': list(Fields), 'MinZoom': MinZoom, 'MaxZoom': MaxZoom, 'Bins': Bins}
+    State = ReadState(Folder)
+    if State.get('Schema') != Schema:
+        # Tiles of another layout are of no use, start again
+        for Zoom in range(0, 23):
+            if os.path.isdir(os.path.join(Folder, str(Zoom))):
+                shutil.rmtree(os.path.join(Folder, str(Zoom)))
+        State = {}
+    Previous = State.get('Digests', {})
+    Column, Row = FinestBins(Lon, Lat, MaxZoom, Bins)
+    # Tiles are keyed by X * 2^zoom + Y
+    Side = 2 ** MaxZoom
+    FinestKeys = (Column >> Shift) * Side + (Row >> Shift)
+    Digests = TileDigests(FinestKeys, FeatureHashes(Lon, Lat, Values))
+    Dirty = [int(Key) for Key in set(Digests) | set(Previous) if Digests.get(Key) != Previous.get(Key)]
+    Counts = {'Written': 0, 'Removed': 0,
+              'Unchanged': len([Key for Key in Digests if Previous.get(Key) == Digests[Key]])}
+    Dirty = np.array(Dirty, dtype=np.int64)
+    for Zoom in range(MinZoom, MaxZoom + 1):
+        Up = MaxZoom - Zoom
+        ZoomSide = 2 ** Zoom
+        DirtyTiles = np.unique(((Dirty // Side) >> Up) * ZoomSide + ((Dirty % Side) >> Up))
+        if len(DirtyTiles) == 0:
+            continue
+        ZoomColumn = Column >> Up
+        ZoomRow = Row >> Up
+        TileKeys = (ZoomColumn >> Shift) * ZoomSide + (ZoomRow >> Shift)
+        # DirtyTiles is sorted, so the features in them are found with a binary search
+        Positions = np.minimum(np.searchsorted(DirtyTiles, TileKeys), len(DirtyTiles) - 1)
+        Selected = np.flatnonzero(DirtyTiles[Positions] == TileKeys)
+        # Bins are keyed by tile and by their place in the tile
+        BinKeys = TileKeys[Selected] * Bins * Bins + (ZoomColumn[Selected] % Bins) * Bins + ZoomRow[Selected] % Bins
+        Keys, BinCounts, Means, Maxima = SummariseBins(BinKeys, Values[Selected])
+        Tiles = Keys // (Bins * Bins)
+        Starts = np.flatnonzero(np.r_[True, Tiles[1:] != Tiles[:-1]]) if len(Tiles) else np.zeros(0, dtype=np.int64)
+        Stops = np.append(Starts[1:], len(Tiles))
+        Written = set()
+        for Start, Stop in zip(Starts.tolist(), Stops.tolist()):
+            Tile = int(Tiles[Start])
+            Entries = []
+            for Index in range(Start, Stop):
+                Place = int(Keys[Index] % (Bins * Bins))
+                Entry = [Place // Bins, Place % Bins, int(BinCounts[Index])]
+                for Mean, Largest in zip(Means, Maxima):
+                    Entry.extend([Rounded(Mean[Index]), Rounded(Largest[Index])])
+                Entries.append(Entry)
+            X, Y = Tile // ZoomSide, Tile % ZoomSide
+            WriteJSON(TilePath(Folder, Zoom, X, Y), {'z': Zoom, 'x': X, 'y': Y, 'Bins': Entries})
+            Written.add(Tile)
+            Counts['Written'] += 1
+        for Tile in set(DirtyTiles.tolist()) - Written:
+            Path = TilePath(Folder, Zoom, Tile // ZoomSide, Tile % ZoomSide)
+            if os.path.exists(Path):
+                os.remove(Path)
+                Counts['Removed'] += 1
+                if not os.listdir(os.path.dirname(Path)):
+                    os.rmdir(os.path.dirname(Path))
+    Extent = None
+    if len(Lon):
+        Extent = [Rounded(Lon.min()), Rounded(Lat.min()), Rounded(Lon.max()), Rounded(Lat.max())]
+    Metadata = dict(Schema)
+    Metadata.update({'Extent': Extent, 'Features': len(Lon), 'Tiles': '{z}/{x}/{y}.json',
+                     'Columns': ['Column', 'Row', 'Count'] + [Name + Suffix for Name in Fields
+                                                              for Suffix in ('_Mean', '_Max')]})
+    WriteJSON(os.path.join(Folder, MetadataName), Metadata)
+    WriteJSON(os.path.join(Folder, StateName), {'Schema': Schema, 'Digests': Digests})
+    return Counts
@@ -0,0 +1,175 @@
+### Description: Writes values calculated by the Mapillary tools back into the
+### rows of an existing table.  The new values are indexed by their key in a
+### dictionary so each table row is read once, matched with a single lookup
+### and written once, in batches.  The table itself is reached through a small
+### storage adapter so the same write-back can target an ArcGIS feature class,
+### a SQLite database or a plain in-memory table.
+###
+### Every adapter provides two methods:
+###     AddFields(Fields) - adds any missing (name, type) fields, the types use
+###                         the ArcGIS names (DOUBLE, LONG, TEXT)
+###     UpdateRows(KeyField, Fields, Lookup[, BatchSize]) - writes the values in
+###                         Lookup (key -> tuple of values) into Fields for the
+###                         rows with a matching KeyField and returns the count
+###
+### BatchSize is the number of rows an adapter that collects its writes sends
+### to the table at once (SQLiteTable).  ArcpyTable and MemoryTable write each
+### matched row as soon as it is read and do not use it.  Null keys never
+### match, as in a database join.
+###
+### This script was designed to work with ArcGIS 10.4/10.5 and Python 2.7.10,
+### and also runs under Python 3.  arcpy is only imported by ArcpyTable.
+
+###
+### import modules
+###
+
+import sqlite3
+
+###
+### Script Follows
+###
+
+# Number of rows written before the pending batch is flushed to the table
+DefaultBatchSize = 5000
+
+# SQLite column types for the ArcGIS field types used by the tools
+SQLiteTypes = {'DOUBLE': 'REAL', 'FLOAT': 'REAL', 'LONG': 'INTEGER',
+               'SHORT': 'INTEGER', 'TEXT': 'TEXT'}
+
+
+def IndexRows(Rows, KeyPosition, ValuePositions):
+    '''
+    Function that builds the key lookup used for the join.  Takes a list of
+    rows, the position of the key in each row and the positions of the values
+    to write back.  When a key appears more than once the last row wins.
+    '''
+    Lookup = {}
+    for Row in Rows:
+        Lookup[Row[KeyPosition]] = tuple(Row[Position] for Position in ValuePositions)
+    return Lookup
+
+
+def UpdateByKey(Table, KeyField, Fields, Lookup, BatchSize=DefaultBatchSize):
+    '''
+    Function that writes the values in the lookup dictionary into the given
+    fields of a table adapter, matching rows on the key field.  Rows whose
+    key is not in the lookup are left unchanged.  Returns the number of rows
+    that were updated.
+    '''
+    if None in Lookup:
+        Lookup = dict((Key, Values) for Key, Values in Lookup.items() if Key is not None)
+    if not Lookup:
+        return 0
+    return Table.UpdateRows(KeyField, list(Fields), Lookup, BatchSize)
+
+
+class TableAdapter(object):
+    '''
+    Interface for the storage adapters, see the module description.
+    '''
+
+    def AddFields(self, Fields):
+        raise NotImplementedError
+
+    def UpdateRows(self, KeyField, Fields, Lookup, BatchSize=DefaultBatchSize):
+        raise NotImplementedError
+
+
+class ArcpyTable(TableAdapter):
+    '''
+    Adapter for a feature class or table opened with arcpy.  The update
+    cursor already streams the rows, so each matched row is written as soon
+    as it is read and BatchSize is not used.
+    '''
+
+    def __init__(self, Path):
+        self.Path = Path
+
+    def AddFields(self, Fields):
+        import arcpy
+        Existing = [Field.name.lower() for Field in arcpy.ListFields(self.Path)]
+        for Name, FieldType in Fields:
+            if Name.lower() not in Existing:
+                arcpy.AddField_management(self.Path, Name, FieldType)
+
+    def UpdateRows(self, KeyField, Fields, Lookup, BatchSize=None):
+        import arcpy
+        Updated = 0
+        with arcpy.da.UpdateCursor(self.Path, [KeyField] + Fields) as Cursor:
+            for Row in Cursor:
+                Values = Lookup.get(Row[0])
+                if Values is not None:
+                    Cursor.updateRow([Row[0]] + list(Values))
+                    Updated += 1
+        return Updated
+
+
+class SQLiteTable(TableAdapter):
+    '''
+    Adapter for a table in a SQLite database, used to run the write-back
+    outside of ArcGIS.  Takes either an open connection or a database path.
+    The keys are matched in Python and the rows are updated by rowid with
+    one executemany call per batch.
+    '''
+
+    def __init__(self, Database, TableName):
+        if isinstance(Database, sqlite3.Connection):
+            self.Connection = Database
+        else:
+            self.Connection = sqlite3.connect(Database)
+        self.TableName = TableName
+
+    def AddFields(self, Fields):
+        Existing = [Column[1].lower() for Column in
+                    self.Connection.execute('PRAGMA table_info("%s")' % self.TableName)]
+        for Name, FieldType in Fields:
+            if Name.lower() not in Existing:
+                self.Connection.execute('ALTER TABLE "%s" ADD COLUMN "%s" %s'
+                                        % (self.TableName, Name, SQLiteTypes.get(FieldType.upper(), '')))
+        self.Connection.commit()
+
+    def UpdateRows(self, KeyField, Fields, Lookup, BatchSize=DefaultBatchSize):
+        Statement = 'UPDATE "%s" SET %s WHERE rowid = ?' % (
+            self.TableName, ', '.join('"%s" = ?' % Field for Field in Fields))
+        Rows = self.Connection.execute('SELECT rowid, "%s" FROM "%s"' % (KeyField, self.TableName)).fetchall()
+        Updated = 0
+        Batch = []
+        for RowID, Key in Rows:
+            Values = Lookup.get(Key)
+            if Values is not None:
+                Batch.append(tuple(Values) + (RowID,))
+                if len(Batch) >= BatchSize:
+                    self.Connection.executemany(Statement, Batch)
+                    Updated += len(Batch)
+                    Batch = []
+        if Batch:
+            self.Connection.executemany(Statement, Batch)
+            Updated += len(Batch)
+        self.Connection.commit()
+        return Updated
+
+
+class MemoryTable(TableAdapter):
+    '''
+    Adapter for a table held as a list of dictionaries (one per row), mostly
+    useful for checking the write-back and for benchmarks.  Rows are
+    updated in place, BatchSize is not used.
+    '''
+
+    def __init__(self, Rows=None):
+        self.Rows = Rows if Rows is not None else []
+
+    def AddFields(self, Fields):
+        for Row in self.Rows:
+            for Name, FieldType in Fields:
+                Row.setdefault(Name, None)
+
+    def UpdateRows(self, KeyField, Fields, Lookup, BatchSize=None):
+        Updated = 0
+        for Row in self.Rows:
+            Values = Lookup.get(Row.get(KeyField))
+            if Values is not None:
+                Row.update(zip(Fields, Values))
+                Updated += 1
+        return Updated
@@ -0,0 +1,10 @@
+### Description: pytest setup for the arcpy-free modules.  The scripts import
+### each other by name, so the Script and Benchmark folders are put on the
+### path the way ArcMap puts the toolbox folder on it.
+
+import os
+import sys
+
+RepositoryFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for Folder in ('Script', 'Benchmark'):
+    sys.path.insert(0, os.path.join(RepositoryFolder, Folder))
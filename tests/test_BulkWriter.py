@@ -0,0 +1,119 @@
+### Description: Checks the GeoPackage writer by reading the tables back with
+### sqlite3, and the fixed width arrays the arcpy writer gives to arcpy.
+
+import sqlite3
+import numpy as np
+import pytest
+import BulkWriter
+
+Fields = [('Key', 'TEXT'), ('Score', 'DOUBLE'), ('Count', 'LONG')]
+
+
+def Rows(Count, Start=0):
+    return [('k%d' % Number, Number / 10.0, Number, (Number - 5.0, 2.0 * Number)) for Number in range(Start, Count)]
+
+
+def ReadTable(Database, TableName='Photos'):
+    Connection = sqlite3.connect(Database)
+    try:
+        Found = []
+        for Row in Connection.execute('SELECT geom, "Key", "Score", "Count" FROM "%s" ORDER BY fid' % TableName):
+            Point = np.frombuffer(bytes(Row[0]), dtype=BulkWriter.PointBlob)[0]
+            assert (Point['Magic'], Point['SrsID'], Point['GeometryType']) == (b'GP', 4326, 1)
+            Found.append(tuple(Row[1:]) + ((float(Point['X']), float(Point['Y'])),))
+        Extent = Connection.execute('SELECT min_x, min_y, max_x, max_y FROM gpkg_contents WHERE table_name = ?',
+                                    (TableName,)).fetchone()
+        return Found, Extent
+    finally:
+        Connection.close()
+
+
+@pytest.mark.parametrize('Count,ChunkSize', [(0, 3), (1, 3), (3, 3), (7, 3), (10, 1), (10, 50)])
+def test_chunk_boundaries(tmpdir, Count, ChunkSize):
+    Database = str(tmpdir.join('Out.gpkg'))
+    with BulkWriter.GeoPackageWriter(Database, 'Photos', Fields, ChunkSize=ChunkSize) as Writer:
+        Writer.WriteRows(Rows(Count))
+        assert len(Writer.Pending) == Count % ChunkSize
+    assert Writer.Count == Count
+    Found, Extent = ReadTable(Database)
+    assert Found == Rows(Count)
+    assert Extent == ((-5.0, 0.0, Count - 6.0, 2.0 * (Count - 1)) if Count else (None,) * 4)
+
+
+def test_chunks_and_rows_mixed(tmpdir):
+    Database = str(tmpdir.join('Out.gpkg'))
+    with BulkWriter.GeoPackageWriter(Database, 'Photos', Fields, ChunkSize=4) as Writer:
+        Writer.Append(Rows(1)[0])
+        Writer.WriteChunk(BulkWriter.MakeChunk(Rows(5, 1), Writer.Fields))
+        Writer.WriteChunk(np.zeros(0, dtype=BulkWriter.ChunkDtype(Fields)))
+        Writer.WriteRows(Rows(9, 5))
+    # Rows given with WriteChunk go straight in, ahead of the buffered ones
+    Found, Extent = ReadTable(Database)
+    assert Found == Rows(5, 1) + Rows(1) + Rows(9, 5)
+    assert Extent == (-5.0, 0.0, 3.0, 16.0)
+
+
+def test_append_adds_to_the_table_and_extent(tmpdir):
+    Database = str(tmpdir.join('Out.gpkg'))
+    with BulkWriter.GeoPackageWriter(Database, 'Photos', Fields) as Writer:
+        Writer.WriteRows(Rows(4, 2))
+    with BulkWriter.GeoPackageWriter(Database, 'Photos', Fields, ChunkSize=2, Append=True) as Writer:
+        Writer.WriteRows(Rows(2) + Rows(8, 6))
+    Found, Extent = ReadTable(Database)
+    assert Found == Rows(4, 2) + Rows(2) + Rows(8, 6)
+    assert Extent == (-5.0, 0.0, 2.0, 14.0)
+    # Appending nothing keeps the extent, without Append the table is replaced
+    BulkWriter.GeoPackageWriter(Database, 'Photos', Fields, Append=True).Close()
+    assert ReadTable(Database) == (Found, Extent)
+    with BulkWriter.GeoPackageWriter(Database, 'Photos', Fields) as Writer:
+        Writer.WriteRows(Rows(1))
+    assert ReadTable(Database) == (Rows(1), (-5.0, 0.0, -5.0, 0.0))
+
+
+def test_append_to_a_new_table(tmpdir):
+    Database = str(tmpdir.join('Out.gpkg'))
+    BulkWriter.GeoPackageWriter(Database, 'Other', Fields).Close()
+    assert not BulkWriter.TableExists(Database, 'Photos')
+    with BulkWriter.GeoPackageWriter(Database, 'Photos', Fields, Append=True) as Writer:
+        Writer.WriteRows(Rows(3))
+    assert BulkWriter.TableExists(Database, 'Photos')
+    assert ReadTable(Database) == (Rows(3), (-5.0, 0.0, -3.0, 4.0))
+
+
+def test_text_and_nulls_round_trip(tmpdir):
+    Database = str(tmpdir.join('Out.gpkg'))
+    Values = [(u'café 東京', 0.5, 1, (1.0, 2.0)),
+              (None, None, 3, (3.0, 4.0)),
+              (u'', float('nan'), 0, (5.0, 6.0)),
+              (u'x' * 1000, -1.25, -7, (7.0, 8.0))]
+    with BulkWriter.GeoPackageWriter(Database, 'Photos', Fields) as Writer:
+        Writer.WriteRows(Values)
+    Found, Extent = ReadTable(Database)
+    # Null text and doubles (and NaN, which SQLite cannot hold) are read back as NULL, text is never cut
+    assert Found == [Values[0], Values[1], (u'', None, 0, (5.0, 6.0)), Values[3]]
+    assert Extent == (1.0, 2.0, 7.0, 8.0)
+
+
+def PlainWriter(Fields):
+    # An ArcpyWriter without arcpy: only the fields and the array type _Array uses are set
+    Writer = BulkWriter.ArcpyWriter.__new__(BulkWriter.ArcpyWriter)
+    BulkWriter.FeatureWriter.__init__(Writer, Fields)
+    Writer.Dtype = np.dtype([(Name, 'U%d' % Writer.TextLength if FieldType == 'TEXT'
+                              else BulkWriter.ChunkTypes[FieldType]) for Name, FieldType in Writer.Fields] +
+                            [(Writer.ShapeField, np.float64, 2)])
+    return Writer
+
+
+def test_arcpy_array():
+    Writer = PlainWriter(Fields)
+    Array = Writer._Array(BulkWriter.MakeChunk(Rows(3) + [('x' * 254, 0.0, 0, (9.0, 9.5))], Writer.Fields))
+    assert list(Array['Key']) == ['k0', 'k1', 'k2', 'x' * 254]
+    assert list(Array['Count']) == [0, 1, 2, 0]
+    assert Array[Writer.ShapeField].tolist() == [[-5.0, 0.0], [-4.0, 2.0], [-3.0, 4.0], [9.0, 9.5]]
+
+
+@pytest.mark.parametrize('Text', [None, 'x' * 255])
+def test_arcpy_array_is_none_when_text_would_be_lost(Text):
+    Writer = PlainWriter(Fields)
+    assert Writer.TextLength == 254
+    assert Writer._Array(BulkWriter.MakeChunk(Rows(3) + [(Text, 0.0, 0, (0.0, 0.0))], Writer.Fields)) is None
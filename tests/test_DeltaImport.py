@@ -0,0 +1,106 @@
+### Description: Checks the incremental import, including a run that stops
+### while the target is being changed.
+
+import sqlite3
+import pytest
+import DeltaImport
+
+Schema = {'Fields': [['Key', 'TEXT'], ['Score', 'DOUBLE']], 'Wkid': 4326}
+Fields = [('Key', 'TEXT'), ('Score', 'DOUBLE')]
+
+
+class ListTarget(object):
+    '''
+    Target without transactions, every change is kept as soon as it is made.
+    Insert fails after FailAfter rows when it is set.
+    '''
+
+    def __init__(self):
+        self.Rows = []
+        self.FailAfter = None
+
+    def Insert(self, Rows):
+        for Row in Rows:
+            if self.FailAfter is not None and self.FailAfter <= 0:
+                raise IOError('Disk full')
+            if self.FailAfter is not None:
+                self.FailAfter -= 1
+            self.Rows.append(tuple(Row))
+
+    def Update(self, Rows):
+        Lookup = dict((Row[0], tuple(Row)) for Row in Rows)
+        self.Rows = [Lookup.get(Row[0], Row) for Row in self.Rows]
+
+    def Delete(self, Keys):
+        Keys = set(Keys)
+        self.Rows = [Row for Row in self.Rows if Row[0] not in Keys]
+
+    def Close(self):
+        pass
+
+
+def Export(Count, Changed=(), Start=0):
+    return [('k%d' % Number, 0.9 if Number in Changed else 0.5, (float(Number), 1.0))
+            for Number in range(Start, Count)]
+
+
+def test_only_changes_are_applied(tmp_path):
+    Index = str(tmp_path / 'Out.keys.sqlite')
+    Target = ListTarget()
+    assert DeltaImport.ImportDelta(Export(10), Target, Index, Schema)['Inserted'] == 10
+    Counts = DeltaImport.ImportDelta(Export(12, Changed=[3]), Target, Index, Schema)
+    assert Counts == {'Inserted': 2, 'Updated': 1, 'Deleted': 0, 'Unchanged': 9}
+    Counts = DeltaImport.ImportDelta(Export(12, Start=2), Target, Index, Schema, DeleteMissing=True)
+    assert Counts == {'Inserted': 0, 'Updated': 1, 'Deleted': 2, 'Unchanged': 9}
+    assert sorted(Target.Rows) == sorted(Export(12, Start=2))
+
+
+def test_stopped_run_is_recovered(tmp_path):
+    Index = str(tmp_path / 'Out.keys.sqlite')
+    Target = ListTarget()
+    DeltaImport.ImportDelta(Export(10), Target, Index, Schema)
+    # The next run stops after inserting 3 of its 10 new rows
+    Target.FailAfter = 3
+    with pytest.raises(IOError):
+        DeltaImport.ImportDelta(Export(20, Changed=[1]), Target, Index, Schema)
+    assert len(Target.Rows) == 13
+    Target.FailAfter = None
+    DeltaImport.ImportDelta(Export(20, Changed=[1]), Target, Index, Schema)
+    Keys = [Row[0] for Row in Target.Rows]
+    assert len(Keys) == len(set(Keys))
+    assert sorted(Target.Rows) == sorted(Export(20, Changed=[1]))
+    Counts = DeltaImport.ImportDelta(Export(20, Changed=[1]), Target, Index, Schema)
+    assert Counts['Unchanged'] == 20
+
+
+def test_stopped_run_with_missing_photos(tmp_path):
+    Index = str(tmp_path / 'Out.keys.sqlite')
+    Target = ListTarget()
+    DeltaImport.ImportDelta(Export(10), Target, Index, Schema)
+    Target.FailAfter = 0
+    with pytest.raises(IOError):
+        DeltaImport.ImportDelta(Export(15, Start=4), Target, Index, Schema, DeleteMissing=True)
+    Target.FailAfter = None
+    DeltaImport.ImportDelta(Export(15, Start=4), Target, Index, Schema, DeleteMissing=True)
+    assert sorted(Target.Rows) == sorted(Export(15, Start=4))
+
+
+def test_geopackage_target(tmp_path):
+    Database = str(tmp_path / 'Out.gpkg')
+    Index = str(tmp_path / 'Out.keys.sqlite')
+    for Rows in (Export(50), Export(60, Changed=[7], Start=5)):
+        Target = DeltaImport.GeoPackageTarget(Database, 'Photos', Fields)
+        DeltaImport.ImportDelta(Rows, Target, Index, Schema, DeleteMissing=True)
+    Connection = sqlite3.connect(Database)
+    Stored = sorted(Connection.execute('SELECT Key, Score FROM Photos'))
+    Connection.close()
+    assert Stored == sorted((Row[0], Row[1]) for Row in Export(60, Changed=[7], Start=5))
+
+
+def test_schema_change_needs_rebuild(tmp_path):
+    Index = str(tmp_path / 'Out.keys.sqlite')
+    assert DeltaImport.NeedsRebuild(Index, Schema, True)
+    DeltaImport.ImportDelta(Export(3), ListTarget(), Index, Schema)
+    assert not DeltaImport.NeedsRebuild(Index, Schema, True)
+    assert DeltaImport.NeedsRebuild(Index, dict(Schema, Wkid=3857), True)
+    assert DeltaImport.NeedsRebuild(Index, Schema, False)
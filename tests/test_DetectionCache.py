@@ -0,0 +1,83 @@
+### Description: Checks that the detection cache returns the same rows, down
+### to the last bit of every value, as reading the GeoJSON file.
+
+import json
+import numpy as np
+import DeltaImport
+import DetectionCache
+import GeoJSONReader
+import Synthetic
+
+
+def test_rows_match_the_geojson(tmp_path):
+    Path = str(tmp_path / 'Photos.geojson')
+    Synthetic.WriteFeatureCollection(Path, 800, Seed=7)
+    Cache = DetectionCache.OpenCache(Path)
+    ObjectKey = Synthetic.ClassFrequencies[1][0]
+    assert list(Cache.ExtractFeatures(ObjectKey)) == list(GeoJSONReader.ExtractFeatures(Path, ObjectKey))
+    assert list(Cache.ExtractClasses(None, 0.2)) == list(GeoJSONReader.ExtractClasses(Path, None, 0.2))
+    assert DetectionCache.ReadManifest(Cache.Folder)['Count'] == 800
+
+
+def test_row_hashes_match(tmp_path):
+    # Values that float32 would round, and whole numbers written without a decimal point
+    Features = [{'type': 'Feature', 'properties': {'key': 'a', 'object--bench': 0.1, 'nature--sky': 1},
+                 'geometry': {'type': 'Point', 'coordinates': [-122.41234567891, 37.712345678901]}},
+                {'type': 'Feature', 'properties': {'key': 'b', 'object--bench': 0.123456789012345},
+                 'geometry': {'type': 'Point', 'coordinates': [-122, 37]}}]
+    Path = str(tmp_path / 'Photos.geojson')
+    with open(Path, 'w') as OutFile:
+        json.dump({'type': 'FeatureCollection', 'features': Features}, OutFile)
+    ObjectKeys = ['object--bench', 'nature--sky']
+
+    def Hashes(Rows):
+        return [DeltaImport.RowHash([Key] + [Classes.get(Name, 0.0) for Name in ObjectKeys] + [Coordinates])
+                for Key, Classes, Coordinates in Rows]
+
+    Cached = DetectionCache.OpenCache(Path).ExtractClasses(ObjectKeys)
+    assert Hashes(Cached) == Hashes(GeoJSONReader.ExtractClasses(Path, ObjectKeys))
+    assert [Row[1] for Row in DetectionCache.OpenCache(Path).ExtractFeatures('object--bench')] == \
+        [0.1, 0.123456789012345]
+
+
+def test_old_cache_is_rebuilt(tmp_path):
+    Path = str(tmp_path / 'Photos.geojson')
+    Synthetic.WriteFeatureCollection(Path, 20)
+    Cache = DetectionCache.OpenCache(Path)
+    Manifest = DetectionCache.ReadManifest(Cache.Folder)
+    Manifest['Version'] = 1
+    DetectionCache.WriteManifest(Cache.Folder, Manifest)
+    assert DetectionCache.ReadManifest(Cache.Folder) is None
+    assert DetectionCache.OpenCache(Path).Count == 20
+
+
+def test_scores_written_in_blocks(tmp_path, monkeypatch):
+    Path = str(tmp_path / 'Photos.geojson')
+    Synthetic.WriteFeatureCollection(Path, 300, Seed=3)
+    Whole = DetectionCache.OpenCache(Path, str(tmp_path / 'Whole'))
+    # 300 rows and 700 values per block: the columns are written two at a time
+    monkeypatch.setattr(DetectionCache, 'BuildBlockCells', 700)
+    Blocks = DetectionCache.OpenCache(Path, str(tmp_path / 'Blocks'))
+    assert len(Whole.Classes) > 2 and Blocks.Classes == Whole.Classes
+    assert np.asarray(Blocks.Scores).tobytes() == np.asarray(Whole.Scores).tobytes()
+    assert list(Blocks.ExtractClasses()) == list(GeoJSONReader.ExtractClasses(Path))
+
+
+def test_find(tmp_path):
+    Path = str(tmp_path / 'Photos.geojson')
+    Synthetic.WriteFeatureCollection(Path, 200, Seed=5)
+    Cache = DetectionCache.OpenCache(Path)
+    Keys = [str(Key) for Key in Cache.Keys]
+    Wanted = [Keys[17], 'missing', Keys[0], Keys[-1], '', Keys[17] + 'x']
+    assert list(Cache.Find(Wanted)) == [17, -1, 0, 199, -1, -1]
+    assert list(Cache.Find(Keys)) == list(range(200))
+
+
+def test_empty_export(tmp_path):
+    Path = str(tmp_path / 'Photos.geojson')
+    with open(Path, 'w') as OutFile:
+        json.dump({'type': 'FeatureCollection', 'features': []}, OutFile)
+    Cache = DetectionCache.OpenCache(Path)
+    assert Cache.Count == 0 and Cache.Scores.shape == (0, 0)
+    assert list(Cache.Find(['a'])) == [-1]
+    assert list(Cache.ExtractClasses()) == []
@@ -0,0 +1,63 @@
+### Description: Checks the grid hash clustering against a brute force run of
+### the same greedy clustering.
+
+import numpy as np
+import pytest
+import DetectionClusters
+
+
+def BruteForce(X, Y, Scores, Radius, Threshold=0.0):
+    Labels = np.full(len(X), -1, dtype=np.int64)
+    Seeds = []
+    Sightings = [Index for Index in np.argsort(-Scores, kind='mergesort').tolist()
+                 if Scores[Index] > 0 and Scores[Index] >= Threshold]
+    for Seed in Sightings:
+        if Labels[Seed] >= 0:
+            continue
+        for Index in Sightings:
+            if Labels[Index] < 0 and (X[Index] - X[Seed]) ** 2 + (Y[Index] - Y[Seed]) ** 2 <= Radius * Radius:
+                Labels[Index] = len(Seeds)
+        Seeds.append(Seed)
+    return Labels, np.array(Seeds, dtype=np.int64)
+
+
+@pytest.mark.parametrize('Radius,Threshold', [(5.0, 0.0), (12.5, 0.3), (40.0, 0.0), (0.5, 0.1)])
+def test_matches_brute_force(Radius, Threshold):
+    Random = np.random.RandomState(int(Radius * 10))
+    # Sightings bunched around objects along a street, with some zero scores
+    Objects = Random.uniform(0, 2000, (150, 2))
+    Near = Objects[Random.randint(0, 150, 1500)] + Random.normal(0, 6, (1500, 2))
+    X, Y = Near[:, 0], Near[:, 1]
+    Scores = np.round(Random.uniform(0, 1, 1500), 2) * (Random.uniform(0, 1, 1500) > 0.1)
+    Labels, Seeds = DetectionClusters.ClusterDetections(X, Y, Scores, Radius, Threshold)
+    ExpectedLabels, ExpectedSeeds = BruteForce(X, Y, Scores, Radius, Threshold)
+    assert np.array_equal(Seeds, ExpectedSeeds)
+    assert np.array_equal(Labels, ExpectedLabels)
+
+
+def test_nothing_to_cluster():
+    Labels, Seeds = DetectionClusters.ClusterDetections([1.0, 2.0], [1.0, 2.0], [0.0, 0.1], 5.0, 0.5)
+    assert Labels.tolist() == [-1, -1] and len(Seeds) == 0
+    with pytest.raises(ValueError):
+        DetectionClusters.ClusterDetections([1.0], [1.0], [1.0], 0)
+
+
+def test_summary():
+    X = np.array([0.0, 1.0, 100.0, 2.0])
+    Y = np.array([0.0, 1.0, 100.0, 0.0])
+    Scores = np.array([0.5, 0.9, 0.7, 0.0])
+    Labels, Seeds = DetectionClusters.ClusterDetections(X, Y, Scores, 5.0)
+    Summary = DetectionClusters.ClusterSummary(Labels, Seeds, X, Y, Scores)
+    assert Seeds.tolist() == [1, 2]
+    assert Summary['Photos'].tolist() == [2, 1]
+    assert np.allclose(Summary['MaxScore'], [0.9, 0.7])
+    assert np.allclose(Summary['MeanScore'], [0.7, 0.7])
+    assert np.allclose(Summary['X'], [0.5, 100.0]) and np.allclose(Summary['Y'], [0.5, 100.0])
+
+
+def test_metric_coordinates():
+    X, Y = DetectionClusters.MetricCoordinates([-122.4, -122.4], [37.7, 37.7001], 4326)
+    # A ten thousandth of a degree of latitude is about 11 metres
+    assert abs(np.hypot(X[1] - X[0], Y[1] - Y[0]) - 11.1) < 0.1
+    Same = DetectionClusters.MetricCoordinates([5.0], [6.0], 2227)
+    assert Same[0].tolist() == [5.0] and Same[1].tolist() == [6.0]
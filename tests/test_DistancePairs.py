@@ -0,0 +1,160 @@
+### Description: Checks the manifest reader and the pair scheduling of the batch
+### distance tool with in-memory tables instead of feature classes.
+
+import threading
+import numpy as np
+import DistancePairs
+import SpatialIndex
+import WriteBack
+
+
+def test_read_manifest(tmpdir):
+    Manifest = tmpdir.join('Manifest.csv')
+    Manifest.write('Mapillary,Known,LineFeatureClass,DistanceField,IDField\n'
+                   ' Photos1 ,Hydrants,false,,\n'
+                   'Photos2,Curbs,TRUE,CurbDist,CurbID\n'
+                   'Photos3,Benches,,,\n')
+    assert DistancePairs.ReadManifest(str(Manifest)) == [
+        {'Mapillary': 'Photos1', 'Known': 'Hydrants', 'Line': False, 'DistanceField': 'Distance', 'IDField': 'NearFID'},
+        {'Mapillary': 'Photos2', 'Known': 'Curbs', 'Line': True, 'DistanceField': 'CurbDist', 'IDField': 'CurbID'},
+        {'Mapillary': 'Photos3', 'Known': 'Benches', 'Line': False, 'DistanceField': 'Distance', 'IDField': 'NearFID'}]
+
+
+def test_read_manifest_optional_columns(tmpdir):
+    Manifest = tmpdir.join('Manifest.csv')
+    Manifest.write('Mapillary,Known\nPhotos,Hydrants\n')
+    assert DistancePairs.ReadManifest(str(Manifest)) == [
+        {'Mapillary': 'Photos', 'Known': 'Hydrants', 'Line': False, 'DistanceField': 'Distance', 'IDField': 'NearFID'}]
+
+
+def test_known_indexes_are_dropped_after_the_last_use():
+    Reads = []
+    Indexes = DistancePairs.KnownIndexes(['a', 'b', 'a'])
+    Read = lambda Name: lambda: Reads.append(Name) or Name.upper()
+    assert Indexes.Acquire('a', Read('a')) == 'A'
+    assert Indexes.Acquire('a', Read('a')) == 'A'
+    Indexes.Release('a')
+    assert 'a' in Indexes.Indexes
+    Indexes.Release('a')
+    assert 'a' not in Indexes.Indexes
+    assert Indexes.Acquire('b', Read('b')) == 'B'
+    Indexes.Release('b')
+    assert Indexes.Indexes == {}
+    assert Reads == ['a', 'b']
+
+
+class Tables(object):
+    '''
+    Stand-in for the feature classes of a batch: the known datasets and the
+    Mapillary photos are arrays, the write-back goes to MemoryTables.  Every
+    call records the thread it ran on and how many pairs have been read but
+    not written.
+    '''
+
+    def __init__(self, Pairs, Seed=1):
+        Random = np.random.RandomState(Seed)
+        self.Known = {}
+        self.Photos = {}
+        self.Tables = {}
+        for Pair in Pairs:
+            if Pair['Known'] not in self.Known:
+                self.Known[Pair['Known']] = (Random.uniform(0, 100, 50), Random.uniform(0, 100, 50))
+            if Pair['Mapillary'] not in self.Photos:
+                X, Y = Random.uniform(0, 100, 40), Random.uniform(0, 100, 40)
+                Keys = ['%s-%d' % (Pair['Mapillary'], Number) for Number in range(40)]
+                self.Photos[Pair['Mapillary']] = (X, Y, Keys)
+                self.Tables[Pair['Mapillary']] = WriteBack.MemoryTable([{'Key': Key} for Key in Keys])
+        self.Threads = set()
+        self.Reads = []
+        self.InFlight = 0
+        self.PeakInFlight = 0
+
+    def ReadIndex(self, Pair):
+        self.Threads.add(threading.current_thread().name)
+        self.Reads.append(Pair['Known'])
+        X, Y = self.Known[Pair['Known']]
+        return SpatialIndex.NearestIndex(X, Y)
+
+    def ReadPoints(self, Pair):
+        self.Threads.add(threading.current_thread().name)
+        self.InFlight += 1
+        self.PeakInFlight = max(self.PeakInFlight, self.InFlight)
+        X, Y, Keys = self.Photos[Pair['Mapillary']]
+        return X, Y, Keys
+
+    def WriteResults(self, Pair, Keys, Distances, IDs):
+        self.Threads.add(threading.current_thread().name)
+        self.InFlight -= 1
+        Table = self.Tables[Pair['Mapillary']]
+        Table.AddFields([(Pair['DistanceField'], 'DOUBLE'), (Pair['IDField'], 'LONG')])
+        Lookup = dict((Key, (float(Distance), int(ID))) for Key, Distance, ID in zip(Keys, Distances, IDs))
+        return WriteBack.UpdateByKey(Table, 'Key', [Pair['DistanceField'], Pair['IDField']], Lookup)
+
+
+def MakePairs():
+    # Photos1 is compared with two datasets and Hydrants is used by three pairs
+    return [{'Mapillary': 'Photos1', 'Known': 'Hydrants', 'DistanceField': 'Distance', 'IDField': 'NearFID'},
+            {'Mapillary': 'Photos2', 'Known': 'Benches', 'DistanceField': 'Distance', 'IDField': 'NearFID'},
+            {'Mapillary': 'Photos3', 'Known': 'Hydrants', 'DistanceField': 'Distance', 'IDField': 'NearFID'},
+            {'Mapillary': 'Photos1', 'Known': 'Benches', 'DistanceField': 'BenchDist', 'IDField': 'BenchID'},
+            {'Mapillary': 'Photos4', 'Known': 'Signs', 'DistanceField': 'Distance', 'IDField': 'NearFID'},
+            {'Mapillary': 'Photos5', 'Known': 'Hydrants', 'DistanceField': 'Distance', 'IDField': 'NearFID'}]
+
+
+def test_run_pairs_matches_brute_force():
+    Pairs = MakePairs()
+    Stub = Tables(Pairs)
+    Jobs = [(Pair, Pair['Known']) for Pair in Pairs]
+    Results = list(DistancePairs.RunPairs(Jobs, Stub.ReadIndex, Stub.ReadPoints, Stub.WriteResults, 2))
+    assert sorted(id(Pair) for Pair, Updated in Results) == sorted(id(Pair) for Pair in Pairs)
+    assert all(Updated == 40 for Pair, Updated in Results)
+    for Pair in Pairs:
+        KX, KY = Stub.Known[Pair['Known']]
+        X, Y, Keys = Stub.Photos[Pair['Mapillary']]
+        D = np.hypot(X[:, None] - KX[None, :], Y[:, None] - KY[None, :])
+        Rows = Stub.Tables[Pair['Mapillary']].Rows
+        assert np.allclose([Row[Pair['DistanceField']] for Row in Rows], D.min(axis=1))
+        assert [Row[Pair['IDField']] for Row in Rows] == list(D.argmin(axis=1))
+
+
+def test_run_pairs_reads_and_writes_on_the_calling_thread():
+    Pairs = MakePairs()
+    Stub = Tables(Pairs)
+    Jobs = [(Pair, Pair['Known']) for Pair in Pairs]
+    for Workers in (1, 2, 4):
+        Stub.Threads = set()
+        Stub.PeakInFlight = 0
+        list(DistancePairs.RunPairs(Jobs, Stub.ReadIndex, Stub.ReadPoints, Stub.WriteResults, Workers))
+        assert Stub.Threads == set([threading.current_thread().name])
+        # At most one pair per worker has been read and not yet written
+        assert Stub.PeakInFlight <= Workers
+        assert Stub.InFlight == 0
+
+
+def test_run_pairs_reads_each_index_once():
+    Pairs = MakePairs()
+    Stub = Tables(Pairs)
+    Jobs = [(Pair, Pair['Known']) for Pair in Pairs]
+    list(DistancePairs.RunPairs(Jobs, Stub.ReadIndex, Stub.ReadPoints, Stub.WriteResults, 3))
+    # The pairs are grouped by index, so each index is read once and not held after its group
+    assert Stub.Reads == ['Benches', 'Hydrants', 'Signs']
+
+
+def test_run_pairs_releases_indexes(monkeypatch):
+    Pairs = MakePairs()
+    Stub = Tables(Pairs)
+    Jobs = [(Pair, Pair['Known']) for Pair in Pairs]
+    Held = []
+    Schedules = []
+    Acquire = DistancePairs.KnownIndexes.Acquire
+
+    def RecordAcquire(Indexes, CacheKey, ReadIndex):
+        Result = Acquire(Indexes, CacheKey, ReadIndex)
+        Held.append(sorted(Indexes.Indexes))
+        Schedules.append(Indexes)
+        return Result
+    monkeypatch.setattr(DistancePairs.KnownIndexes, 'Acquire', RecordAcquire)
+    list(DistancePairs.RunPairs(Jobs, Stub.ReadIndex, Stub.ReadPoints, Stub.WriteResults, 1))
+    # With one worker each pair is written before the next is read, so one index is held at a time
+    assert Held == [['Benches'], ['Benches'], ['Hydrants'], ['Hydrants'], ['Hydrants'], ['Signs']]
+    assert Schedules[-1].Indexes == {}
@@ -0,0 +1,79 @@
+### Description: Checks the incremental GeoJSON reader against json.load.
+
+import io
+import json
+import pytest
+import GeoJSONReader
+import Synthetic
+
+
+def WriteText(Path, Text):
+    with io.open(str(Path), 'w', encoding='utf-8') as OutFile:
+        OutFile.write(Text)
+    return str(Path)
+
+
+def Features(Path):
+    with io.open(Path, encoding='utf-8') as InFile:
+        return json.load(InFile)['features']
+
+
+@pytest.mark.parametrize('ChunkSize', [1, 7, 256, GeoJSONReader.DefaultChunkSize])
+def test_synthetic_export(tmp_path, ChunkSize):
+    Path = str(tmp_path / 'Photos.geojson')
+    Synthetic.WriteFeatureCollection(Path, 700, Seed=5)
+    assert list(GeoJSONReader.IterFeatures(Path, ChunkSize)) == Features(Path)
+
+
+@pytest.mark.parametrize('ChunkSize', [1, 3, 64])
+def test_layout_and_awkward_values(tmp_path, ChunkSize):
+    Document = {
+        'type': 'FeatureCollection',
+        'name': 'before } ] the "features"',
+        'crs': {'properties': {'name': 'urn:ogc:def:crs:OGC:1.3:CRS84'}, 'type': 'name'},
+        'features': [
+            {'type': 'Feature', 'properties': {'key': u'café ]}', 'street': 1e-7, 'nested': [[], {}, [1, [2]]]},
+             'geometry': {'type': 'Point', 'coordinates': [-122.4, 37.7]}},
+            {'type': 'Feature', 'properties': {'key': 'long', 'text': 'x\\"' * 500},
+             'geometry': {'type': 'Point', 'coordinates': [0, -0.0]}},
+        ],
+        'after': [None, True, False],
+    }
+    Path = WriteText(tmp_path / 'Layout.geojson', json.dumps(Document, indent=3, ensure_ascii=False))
+    assert list(GeoJSONReader.IterFeatures(Path, ChunkSize)) == Document['features']
+
+
+def test_empty_and_missing_features(tmp_path):
+    Path = WriteText(tmp_path / 'Empty.geojson', '{"type": "FeatureCollection", "features": [ ]}')
+    assert list(GeoJSONReader.IterFeatures(Path, 2)) == []
+    Path = WriteText(tmp_path / 'None.geojson', '{"type": "FeatureCollection"}')
+    assert list(GeoJSONReader.IterFeatures(Path)) == []
+
+
+def test_truncated_file_raises(tmp_path):
+    Path = str(tmp_path / 'Photos.geojson')
+    Synthetic.WriteFeatureCollection(Path, 50)
+    with io.open(Path, encoding='utf-8') as InFile:
+        Text = InFile.read()
+    Path = WriteText(tmp_path / 'Truncated.geojson', Text[:len(Text) // 2])
+    with pytest.raises(ValueError):
+        list(GeoJSONReader.IterFeatures(Path, 128))
+
+
+def test_rows_match_json_load(tmp_path):
+    Path = str(tmp_path / 'Photos.geojson')
+    Synthetic.WriteFeatureCollection(Path, 500, Seed=6)
+    Loaded = Features(Path)
+    ObjectKey = Synthetic.ClassFrequencies[0][0]
+    Expected = [(Feature['properties']['key'], Feature['properties'].get(ObjectKey, -1.0),
+                 Feature['geometry']['coordinates']) for Feature in Loaded]
+    assert list(GeoJSONReader.ExtractFeatures(Path, ObjectKey, 100, Default=-1.0)) == Expected
+    ObjectKeys = [Name for Name, Frequency in Synthetic.ClassFrequencies[:3]]
+    Expected = [(Feature['properties']['key'],
+                 dict((Name, Value) for Name, Value in Feature['properties'].items()
+                      if Name in ObjectKeys and Value >= 0.3),
+                 Feature['geometry']['coordinates']) for Feature in Loaded]
+    assert list(GeoJSONReader.ExtractClasses(Path, ObjectKeys, 0.3, 100)) == Expected
+    Everything = list(GeoJSONReader.FileSource(Path).ExtractClasses())
+    assert [len(Classes) for Key, Classes, Coordinates in Everything] == \
+        [len(Feature['properties']) - 1 for Feature in Loaded]
@@ -0,0 +1,79 @@
+### Description: Checks the NumPy kernel density grid against the exact quartic
+### kernel density and the formula of ArcGIS Kernel Density.  The sample data
+### has no ArcGIS Kernel Density raster to compare with, so the reference
+### values come from the formula in the ArcGIS help (see KernelDensity.py).
+
+import math
+import numpy as np
+import pytest
+import KernelDensity
+
+
+def RandomPoints(Count, Seed):
+    Random = np.random.RandomState(Seed)
+    return Random.uniform(0, 5000, Count), Random.uniform(0, 3000, Count)
+
+
+def Engine(Name, monkeypatch):
+    # Every kernel is applied with the FFT when no kernel is small enough for shifted sums
+    if Name == 'FFT':
+        monkeypatch.setattr(KernelDensity, 'MaxDirectKernelCells', 0)
+    else:
+        monkeypatch.setattr(KernelDensity, 'MaxDirectKernelCells', 10 ** 9)
+
+
+@pytest.mark.parametrize('Name', ['Direct', 'FFT'])
+@pytest.mark.parametrize('Seed', [0, 1, 2])
+@pytest.mark.parametrize('Oversample,MeanError', [(1, 0.08), (3, 0.03)])
+def test_grid_matches_exact_density(Name, Seed, Oversample, MeanError, monkeypatch):
+    Engine(Name, monkeypatch)
+    X, Y = RandomPoints(300, Seed)
+    Density, Extent = KernelDensity.DensityGrid(X, Y, 100, 400, Oversample=Oversample)
+    Exact = KernelDensity.ExactDensity(X, Y, 100, 400, Extent)
+    assert Density.shape == Exact.shape
+    Error = np.abs(Density - Exact)
+    # The tolerances stated in KernelDensity.py
+    assert Error.sum() / Exact.sum() < MeanError
+    assert Error.max() / Exact.max() < 0.15
+    assert abs(Density.sum() - Exact.sum()) / Exact.sum() < 0.005
+
+
+@pytest.mark.parametrize('Radius', [300, 1500])
+def test_points_on_cell_centres_are_exact(Radius):
+    X, Y = RandomPoints(300, 3)
+    X = (np.floor(X / 100) + 0.5) * 100
+    Y = (np.floor(Y / 100) + 0.5) * 100
+    Weights = np.random.RandomState(4).uniform(1, 5, X.size)
+    Density, Extent = KernelDensity.DensityGrid(X, Y, 100, Radius, Extent=(0, 0, 5000, 3000), Weights=Weights)
+    assert np.allclose(Density, KernelDensity.ExactDensity(X, Y, 100, Radius, Extent, Weights), rtol=1e-9, atol=1e-15)
+
+
+def test_engines_agree(monkeypatch):
+    X, Y = RandomPoints(400, 5)
+    Grids = []
+    for Name in ('Direct', 'FFT'):
+        Engine(Name, monkeypatch)
+        Grids.append(KernelDensity.DensityGrid(X, Y, 100, 400, Oversample=3)[0])
+    assert np.allclose(Grids[0], Grids[1], rtol=1e-9, atol=1e-15)
+
+
+def test_single_point_reference_values():
+    # One point at the centre of a cell: Density = 3 / (pi * Radius^2) * (1 - (d / Radius)^2)^2
+    Density, Extent = KernelDensity.DensityGrid([550.0], [550.0], 100, 400, Extent=(0, 0, 1100, 1100))
+    assert Extent == (0, 0, 1100, 1100)
+    Peak = 3 / (math.pi * 400 ** 2)
+    assert Density[5, 5] == pytest.approx(Peak)
+    assert Density[5, 6] == pytest.approx(Peak * (1 - (100 / 400.0) ** 2) ** 2)
+    assert Density[4, 6] == pytest.approx(Peak * (1 - 2 * (100 / 400.0) ** 2) ** 2)
+    assert Density[5, 9] == 0.0
+    # The volume under the kernel is one point
+    assert Density.sum() * 100 ** 2 == pytest.approx(1.0, rel=0.02)
+
+
+def test_grid_round_trip(tmpdir):
+    Density, Extent = KernelDensity.DensityGrid(*RandomPoints(50, 6), CellSize=100, SearchRadius=400)
+    Path = KernelDensity.SaveGrid(str(tmpdir.join('Heat')), Density, Extent, 100, 32610)
+    Loaded, Header = KernelDensity.LoadGrid(Path)
+    assert np.allclose(Loaded, Density, rtol=1e-6)
+    assert (Header['XMin'], Header['YMin'], Header['XMax'], Header['YMax']) == pytest.approx(Extent)
+    assert (Header['Rows'], Header['Columns'], Header['SpatialReference']) == (Density.shape[0], Density.shape[1], 32610)
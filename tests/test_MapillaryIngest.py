@@ -0,0 +1,96 @@
+### Description: Runs MapillaryIngest against the local mock of the Mapillary
+### API (Benchmark/MockMapillaryServer.py).
+
+import asyncio
+import re
+import threading
+import time
+import pytest
+import MapillaryIngest
+import MockMapillaryServer
+
+TileSize = 0.02
+PageSize = 25
+
+
+def Extent(Server):
+    Photos = Server.Photos
+    return (float(Photos.Lon.min()) - 0.001, float(Photos.Lat.min()) - 0.001,
+            float(Photos.Lon.max()) + 0.001, float(Photos.Lat.max()) + 0.001)
+
+
+def Run(Server, CacheFolder='', **Options):
+    Messages = []
+    Keys = [Feature['properties']['key'] for Feature in
+            MapillaryIngest.IterFeatures(Extent(Server), Server.URL, TileSize=TileSize, PageSize=PageSize,
+                                         CacheFolder=CacheFolder, Message=Messages.append, **Options)]
+    Counts = dict(zip(('Pages', 'Cached', 'Retries', 'Photos'), map(int, re.findall(r'\d+', Messages[0]))))
+    return Keys, Counts
+
+
+@pytest.fixture
+def Server():
+    Server = MockMapillaryServer.Serve(3000, Chunked=True, Seed=3)
+    # Put photos on the edge between the first two tiles, both tiles return them
+    Edge = MapillaryIngest.Tiles(Extent(Server), TileSize)[0][2]
+    Server.Photos.Lon[:40] = Edge
+    yield Server
+    Server.shutdown()
+
+
+def test_every_photo_once(Server):
+    Keys, Counts = Run(Server)
+    assert len(Keys) == len(set(Keys))
+    assert set(Keys) == set(Server.Photos.Keys)
+    Tiles = len(MapillaryIngest.Tiles(Extent(Server), TileSize))
+    # Tiles with more than PageSize photos were followed over several pages
+    assert Counts['Pages'] > Tiles
+    assert Counts['Photos'] == len(Server.Photos.Keys)
+
+
+def test_edge_photos_are_fetched_twice_and_yielded_once(Server):
+    Fetched = []
+    Loop = asyncio.new_event_loop()
+    try:
+        Loop.run_until_complete(MapillaryIngest.Ingest(Extent(Server), Fetched.extend, Server.URL, TileSize=TileSize,
+                                                       PageSize=PageSize, CacheFolder=''))
+    finally:
+        Loop.close()
+    assert len(Fetched) >= len(Server.Photos.Keys) + 40
+    assert len(Run(Server)[0]) == len(Server.Photos.Keys)
+
+
+def test_failures_are_retried():
+    Server = MockMapillaryServer.Serve(2000, FailureRate=0.2, Chunked=True, Seed=4)
+    try:
+        Keys, Counts = Run(Server, Retries=20)
+    finally:
+        Server.shutdown()
+    assert sorted(Keys) == sorted(Server.Photos.Keys)
+    assert Counts['Retries'] > 0
+
+
+def test_cache_is_reused(Server, tmp_path):
+    First, Counts = Run(Server, str(tmp_path))
+    assert Counts['Cached'] == 0
+    Requests = Server.Counts['Requests']
+    Second, Counts = Run(Server, str(tmp_path))
+    assert Server.Counts['Requests'] == Requests
+    assert Counts['Pages'] == 0 and Counts['Cached'] > 0
+    assert sorted(Second) == sorted(First)
+
+
+def test_close_stops_the_fetching(Server):
+    Threads = threading.active_count()
+    Features = MapillaryIngest.IterFeatures(Extent(Server), Server.URL, TileSize=TileSize, PageSize=10,
+                                            Concurrency=2, CacheFolder='')
+    for Number in range(5):
+        next(Features)
+    Start = time.time()
+    Features.close()
+    assert time.time() - Start < 5
+    Requests = Server.Counts['Requests']
+    time.sleep(0.2)
+    # Nothing is fetched once the generator is closed and its thread has ended
+    assert Server.Counts['Requests'] == Requests
+    assert threading.active_count() <= Threads + 1
@@ -0,0 +1,115 @@
+### Description: Checks the array ranking engine on small grids worked out by
+### hand and the sampled buffered areas against the exact areas.
+
+import math
+import numpy as np
+import pytest
+import PriorityGrid
+import SpatialIndex
+
+
+Square = [[(0, 0), (0, 200), (300, 200), (300, 0), (0, 0)]]
+
+
+def test_grid_cells_are_numbered_from_the_top_left():
+    Grid = PriorityGrid.CellGrid(Square, 100)
+    assert (Grid.NRows, Grid.NColumns, Grid.Count) == (2, 3, 6)
+    assert list(Grid.Rows) == [0, 0, 0, 1, 1, 1]
+    assert list(Grid.Columns) == [0, 1, 2, 0, 1, 2]
+    XMin, YMin, XMax, YMax = Grid.CellExtents()
+    assert list(XMin) == [0, 100, 200, 0, 100, 200]
+    assert list(YMin) == [100, 100, 100, 0, 0, 0]
+    assert list(Grid.CellOf(np.array([50.0, 250.0, 350.0, 150.0]), np.array([150.0, 50.0, 50.0, -1.0]))) == [0, 5, -1, -1]
+
+
+def test_cells_away_from_the_boundary_are_dropped():
+    # An L shape leaves the top right cell of its 2 x 2 extent out
+    Shape = [[(0, 0), (0, 200), (100, 200), (100, 100), (200, 100), (200, 0), (0, 0)]]
+    Grid = PriorityGrid.CellGrid(Shape, 90)
+    Kept = set(zip(Grid.Rows.tolist(), Grid.Columns.tolist()))
+    assert (Grid.NRows, Grid.NColumns) == (3, 3)
+    assert (0, 2) not in Kept and (0, 1) in Kept and (2, 2) in Kept
+    assert Grid.Count == 8
+
+
+def test_rank_grid_by_hand():
+    KnownX, KnownY = [150.0, 50.0], [150.0, 50.0]
+    # Two photos near the first known point, one near the second, two too far away
+    PhotoX = [160.0, 140.0, 55.0, 250.0, 130.0]
+    PhotoY = [150.0, 140.0, 45.0, 50.0, 180.0]
+    Ranked = PriorityGrid.RankGrid(PhotoX, PhotoY, KnownX, KnownY, Square, 100, 30, 0.7, 0.3)
+    assert list(Ranked['PageNumber']) == [1, 2, 3, 4, 5, 6]
+    assert list(Ranked['Join_Count']) == [0, 2, 0, 1, 0, 0]
+    Disc = math.pi * 30 ** 2
+    assert Ranked['SUM_Shape_Area'][[1, 3]] == pytest.approx([Disc, Disc], rel=0.01)
+    assert list(Ranked['SUM_Shape_Area'][[0, 2, 4, 5]]) == [0.0] * 4
+    assert list(Ranked['MCE_Photo_Count']) == [1.0, 0.0, 1.0, 0.5, 1.0, 1.0]
+    assert list(Ranked['MCE_Shape_Area']) == [0.0, 1.0, 0.0, 1.0, 0.0, 0.0]
+    assert Ranked['Priority'] == pytest.approx([0.7, 0.3, 0.7, 0.65, 0.7, 0.7])
+
+
+def test_no_known_points_or_photos():
+    Ranked = PriorityGrid.RankGrid([], [], [], [], Square, 100, 30)
+    assert list(Ranked['Join_Count']) == [0] * 6
+    assert list(Ranked['Priority']) == [0.0] * 6
+
+
+def CellArea(KnownX, KnownY, CellSize, Radius, Cells=3):
+    # The buffered area of a block of cells around the origin
+    Corners = (np.arange(Cells) - Cells // 2) * CellSize - CellSize / 2.0
+    XMin = np.tile(Corners, Cells)
+    YMin = np.repeat(Corners, Cells)
+    Index = SpatialIndex.NearestIndex(KnownX, KnownY)
+    return PriorityGrid.CellBufferArea(XMin, YMin, float(CellSize), Index, Radius)
+
+
+@pytest.mark.parametrize('Radius', [30.0, 100.0, 150.0])
+def test_buffer_area_matches_the_circle(Radius):
+    Random = np.random.RandomState(int(Radius))
+    # Known points on round coordinates line up with the sample lattice, random ones do not
+    for X, Y in [(0.0, 0.0), (50.0, 50.0), (10.0, -20.0)] + Random.uniform(-100, 100, (20, 2)).tolist():
+        Areas = CellArea([X], [Y], 400, Radius)
+        assert Areas.sum() == pytest.approx(math.pi * Radius ** 2, rel=0.01)
+
+
+def test_buffer_area_of_a_corner_is_split_between_cells():
+    Areas = CellArea([200.0], [200.0], 400, 100.0)
+    # The point is on the corner shared by the middle, right, top and top right cells
+    assert Areas[[4, 5, 7, 8]] == pytest.approx([math.pi * 100.0 ** 2 / 4] * 4, rel=0.01)
+    assert Areas[[0, 1, 2, 3, 6]].sum() == 0.0
+
+
+def test_overlapping_buffers_are_counted_once():
+    Radius, Gap = 100.0, 120.0
+    Lens = 2 * Radius ** 2 * math.acos(Gap / (2 * Radius)) - Gap / 2 * math.sqrt(4 * Radius ** 2 - Gap ** 2)
+    Areas = CellArea([-Gap / 2, Gap / 2], [3.0, 3.0], 400, Radius)
+    assert Areas.sum() == pytest.approx(2 * math.pi * Radius ** 2 - Lens, rel=0.01)
+
+
+def CityInputs(Seed=7):
+    Random = np.random.RandomState(Seed)
+    Angles = np.linspace(0, 2 * math.pi, 40, endpoint=False)
+    Radii = Random.uniform(3000, 5000, Angles.size)
+    Outer = np.column_stack([Radii * np.cos(Angles), Radii * np.sin(Angles)])
+    Hole = np.array([(-500, -500), (-500, 500), (500, 500), (500, -500)], dtype=np.float64)
+    Photos = Random.uniform(-5000, 5000, (3000, 2))
+    Known = Random.uniform(-5000, 5000, (300, 2))
+    return Photos[:, 0], Photos[:, 1], Known[:, 0], Known[:, 1], [Outer, Hole]
+
+
+@pytest.mark.parametrize('Workers,TileCells', [(1, 1), (1, 3), (2, 2), (2, None), (3, 5), (3, 40)])
+def test_tiled_ranking_matches_serial(Workers, TileCells):
+    PhotoX, PhotoY, KnownX, KnownY, Rings = CityInputs()
+    Serial = PriorityGrid.RankGrid(PhotoX, PhotoY, KnownX, KnownY, Rings, 804.672, 150, 0.6, 0.4)
+    Tiled = PriorityGrid.RankGridTiled(PhotoX, PhotoY, KnownX, KnownY, Rings, 804.672, 150, 0.6, 0.4,
+                                       Workers=Workers, TileCells=TileCells)
+    assert Serial.dtype == Tiled.dtype
+    # The tiles give exactly the same records, not just close ones
+    assert Serial.tobytes() == Tiled.tobytes()
+
+
+def test_ranking_in_a_subprocess_matches_serial():
+    PhotoX, PhotoY, KnownX, KnownY, Rings = CityInputs(8)
+    Serial = PriorityGrid.RankGrid(PhotoX, PhotoY, KnownX, KnownY, Rings, 804.672, 150)
+    Ranked = PriorityGrid.RankGridInSubprocess(PhotoX, PhotoY, KnownX, KnownY, Rings, 804.672, 150, Workers=2)
+    assert Serial.tobytes() == Ranked.tobytes()
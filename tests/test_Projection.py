@@ -0,0 +1,92 @@
+### Description: Checks the array projections against reference coordinates
+### (from PROJ, the library behind most GIS software, to a tenth of a
+### millimetre) and the inverse projections against the forward ones.
+
+import numpy as np
+import pytest
+import Projection
+
+# Longitude, latitude, zone, north, easting and northing
+UTMPoints = [(-122.3321, 47.6062, 10, True, 550200.2134, 5272748.5916),
+             (-125.9, 48.5, 10, True, 285782.7001, 5375937.4940),
+             (10.0, 70.0, 32, True, 538169.7823, 7766186.1514),
+             (3.0, 0.0, 31, True, 500000.0, 0.0),
+             # Either side of the edge between zones 10 and 11
+             (-120.001, 34.0, 10, True, 776998.8999, 3766212.0088),
+             (-119.999, 34.0, 11, True, 223001.1001, 3766212.0088),
+             # Just over the edge, projected in the zone next to it
+             (-119.999, 34.0, 10, True, 777183.6911, 3766217.4243),
+             (-114.0005, 49.0, 11, True, 719377.1370, 5431791.4184),
+             # Southern hemisphere
+             (151.2093, -33.8688, 56, False, 334368.6336, 6250948.3454),
+             (18.4241, -33.9249, 34, False, 261881.5985, 6243182.3545),
+             (-58.3816, -34.6037, 21, False, 373317.5023, 6170036.1713),
+             (-78.4678, -0.1807, 17, False, 781861.4575, 9980007.5669),
+             # Across the antimeridian from the centre of zone 60
+             (179.5, -17.0, 60, False, 766178.5926, 8118746.3547),
+             (-179.5, -17.0, 60, False, 872744.8436, 8117113.3855)]
+
+# Longitude, latitude, X and Y
+MercatorPoints = [(-122.3321, 47.6062, -13617947.0797, 6041588.8174),
+                  (151.2093, -33.8688, 16832542.2792, -4011198.6473),
+                  (0.0, -60.0, 0.0, -8399737.8898),
+                  (180.0, 0.0, 20037508.3428, 0.0),
+                  (-180.0, Projection.MaxMercatorLatitude, -20037508.3428, 20037508.3428)]
+
+
+@pytest.mark.parametrize('Lon,Lat,Zone,North,X,Y', UTMPoints)
+def test_utm_matches_reference(Lon, Lat, Zone, North, X, Y):
+    Easting, Northing = Projection.UTM([Lon], [Lat], Zone, North)
+    assert abs(Easting[0] - X) < 1e-3 and abs(Northing[0] - Y) < 1e-3
+
+
+def test_utm_round_trip():
+    Lon, Lat, Zones, North = [np.array(Column) for Column in list(zip(*UTMPoints))[:4]]
+    for Zone in np.unique(Zones):
+        for Hemisphere in (True, False):
+            Selected = (Zones == Zone) & (North == Hemisphere)
+            if Selected.any():
+                X, Y = Projection.UTM(Lon[Selected], Lat[Selected], Zone, Hemisphere)
+                BackLon, BackLat = Projection.InverseUTM(X, Y, Zone, Hemisphere)
+                BackLon = (BackLon + 180) % 360 - 180
+                assert np.allclose(BackLon, Lon[Selected], atol=1e-9)
+                assert np.allclose(BackLat, Lat[Selected], atol=1e-9)
+
+
+@pytest.mark.parametrize('Lon,Lat,Zone,North', [(-122.3321, 47.6062, 10, True), (-120.0, 34.0, 11, True),
+                                                (-120.0001, 34.0, 10, True), (-114.0005, 49.0, 11, True),
+                                                (-180.0, 10.0, 1, True), (179.99, 10.0, 60, True),
+                                                (151.2093, -33.8688, 56, False), (-78.4678, -0.1807, 17, False),
+                                                (3.0, 0.0, 31, True)])
+def test_utm_zone(Lon, Lat, Zone, North):
+    assert Projection.UTMZone(Lon, Lat) == (Zone, North)
+
+
+def test_utm_wkid():
+    assert Projection.UTMWkid(10) == 32610
+    assert Projection.UTMWkid(*Projection.UTMZone(151.2093, -33.8688)) == 32756
+    assert Projection.Transform(32756)([151.2093], [-33.8688])[0] == pytest.approx([334368.6336], abs=1e-3)
+
+
+@pytest.mark.parametrize('Lon,Lat,X,Y', MercatorPoints)
+def test_web_mercator_matches_reference(Lon, Lat, X, Y):
+    MercatorX, MercatorY = Projection.WebMercator([Lon], [Lat])
+    assert abs(MercatorX[0] - X) < 1e-3 and abs(MercatorY[0] - Y) < 1e-3
+
+
+def test_web_mercator_round_trip():
+    Random = np.random.RandomState(0)
+    Lon = np.append(Random.uniform(-180, 180, 1000), [-180.0, 0.0, 180.0])
+    Lat = np.append(Random.uniform(-85, 85, 1000), [-Projection.MaxMercatorLatitude, 0.0,
+                                                    Projection.MaxMercatorLatitude])
+    BackLon, BackLat = Projection.InverseWebMercator(*Projection.WebMercator(Lon, Lat))
+    assert np.allclose(BackLon, Lon, atol=1e-9) and np.allclose(BackLat, Lat, atol=1e-9)
+    X, Y = Random.uniform(-2e7, 2e7, 1000), Random.uniform(-2e7, 2e7, 1000)
+    BackX, BackY = Projection.WebMercator(*Projection.InverseWebMercator(X, Y))
+    assert np.allclose(BackX, X, atol=1e-6) and np.allclose(BackY, Y, atol=1e-6)
+
+
+def test_web_mercator_clamps_the_poles():
+    X, Y = Projection.WebMercator([0.0, 0.0], [90.0, -89.0])
+    assert Y == pytest.approx([20037508.3428, -20037508.3428], abs=1e-3)
+    assert np.isfinite(Y).all()
@@ -0,0 +1,104 @@
+### Description: Checks the content hash that decides whether a map document
+### has to be published again.
+
+import os
+import PublishCache
+
+
+def MakeData(tmpdir):
+    # An MXD with a shapefile and a feature class in a file geodatabase
+    MXD = tmpdir.join('City.mxd')
+    MXD.write_binary(b'mxd')
+    for Extension in ('shp', 'shx', 'dbf', 'prj'):
+        tmpdir.join('Photos.' + Extension).write_binary(Extension.encode('ascii'))
+    tmpdir.join('PhotosNear.shp').write_binary(b'other')
+    Database = tmpdir.mkdir('City.gdb')
+    Database.join('a00000001.gdbtable').write_binary(b'table')
+    Database.join('a00000001.gdbtablx').write_binary(b'index')
+    return str(MXD), [str(tmpdir.join('Photos.shp')), os.path.join(str(Database), 'Grid', 'GridRanking')]
+
+
+def Publish(StatePath, MXD, Sources, Settings=('Photos', 'Summary', 'Tags')):
+    # One run of the tool: hash, check and record the upload
+    State = PublishCache.ReadState(StatePath)
+    Hash, Files = PublishCache.ContentHash(MXD, Sources, Settings, PublishCache.KnownFiles(State, 'Photos'))
+    Unchanged = PublishCache.IsUnchanged(State, 'Photos', Hash)
+    if not Unchanged:
+        PublishCache.Record(StatePath, State, 'Photos', Hash, Files, 'now')
+    return Unchanged, Hash
+
+
+def test_data_files(tmpdir):
+    MXD, Sources = MakeData(tmpdir)
+    tmpdir.join('City.gdb', 'Photos.sr.lock').write_binary(b'')
+    assert PublishCache.DataFiles(Sources[0]) == [str(tmpdir.join('Photos.' + Extension))
+                                                  for Extension in ('dbf', 'prj', 'shp', 'shx')]
+    assert PublishCache.DataFiles(Sources[1]) == [str(tmpdir.join('City.gdb', Name))
+                                                  for Name in ('a00000001.gdbtable', 'a00000001.gdbtablx')]
+    assert PublishCache.DataFiles(str(tmpdir.join('Missing.shp'))) is None
+
+
+def test_unchanged_content_is_not_published_again(tmpdir):
+    MXD, Sources = MakeData(tmpdir)
+    StatePath = PublishCache.StatePathFor(MXD)
+    assert Publish(StatePath, MXD, Sources)[0] is False
+    assert os.path.exists(StatePath) and not os.path.exists(StatePath + '.part')
+    # The order of the data sources and repeated sources do not change the hash
+    assert Publish(StatePath, MXD, Sources[::-1] + Sources)[0] is True
+
+
+def test_changed_file_or_settings_are_published(tmpdir):
+    MXD, Sources = MakeData(tmpdir)
+    StatePath = PublishCache.StatePathFor(MXD)
+    Unchanged, First = Publish(StatePath, MXD, Sources)
+    tmpdir.join('City.gdb', 'a00000001.gdbtable').write_binary(b'table with more rows')
+    Unchanged, Second = Publish(StatePath, MXD, Sources)
+    assert not Unchanged and Second != First
+    Unchanged, Third = Publish(StatePath, MXD, Sources, ('Photos', 'Another summary', 'Tags'))
+    assert not Unchanged and Third != Second
+    assert Publish(StatePath, MXD, Sources, ('Photos', 'Another summary', 'Tags'))[0] is True
+
+
+def test_hash_is_reused_when_size_and_time_are_unchanged(tmpdir, monkeypatch):
+    MXD, Sources = MakeData(tmpdir)
+    Hash, Files = PublishCache.ContentHash(MXD, Sources)
+    Read = []
+    Open = open
+
+    def RecordOpen(Path, *Arguments):
+        Read.append(Path)
+        return Open(Path, *Arguments)
+    monkeypatch.setattr(PublishCache, 'open', RecordOpen, raising=False)
+    assert PublishCache.ContentHash(MXD, Sources, Known=Files) == (Hash, Files)
+    assert Read == []
+    # A file written again with the same size but a new time is read again
+    Changed = str(tmpdir.join('Photos.dbf'))
+    with Open(Changed, 'wb') as OutFile:
+        OutFile.write(b'DBF')
+    os.utime(Changed, (Files[Changed][1] + 10, Files[Changed][1] + 10))
+    NewHash, NewFiles = PublishCache.ContentHash(MXD, Sources, Known=Files)
+    assert Read == [Changed]
+    assert NewHash != Hash and NewFiles[Changed][2] != Files[Changed][2]
+    # Only the size and time are compared, so a file changed in place without them changing is missed
+    Time = os.stat(Changed).st_mtime
+    with Open(Changed, 'wb') as OutFile:
+        OutFile.write(b'dbf')
+    os.utime(Changed, (Time, Time))
+    assert PublishCache.ContentHash(MXD, Sources, Known=NewFiles)[0] == NewHash
+
+
+def test_data_not_in_files_is_always_published(tmpdir):
+    MXD, Sources = MakeData(tmpdir)
+    StatePath = PublishCache.StatePathFor(MXD)
+    Sources.append('Database Connections\\City.sde\\City.DBO.Hydrants')
+    for Run in range(2):
+        Unchanged, Hash = Publish(StatePath, MXD, Sources)
+        assert Hash is None and not Unchanged
+    assert PublishCache.IsUnchanged({}, 'Photos', None) is False
+
+
+def test_unreadable_state(tmpdir):
+    StatePath = tmpdir.join('City.mxd.publish.json')
+    assert PublishCache.ReadState(str(StatePath)) == {}
+    StatePath.write('{"Photos": ')
+    assert PublishCache.ReadState(str(StatePath)) == {}
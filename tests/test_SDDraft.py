@@ -0,0 +1,113 @@
+### Description: Checks the streaming rewrite of the service definition draft
+### on a small draft laid out like the ones CreateMapSDDraft writes.
+
+import xml.etree.ElementTree as ElementTree
+import SDDraft
+
+# The second SVCExtension and Configuration hold an Info and a
+# ConfigurationProperties that are not the first ones and must be kept.
+# isCached, WebCapabilities and MapServer are broken up by character
+# references, which the parser reports as several character events.
+Draft = '''<?xml version="1.0" encoding="utf-8"?>
+<SVCManifest>
+  <Type>esriServiceDefinitionType_New</Type>
+  <State>esriSDState_Unpublished</State>
+  <Databases>
+    <SVCDatabase><Type>esriDatasetType_FeatureClass</Type></SVCDatabase>
+  </Databases>
+  <Configurations>
+    <SVCConfiguration>
+      <Definition>
+        <TypeName>Map&#83;erver</TypeName>
+        <ConfigurationProperties>
+          <PropertyArray>
+            <PropertySetProperty><Key>maxRecordCount</Key><Value>1000</Value></PropertySetProperty>
+            <PropertySetProperty><Key>is&#67;ached</Key><Value>true</Value></PropertySetProperty>
+          </PropertyArray>
+        </ConfigurationProperties>
+        <Extensions>
+          <SVCExtension>
+            <TypeName>FeatureServer</TypeName>
+            <Info>
+              <PropertyArray>
+                <PropertySetProperty><Key>WebCapabilities</Key><Value>Query,<![CDATA[Create]]>,Update</Value></PropertySetProperty>
+                <PropertySetProperty><Key>allowGeometryUpdates</Key><Value>true</Value></PropertySetProperty>
+              </PropertyArray>
+            </Info>
+          </SVCExtension>
+          <SVCExtension>
+            <TypeName>KmlServer</TypeName>
+            <Info>
+              <PropertyArray>
+                <PropertySetProperty><Key>WebCapabilities</Key><Value>SingleImage,SeparateImages</Value></PropertySetProperty>
+              </PropertyArray>
+            </Info>
+          </SVCExtension>
+        </Extensions>
+      </Definition>
+    </SVCConfiguration>
+    <SVCConfiguration>
+      <Definition>
+        <ConfigurationProperties>
+          <PropertyArray>
+            <PropertySetProperty><Key>isCached</Key><Value>true</Value></PropertySetProperty>
+          </PropertyArray>
+        </ConfigurationProperties>
+      </Definition>
+    </SVCConfiguration>
+  </Configurations>
+</SVCManifest>
+'''
+
+
+def Rewrite(tmpdir, Text=Draft, **Options):
+    InPath = tmpdir.join('Service.sddraft')
+    InPath.write_binary(Text.encode('utf-8'))
+    OutPath = tmpdir.join('Service.new.sddraft')
+    Counts = SDDraft.RewriteSDDraft(str(InPath), str(OutPath), **Options)
+    return Counts, ElementTree.parse(str(OutPath)).getroot()
+
+
+def Values(Root, Path):
+    # Value of every PropertySetProperty of the property arrays found at Path, by key
+    return [dict((Pair.findtext('Key'), Pair.findtext('Value')) for Pair in Array.iter('PropertySetProperty'))
+            for Array in Root.findall(Path)]
+
+
+def test_feature_service_edits(tmpdir):
+    Counts, Root = Rewrite(tmpdir)
+    assert Counts == {'Type': 1, 'State': 1, 'TypeName': 1, 'isCached': 1, 'WebCapabilities': 1}
+    assert Root.findtext('Type') == 'esriServiceDefinitionType_Replacement'
+    assert Root.findtext('State') == 'esriSDState_Published'
+    First, Second = Root.findall('Configurations/SVCConfiguration/Definition')
+    assert First.findtext('TypeName') == 'FeatureServer'
+    assert Values(First, 'ConfigurationProperties') == [{'maxRecordCount': '1000', 'isCached': 'false'}]
+    assert Values(First, 'Extensions/SVCExtension/Info') == [
+        {'WebCapabilities': SDDraft.DefaultCapabilities, 'allowGeometryUpdates': 'true'},
+        {'WebCapabilities': 'SingleImage,SeparateImages'}]
+    assert Values(Second, 'ConfigurationProperties') == [{'isCached': 'true'}]
+
+
+def test_elements_that_are_not_edited_are_kept(tmpdir):
+    Counts, Root = Rewrite(tmpdir)
+    Original = ElementTree.fromstring(Draft.encode('utf-8'))
+    Before = [(Element.tag, (Element.text or '').strip()) for Element in Original.iter()]
+    After = [(Element.tag, (Element.text or '').strip()) for Element in Root.iter()]
+    Changed = [(Old, New) for Old, New in zip(Before, After) if Old != New]
+    assert len(Before) == len(After)
+    # The Type of the database is not the manifest Type and stays as it was
+    assert ('Type', 'esriDatasetType_FeatureClass') in After
+    assert len(Changed) == sum(Counts.values())
+
+
+def test_capabilities_are_given(tmpdir):
+    Counts, Root = Rewrite(tmpdir, Capabilities='Query')
+    assert Values(Root, 'Configurations/SVCConfiguration/Definition/Extensions/SVCExtension/Info')[0][
+        'WebCapabilities'] == 'Query'
+
+
+def test_draft_without_the_elements(tmpdir):
+    Counts, Root = Rewrite(tmpdir, '<SVCManifest><Name>Photos</Name><Type/></SVCManifest>')
+    assert Counts == {'Type': 0, 'State': 0, 'TypeName': 0, 'isCached': 0, 'WebCapabilities': 0}
+    assert Root.findtext('Name') == 'Photos'
+    assert Root.findtext('Type') == ''
@@ -0,0 +1,124 @@
+### Description: Checks the grid spatial index against a brute force search.
+
+import time
+import numpy as np
+import pytest
+import SpatialIndex
+
+
+def BruteForcePoints(QX, QY, X, Y):
+    D2 = (QX[:, None] - X[None, :]) ** 2 + (QY[:, None] - Y[None, :]) ** 2
+    # argmin returns the first of equally close points, as the index does
+    Nearest = D2.argmin(axis=1)
+    return np.sqrt(D2[np.arange(len(QX)), Nearest]), Nearest
+
+
+def BruteForceSegments(QX, QY, X0, Y0, X1, Y1):
+    DX, DY = X1 - X0, Y1 - Y0
+    Length2 = DX ** 2 + DY ** 2
+    Along = ((QX[:, None] - X0) * DX + (QY[:, None] - Y0) * DY) / np.where(Length2 > 0, Length2, 1.0)
+    Along = np.clip(np.where(Length2 > 0, Along, 0.0), 0.0, 1.0)
+    D2 = (QX[:, None] - X0 - Along * DX) ** 2 + (QY[:, None] - Y0 - Along * DY) ** 2
+    Nearest = D2.argmin(axis=1)
+    return np.sqrt(D2[np.arange(len(QX)), Nearest]), Nearest
+
+
+def CityPoints(Count, Seed):
+    Random = np.random.RandomState(Seed)
+    return Random.uniform(550000, 560000, Count), Random.uniform(4180000, 4190000, Count)
+
+
+@pytest.mark.parametrize('Outlier', [False, True])
+def test_points_match_brute_force(Outlier):
+    X, Y = CityPoints(3000, 0)
+    if Outlier:
+        # A known point at null island, far from the rest
+        X[17], Y[17] = 0.0, 0.0
+    QX, QY = CityPoints(2000, 1)
+    QX[:3], QY[:3] = [1.0, -5e6, 560000.0], [1.0, 4e6, 4179000.0]
+    Distances, IDs = SpatialIndex.NearestIndex(X, Y).Query(QX, QY)
+    Expected, ExpectedIDs = BruteForcePoints(QX, QY, X, Y)
+    assert np.array_equal(IDs, ExpectedIDs)
+    assert np.allclose(Distances, Expected)
+
+
+def test_ties_pick_the_first_point():
+    X = np.array([0.0, 2.0, 0.0, 2.0, 1.0])
+    Y = np.array([0.0, 0.0, 2.0, 2.0, 5.0])
+    for Index in (SpatialIndex.GridIndex(X, Y, CellSize=0.5), SpatialIndex.PurePythonGridIndex(X, Y, CellSize=0.5)):
+        Distances, IDs = Index.Query([1.0, 1.0], [1.0, 0.0])
+        assert list(IDs) == [0, 0]
+
+
+def test_ids_are_returned():
+    X, Y = CityPoints(500, 2)
+    IDs = np.arange(500) * 10 + 7
+    QX, QY = CityPoints(100, 3)
+    Found = SpatialIndex.NearestIndex(X, Y, IDs).Query(QX, QY)[1]
+    assert np.array_equal(Found, IDs[BruteForcePoints(QX, QY, X, Y)[1]])
+
+
+def test_pure_python_matches_numpy():
+    X, Y = CityPoints(400, 4)
+    X[0], Y[0] = 0.0, 0.0
+    QX, QY = CityPoints(200, 5)
+    Distances, IDs = SpatialIndex.PurePythonGridIndex(X.tolist(), Y.tolist()).Query(QX.tolist(), QY.tolist())
+    Expected, ExpectedIDs = BruteForcePoints(QX, QY, X, Y)
+    assert list(IDs) == ExpectedIDs.tolist()
+    assert np.allclose(Distances, Expected)
+
+
+def test_degenerate_extents():
+    for X, Y in (([5.0] * 4, [5.0] * 4), ([1.0] * 5, [0.0, 1.0, 2.0, 3.0, 4.0])):
+        X, Y = np.array(X), np.array(Y)
+        Distances, IDs = SpatialIndex.NearestIndex(X, Y).Query([1.5, 7.0], [2.2, 5.0])
+        Expected, ExpectedIDs = BruteForcePoints(np.array([1.5, 7.0]), np.array([2.2, 5.0]), X, Y)
+        assert np.array_equal(IDs, ExpectedIDs)
+
+
+def test_non_finite_queries():
+    QX = [np.nan, 0.5, np.inf, 1.9]
+    QY = [0.5, 0.5, 0.5, np.nan]
+    Indexes = [SpatialIndex.NearestIndex([0, 1, 2], [0, 1, 2], [10, 11, 12]),
+               SpatialIndex.NearestSegmentIndex([0, 1], [0, 1], [1, 2], [1, 2], [10, 11]),
+               SpatialIndex.PurePythonGridIndex([0, 1, 2], [0, 1, 2], [10, 11, 12]),
+               SpatialIndex.PurePythonSegmentIndex([0, 1], [0, 1], [1, 2], [1, 2], [10, 11])]
+    for Index in Indexes:
+        Distances, IDs = Index.Query(QX, QY)
+        assert list(IDs) == [-1, 10, -1, -1]
+        assert np.isnan(Distances[0]) and np.isnan(Distances[2]) and np.isnan(Distances[3])
+        assert Distances[1] == pytest.approx(np.sqrt(0.5) if len(Index.IDs) == 3 else 0.0)
+    # Every query point is not finite
+    Distances, IDs = Indexes[0].Query([np.nan], [np.nan])
+    assert list(IDs) == [-1] and np.isnan(Distances[0])
+
+
+def test_outlier_does_not_collapse_the_grid():
+    X, Y = CityPoints(10000, 6)
+    X[0], Y[0] = 0.0, 0.0
+    Index = SpatialIndex.NearestIndex(X, Y)
+    QX, QY = CityPoints(20000, 7)
+    Start = time.time()
+    Index.Query(QX, QY)
+    # About a millisecond per thousand queries, a collapsed grid takes most of a second
+    assert (time.time() - Start) / 20 < 0.05
+    assert Index.NX * Index.NY <= SpatialIndex.MaxCellsPerItem * len(X)
+
+
+@pytest.mark.parametrize('Outlier', [False, True])
+def test_segments_match_brute_force(Outlier):
+    Random = np.random.RandomState(8)
+    X0, Y0 = CityPoints(800, 9)
+    Angle = Random.uniform(0, 2 * np.pi, 800)
+    Length = Random.exponential(80.0, 800)
+    X1, Y1 = X0 + Length * np.cos(Angle), Y0 + Length * np.sin(Angle)
+    X1[5], Y1[5] = X0[5], Y0[5]
+    if Outlier:
+        X0[3], Y0[3], X1[3], Y1[3] = 0.0, 0.0, 10.0, 10.0
+    QX, QY = CityPoints(1000, 10)
+    Expected, ExpectedIDs = BruteForceSegments(QX, QY, X0, Y0, X1, Y1)
+    for Index in (SpatialIndex.GridSegmentIndex(X0, Y0, X1, Y1),
+                  SpatialIndex.PurePythonSegmentIndex(X0.tolist(), Y0.tolist(), X1.tolist(), Y1.tolist())):
+        Distances, IDs = Index.Query(QX, QY)
+        assert np.array_equal(np.asarray(IDs), ExpectedIDs)
+        assert np.allclose(Distances, Expected)
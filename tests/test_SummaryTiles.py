@@ -0,0 +1,111 @@
+### Description: Checks that incremental updates of the summary tiles give
+### the same tiles as building them again from nothing.
+
+import json
+import os
+import numpy as np
+import pytest
+import SummaryTiles
+
+Fields = ['Score', 'Distance']
+
+
+def Photos(Count, Seed):
+    Random = np.random.RandomState(Seed)
+    Lon = Random.uniform(-122.52, -122.35, Count)
+    Lat = Random.uniform(37.70, 37.82, Count)
+    Values = np.column_stack([np.round(Random.uniform(0, 1, Count), 3), Random.exponential(20.0, Count)])
+    Values[Random.uniform(0, 1, Count) < 0.05, 1] = np.nan
+    return Lon, Lat, Values
+
+
+def Files(Folder):
+    Found = {}
+    for Root, Folders, Names in os.walk(Folder):
+        for Name in Names:
+            Path = os.path.join(Root, Name)
+            with open(Path) as InFile:
+                Found[os.path.relpath(Path, Folder)] = json.load(InFile)
+    return Found
+
+
+def Rebuilt(Folder, Lon, Lat, Values, **Options):
+    SummaryTiles.UpdateTiles(Folder, Lon, Lat, Fields[:Values.shape[1]], Values, **Options)
+    return Files(Folder)
+
+
+def test_incremental_matches_full_rebuild(tmp_path):
+    Incremental = str(tmp_path / 'Incremental')
+    Lon, Lat, Values = Photos(4000, 1)
+    SummaryTiles.UpdateTiles(Incremental, Lon, Lat, Fields, Values, 12, 15)
+    # New photos, photos removed, a value changed and a photo moved
+    NewLon, NewLat, NewValues = Photos(300, 2)
+    Keep = np.ones(len(Lon), dtype=bool)
+    Keep[::97] = False
+    Lon = np.concatenate([Lon[Keep], NewLon])
+    Lat = np.concatenate([Lat[Keep], NewLat])
+    Values = np.concatenate([Values[Keep], NewValues])
+    Values[10, 0] = 0.999
+    Lon[20] += 0.01
+    Counts = SummaryTiles.UpdateTiles(Incremental, Lon, Lat, Fields, Values, 12, 15)
+    assert Counts['Written'] > 0 and Counts['Unchanged'] > 0
+    assert Files(Incremental) == Rebuilt(str(tmp_path / 'Full'), Lon, Lat, Values, MinZoom=12, MaxZoom=15)
+
+
+def test_removed_tiles_and_order(tmp_path):
+    Incremental = str(tmp_path / 'Incremental')
+    Lon, Lat, Values = Photos(2000, 3)
+    SummaryTiles.UpdateTiles(Incremental, Lon, Lat, Fields, Values, 13, 14)
+    # Only the western half is left, read in another order
+    West = np.flatnonzero(Lon < -122.44)[::-1]
+    Counts = SummaryTiles.UpdateTiles(Incremental, Lon[West], Lat[West], Fields, Values[West], 13, 14)
+    assert Counts['Removed'] > 0
+    assert Files(Incremental) == Rebuilt(str(tmp_path / 'Full'), Lon[West], Lat[West], Values[West],
+                                         MinZoom=13, MaxZoom=14)
+
+
+def test_unchanged_run_writes_no_tiles(tmp_path):
+    Folder = str(tmp_path / 'Tiles')
+    Lon, Lat, Values = Photos(1000, 4)
+    SummaryTiles.UpdateTiles(Folder, Lon, Lat, Fields, Values, 12, 14)
+    Order = np.random.RandomState(0).permutation(len(Lon))
+    Counts = SummaryTiles.UpdateTiles(Folder, Lon[Order], Lat[Order], Fields, Values[Order], 12, 14)
+    assert Counts['Written'] == 0 and Counts['Removed'] == 0
+
+
+def test_schema_change_rebuilds(tmp_path):
+    Folder = str(tmp_path / 'Tiles')
+    Lon, Lat, Values = Photos(1000, 5)
+    SummaryTiles.UpdateTiles(Folder, Lon, Lat, Fields, Values, 11, 14)
+    SummaryTiles.UpdateTiles(Folder, Lon, Lat, Fields[:1], Values[:, :1], 12, 13)
+    assert Files(Folder) == Rebuilt(str(tmp_path / 'Full'), Lon, Lat, Values[:, :1], MinZoom=12, MaxZoom=13)
+    assert not os.path.exists(os.path.join(Folder, '11')) and not os.path.exists(os.path.join(Folder, '14'))
+
+
+def test_bins_summarise_every_photo(tmp_path):
+    Folder = str(tmp_path / 'Tiles')
+    Lon, Lat, Values = Photos(1500, 6)
+    SummaryTiles.UpdateTiles(Folder, Lon, Lat, Fields, Values, 10, 13)
+    Tiles = Files(Folder)
+    for Zoom in range(10, 14):
+        Bins = [Entry for Path, Tile in Tiles.items() if Path.startswith(str(Zoom) + os.sep) for Entry in Tile['Bins']]
+        assert sum(Entry[2] for Entry in Bins) == len(Lon)
+        assert max(Entry[4] for Entry in Bins) == SummaryTiles.Rounded(Values[:, 0].max())
+    assert Tiles[SummaryTiles.MetadataName]['Features'] == len(Lon)
+
+
+def test_photos_without_a_location_are_left_out(tmp_path):
+    Lon, Lat, Values = Photos(800, 7)
+    Expected = Rebuilt(str(tmp_path / 'Located'), Lon, Lat, Values, MinZoom=11, MaxZoom=14)
+    # Null shapes are read as NaN coordinates
+    Lon = np.insert(Lon, [0, 300, 800], [np.nan, 4.0, np.inf])
+    Lat = np.insert(Lat, [0, 300, 800], [50.0, np.nan, -np.inf])
+    Values = np.insert(Values, [0, 300, 800], 0.5, axis=0)
+    assert Rebuilt(str(tmp_path / 'Tiles'), Lon, Lat, Values, MinZoom=11, MaxZoom=14) == Expected
+
+
+def test_zoom_text():
+    assert SummaryTiles.ParseZooms('') == (SummaryTiles.DefaultMinZoom, SummaryTiles.DefaultMaxZoom)
+    assert SummaryTiles.ParseZooms('8, 12') == (8, 12)
+    with pytest.raises(ValueError):
+        SummaryTiles.ParseZooms('12 8')
@@ -0,0 +1,88 @@
+### Description: Checks the key join write-back on the SQLite and in-memory
+### table adapters.
+
+import sqlite3
+import pytest
+import WriteBack
+
+
+class CountingConnection(sqlite3.Connection):
+    '''
+    Connection that keeps the number of rows of every executemany call.
+    '''
+
+    def __init__(self, *Arguments, **Options):
+        sqlite3.Connection.__init__(self, *Arguments, **Options)
+        self.Batches = []
+
+    def executemany(self, Statement, Rows):
+        Rows = list(Rows)
+        self.Batches.append(len(Rows))
+        return sqlite3.Connection.executemany(self, Statement, Rows)
+
+
+Keys = ['k%d' % Number for Number in range(10)] + [None, 'k3']
+
+
+def SQLiteTable():
+    Connection = sqlite3.connect(':memory:', factory=CountingConnection)
+    Connection.execute('CREATE TABLE Photos (Key TEXT, Distance REAL, NearFID INTEGER)')
+    Connection.executemany('INSERT INTO Photos (Key, Distance, NearFID) VALUES (?, -1, -1)', [(Key,) for Key in Keys])
+    Connection.Batches = []
+    return WriteBack.SQLiteTable(Connection, 'Photos')
+
+
+def MemoryTable():
+    return WriteBack.MemoryTable([{'Key': Key, 'Distance': -1.0, 'NearFID': -1} for Key in Keys])
+
+
+def Contents(Table):
+    if isinstance(Table, WriteBack.SQLiteTable):
+        return Table.Connection.execute('SELECT Key, Distance, NearFID FROM Photos ORDER BY rowid').fetchall()
+    return [(Row['Key'], Row['Distance'], Row['NearFID']) for Row in Table.Rows]
+
+
+@pytest.mark.parametrize('MakeTable', [SQLiteTable, MemoryTable])
+def test_matched_rows_are_updated(MakeTable):
+    Table = MakeTable()
+    Lookup = {'k1': (1.5, 7), 'k3': (3.5, 8), 'missing': (9.9, 9), 'k9': (None, None), None: (4.0, 4)}
+    # k3 is in the table twice, the unknown key and the null key match nothing
+    assert WriteBack.UpdateByKey(Table, 'Key', ['Distance', 'NearFID'], Lookup) == 4
+    Expected = [(Key, -1.0, -1) for Key in Keys]
+    Expected[1] = ('k1', 1.5, 7)
+    Expected[3] = Expected[11] = ('k3', 3.5, 8)
+    Expected[9] = ('k9', None, None)
+    assert Contents(Table) == Expected
+
+
+@pytest.mark.parametrize('MakeTable', [SQLiteTable, MemoryTable])
+def test_nothing_to_write(MakeTable):
+    Table = MakeTable()
+    assert WriteBack.UpdateByKey(Table, 'Key', ['Distance', 'NearFID'], {}) == 0
+    assert WriteBack.UpdateByKey(Table, 'Key', ['Distance', 'NearFID'], {'missing': (1.0, 1)}) == 0
+    assert Contents(Table) == [(Key, -1.0, -1) for Key in Keys]
+
+
+@pytest.mark.parametrize('BatchSize,Batches', [(3, [3, 3, 3, 2]), (4, [4, 4, 3]), (11, [11]), (100, [11])])
+def test_batches(BatchSize, Batches):
+    Table = SQLiteTable()
+    Lookup = dict(('k%d' % Number, (float(Number), Number)) for Number in range(10))
+    assert WriteBack.UpdateByKey(Table, 'Key', ['Distance', 'NearFID'], Lookup, BatchSize) == 11
+    assert Table.Connection.Batches == Batches
+    assert [Row[1] for Row in Contents(Table)] == [float(Number) for Number in range(10)] + [-1.0, 3.0]
+
+
+def test_one_field_and_new_fields():
+    Table = SQLiteTable()
+    Table.AddFields([('Score', 'DOUBLE'), ('Distance', 'DOUBLE')])
+    assert WriteBack.UpdateByKey(Table, 'Key', ['Score'], {'k2': (0.25,)}) == 1
+    assert Table.Connection.execute('SELECT Score, Distance FROM Photos WHERE Key = ?', ('k2',)).fetchall() == \
+        [(0.25, -1.0)]
+    Memory = MemoryTable()
+    Memory.AddFields([('Score', 'DOUBLE')])
+    assert [Row['Score'] for Row in Memory.Rows] == [None] * len(Keys)
+
+
+def test_index_rows_last_row_wins():
+    Rows = [('a', 1, 10.0), ('b', 2, 20.0), ('a', 3, 30.0)]
+    assert WriteBack.IndexRows(Rows, 0, [2, 1]) == {'a': (30.0, 3), 'b': (20.0, 2)}